@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File    : batch.py
+@Desc    : run the ideas of a JSONL file without interaction
+
+Every input line is a JSON object with an `idea`, or a `title` and `body`, and an
+optional `id` or `request_id`. Ideas are spread over `processes` worker processes and
+each worker runs up to `concurrency` of them at a time, sharing one HTTP connection pool
+and the LLM response cache. One result line per idea is written to the output file.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import aiohttp
+import openai
+
+from common import dumps, loads
+import startup
+from mottoagents.system.config import CONFIG
+from mottoagents.system.cost_ledger import track_task_cost
+
+logger = logging.getLogger(__name__)
+
+
+def read_ideas(path: str) -> list[dict]:
+    ideas = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            item = loads(line)
+            idea = item.get("idea") or "\n\n".join(filter(None, [item.get("title"), item.get("body")]))
+            if not idea:
+                logger.warning(f"Skip line {line_no}: no idea, title or body")
+                continue
+            ideas.append({"id": str(item.get("id") or item.get("request_id") or line_no), "idea": idea})
+    return ideas
+
+
+async def run_idea(item: dict, semaphore: asyncio.Semaphore, investment: float, n_round: int,
+                   llm_api_key: str = None, serpapi_key: str = None, proxy: str = None) -> dict:
+    async with semaphore:
+        result = {"id": item["id"], "idea": item["idea"]}
+        start = time.time()
+        with track_task_cost() as cost:
+            try:
+                history = await startup.startup(item["idea"], investment, n_round, task_id=item["id"],
+                                                llm_api_key=llm_api_key, serpapi_key=serpapi_key, proxy=proxy)
+                result.update(status="finished", history=history)
+            except Exception as e:
+                logger.exception(f"Idea {item['id']} failed")
+                result.update(status="failed", error=f"{e}")
+        result.update(
+            cost=cost.total_cost,
+            prompt_tokens=cost.prompt_tokens,
+            cached_tokens=cost.cached_tokens,
+            completion_tokens=cost.completion_tokens,
+            elapsed=round(time.time() - start, 3),
+        )
+        logger.warning(f"Idea {item['id']} {result['status']} in {result['elapsed']}s, cost ${cost.total_cost:.3f}")
+        return result
+
+
+async def run_shard(items: list[dict], concurrency: int, investment: float, n_round: int,
+                    llm_api_key: str = None, serpapi_key: str = None, proxy: str = None) -> list[dict]:
+    semaphore = asyncio.Semaphore(concurrency)
+    # litellm runs streamed completions in the default executor, and openai keeps one
+    # HTTP session per thread, so a long-lived pool keeps connections alive between ideas
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=max(32, concurrency * 4)))
+    async with aiohttp.ClientSession() as session:
+        # non-streamed requests of this process share one aiohttp connection pool
+        openai.aiosession.set(session)
+        return await asyncio.gather(*[
+            run_idea(item, semaphore, investment, n_round, llm_api_key, serpapi_key, proxy) for item in items
+        ])
+
+
+def run_shard_wrapper(items: list[dict], concurrency: int, investment: float, n_round: int,
+                      llm_api_key: str = None, serpapi_key: str = None, proxy: str = None) -> list[dict]:
+    return asyncio.run(run_shard(items, concurrency, investment, n_round, llm_api_key, serpapi_key, proxy))
+
+
+def run_batch(input_path: str, output_path: str, concurrency: int = 4, processes: int = 1, investment: float = 3.0,
+              n_round: int = 10, llm_api_key: str = None, serpapi_key: str = None, proxy: str = None) -> int:
+    """Run every idea of `input_path` and write the results to `output_path`, returns the number of failures"""
+    ideas = read_ideas(input_path)
+    llm_api_key = llm_api_key or CONFIG.openai_api_key or ""
+    processes = max(1, min(processes, len(ideas)))
+    shards = [ideas[i::processes] for i in range(processes)]
+    logger.warning(f"Running {len(ideas)} ideas in {processes} processes x {concurrency} tasks")
+
+    failed = 0
+    with open(output_path, "w", encoding="utf-8") as out:
+        def write(results):
+            nonlocal failed
+            for result in results:
+                failed += result["status"] != "finished"
+                out.write(dumps(result) + "\n")
+            out.flush()
+
+        if processes == 1:
+            write(run_shard_wrapper(shards[0], concurrency, investment, n_round, llm_api_key, serpapi_key, proxy))
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                futures = [pool.submit(run_shard_wrapper, shard, concurrency, investment, n_round, llm_api_key, serpapi_key, proxy)
+                           for shard in shards]
+                for future in as_completed(futures):
+                    write(future.result())
+
+    logger.warning(f"Batch done: {len(ideas) - failed} finished, {failed} failed, results in {output_path}")
+    return failed
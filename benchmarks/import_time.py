@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File    : import_time.py
+@Desc    : guard the cold start of the CLI and the package against import regressions
+
+Runs each target with `python -X importtime`, reports the slowest imports and fails when
+the total import time exceeds its budget or a heavy dependency is imported eagerly.
+
+    python benchmarks/import_time.py --repeat 5
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# modules that must only be imported when they are first used
+HEAVY_MODULES = ["openai", "litellm", "tiktoken", "anthropic", "faiss", "langchain", "pandas"]
+
+# name, python arguments, budget in ms, modules that must not be imported
+TARGETS = [
+    ("main --help", ["main.py", "--help"], 300, HEAVY_MODULES + ["mottoagents", "websockets"]),
+    ("import mottoagents.roles", ["-c", "import mottoagents.roles"], 800, HEAVY_MODULES),
+]
+
+
+def import_times(args: list[str]) -> dict[str, tuple[int, int]]:
+    """Self and cumulative import time in microseconds of every module imported by `args`"""
+    proc = subprocess.run([sys.executable, "-X", "importtime", *args], cwd=PROJECT_ROOT, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} failed:\n{proc.stderr[-2000:]}")
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # drop the separator space, nested imports stay indented
+        times[name.rstrip()[1:]] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def total_ms(times: dict[str, tuple[int, int]]) -> float:
+    return sum(cumulative for name, (_, cumulative) in times.items() if not name.startswith(" ")) / 1000
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="import time benchmark")
+    parser.add_argument("--repeat", default=3, type=int, help="runs per target, the median is reported")
+    parser.add_argument("--top", default=10, type=int, help="slowest modules to print")
+    parser.add_argument("--scale", default=1.0, type=float, help="multiply every budget, for slow machines")
+    args = parser.parse_args()
+
+    failed = False
+    for name, target_args, budget_ms, forbidden in TARGETS:
+        # the first run compiles the bytecode and is not counted
+        import_times(target_args)
+        runs = [import_times(target_args) for _ in range(args.repeat)]
+        median_ms = statistics.median(total_ms(run) for run in runs)
+        budget_ms *= args.scale
+
+        print(f"== {name}: {median_ms:.1f} ms (budget {budget_ms:.0f} ms)")
+        slowest = sorted(runs[-1].items(), key=lambda item: item[1][0], reverse=True)[:args.top]
+        for module, (self_us, cumulative_us) in slowest:
+            print(f"   {self_us / 1000:8.1f} ms self {cumulative_us / 1000:8.1f} ms cumulative  {module.strip()}")
+
+        imported = {module.strip().split(".")[0] for module in runs[-1]}
+        eager = sorted(imported.intersection(forbidden))
+        if eager:
+            print(f"!! {name} imports {', '.join(eager)} eagerly")
+            failed = True
+        if median_ms > budget_ms:
+            print(f"!! {name} is over budget")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File    : orchestration.py
+@Desc    : end to end benchmark of the orchestration with a scripted LLM and search engine
+
+Runs `startup.startup` on a few scenarios where every LLM call and search returns a canned
+response after a fixed latency, so the numbers measure the framework and not the model:
+wall clock, time the event loop was blocked, CPU, peak RSS, LLM calls, prompt tokens and
+the prompt tokens a provider could read from its prefix cache.
+Each scenario runs in its own process, so peak RSS and the process wide singletons of one
+scenario don't leak into the next.
+
+    python benchmarks/orchestration.py --latency 0.2 --save baseline.json
+    python benchmarks/orchestration.py --compare baseline.json --tolerance 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+RESULT_MARKER = "BENCHMARK_RESULT "
+CHUNK_SIZE = 16  # characters of each streamed chunk
+CHARS_PER_TOKEN = 4  # prompt tokens are estimated, tiktoken would need its encoding files
+
+SEARCH_TOOL = "SearchAndSummarize"
+
+# name, idea, experts of each step with the steps it depends on, experts using the search tool,
+# rounds of suggestions before the Manager's checks answer `No Suggestions`
+SCENARIOS = {
+    "sequential": {
+        "idea": "Write a short report on the history of the bicycle",
+        "steps": [(["Historian"], []), (["Writer"], [1]), (["Language Expert"], [2])],
+        "search": [],
+        "suggestion_rounds": 0,
+    },
+    "parallel": {
+        "idea": "Compare the public transport of four European capitals",
+        "steps": [(["Researcher"], []), (["Researcher"], []), (["Analyst"], []), (["Analyst"], []),
+                  (["Language Expert"], [1, 2, 3, 4])],
+        "search": ["Researcher"],
+        "suggestion_rounds": 0,
+    },
+    "multi-expert": {
+        "idea": "Plan the launch of a new coffee shop",
+        "steps": [(["Researcher", "Marketer"], []), (["Marketer", "Analyst", "Designer"], [1]),
+                  (["Analyst", "Designer"], [1]), (["Language Expert"], [2, 3])],
+        "search": ["Researcher"],
+        "suggestion_rounds": 1,
+    },
+}
+
+
+class Stats:
+    def __init__(self):
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.prefix_hit_tokens = 0
+        self.completion_tokens = 0
+        self.searches = 0
+        self.loop_blocked = 0.0
+        self.max_loop_lag = 0.0
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class Script:
+    """Canned responses of a scenario, chosen by the prompt they answer"""
+
+    def __init__(self, scenario: dict):
+        self.scenario = scenario
+        self.role_checks = 0
+        self.plan_checks = 0
+
+    def experts(self) -> list[str]:
+        names = []
+        for experts, _ in self.scenario["steps"]:
+            names.extend(name for name in experts if name not in names)
+        return names
+
+    def create_roles(self) -> str:
+        roles = []
+        for name in self.experts():
+            tools = [SEARCH_TOOL] if name in self.scenario["search"] else []
+            roles.append(json.dumps({
+                "name": name,
+                "description": f"An expert {name.lower()}",
+                "tools": tools,
+                "suggestions": "Be concise.",
+                "prompt": f"You are an expert {name.lower()}, named {name}. Your goal is to help.",
+            }))
+        plan = []
+        for i, (experts, depends) in enumerate(self.scenario["steps"], start=1):
+            after = ", ".join(str(step) for step in depends) or "none"
+            plan.append(f"{i}. [{', '.join(experts)}]: work on part {i} of the task (depends on: {after})")
+        return (
+            "## Thought\nThe task needs these experts.\n\n"
+            f"## Question or Task:\n{self.scenario['idea']}\n\n"
+            "## Selected Roles List:\n```\n\n```\n\n"
+            f"## Created Roles List:\n```\n{','.join(roles)}\n```\n\n"
+            f"## Execution Plan:\n" + "\n".join(plan) + "\n\n"
+            "## RoleFeedback\nNone\n\n## PlanFeedback\nNone\n"
+        )
+
+    def check(self, kind: str) -> str:
+        count = self.role_checks if kind == "roles" else self.plan_checks
+        if count <= self.scenario["suggestion_rounds"]:
+            suggestion = f"Add more detail to the {kind}."
+        else:
+            suggestion = "No Suggestions"
+        return f"## Thought\nChecked the {kind}.\n\n## Suggestions\n{suggestion}\n"
+
+    def custom_action(self, prompt: str) -> str:
+        match = re.search(r"named ([^.]+)\.", prompt)
+        name = match.group(1) if match else "Expert"
+        completed = re.search(r"# Completed Steps and Responses([\s\S]*?)\n# Attention", prompt)
+        first_round = completed is None or not completed.group(1).strip()
+        if first_round and name in self.scenario["search"]:
+            action, action_input = SEARCH_TOOL, f"facts for {name.lower()}"
+        else:
+            action, action_input = "Final Output", f"The answer of {name}: " + "lorem ipsum " * 40
+        return (
+            f"## Thought\n{name} works on the step.\n\n## Task\nthe step\n\n"
+            f"## CurrentStep\nstep of {name}\n\n## Action\n{action}\n\n## ActionInput\n{action_input}\n"
+        )
+
+    def respond(self, instructions: str, prompt: str) -> str:
+        """Answer `prompt`, the last message, by what the messages before it ask for"""
+        instructions += prompt
+        if "You are a manager and an expert-level" in instructions:
+            return self.create_roles()
+        if "check if the created Expert Roles" in instructions:
+            self.role_checks += 1
+            return self.check("roles")
+        if "check if the Execution Plan" in instructions:
+            self.plan_checks += 1
+            return self.check("plans")
+        if "### Reference Information" in instructions:
+            return "A summary of the search results: " + "dolor sit amet " * 20
+        if "# Completed Steps and Responses" in instructions:
+            return self.custom_action(prompt)
+        return "Done."
+
+
+def make_llm_class(script: Script, stats: Stats, latency: float):
+    from mottoagents.system.provider.base_gpt_api import BaseGPTAPI
+    from mottoagents.system.provider.prefix_cache import get_prefix_tracker, stable_prefix
+    from mottoagents.system.utils.stream import close_stream, notify_stream
+
+    class ScriptedLLM(BaseGPTAPI):
+        """Answers every completion from the script after `latency` seconds"""
+
+        def __init__(self, proxy="", api_key=""):
+            self.model = "scripted"
+
+        def _answer(self, messages: list[dict]) -> str:
+            stats.llm_calls += 1
+            stats.prompt_tokens += sum(estimate_tokens(message["content"]) for message in messages)
+            # the prompt tokens a provider could serve from its prefix cache
+            prefix = stable_prefix(messages)
+            prefix_tokens = sum(estimate_tokens(message["content"]) for message in prefix)
+            if get_prefix_tracker().observe(self.model, prefix, prefix_tokens):
+                stats.prefix_hit_tokens += prefix_tokens
+            text = script.respond("\n".join(message["content"] for message in prefix), messages[-1]["content"])
+            stats.completion_tokens += estimate_tokens(text)
+            return text
+
+        def with_budget(self, ledger, max_tokens: int = None) -> "ScriptedLLM":
+            return ScriptedLLM()
+
+        def estimate_cost(self, messages: list[dict], model: str = None) -> float:
+            # the scripted model is free
+            return 0.0
+
+        @staticmethod
+        def _response(text: str) -> dict:
+            return {"choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}]}
+
+        async def acompletion_text(self, messages: list[dict], stream=False) -> str:
+            await asyncio.sleep(latency)
+            text = self._answer(messages)
+            if stream:
+                for i in range(0, len(text), CHUNK_SIZE):
+                    notify_stream(text[i:i + CHUNK_SIZE])
+                close_stream()
+            return text
+
+        def completion(self, messages: list[dict]) -> dict:
+            time.sleep(latency)
+            return self._response(self._answer(messages))
+
+        async def acompletion(self, messages: list[dict]) -> dict:
+            await asyncio.sleep(latency)
+            return self._response(self._answer(messages))
+
+    return ScriptedLLM
+
+
+def make_search_class(stats: Stats, latency: float):
+    from mottoagents.system.tools import SearchEngineType
+    from mottoagents.system.tools.search_engine import SearchEngine
+
+    class ScriptedSearch(SearchEngine):
+        """Custom engine returning canned results after `latency` seconds"""
+
+        def __init__(self, engine=None, run_func=None, serpapi_api_key=None, timeout=None):
+            super().__init__(SearchEngineType.CUSTOM_ENGINE, run_func=self._scripted, timeout=timeout)
+
+        async def _scripted(self, query: str) -> str:
+            stats.searches += 1
+            await asyncio.sleep(latency)
+            results = [{"title": f"Result {i} for {query}", "snippet": "consectetur adipiscing elit " * 8,
+                        "link": f"https://example.com/{i}"} for i in range(8)]
+            return f"{results[0]['snippet']}\n{results}"
+
+    return ScriptedSearch
+
+
+async def monitor_loop(stats: Stats, interval: float = 0.005):
+    """Add up how late the event loop wakes this task, i.e. how long it was blocked"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = loop.time() - start - interval
+        if lag > 0:
+            stats.loop_blocked += lag
+            stats.max_loop_lag = max(stats.max_loop_lag, lag)
+
+
+def run_child(name: str, latency: float, search_latency: float) -> dict:
+    """Run one scenario in this process"""
+    # the scripted engine is the only search engine, and nothing is served from a cache
+    os.environ.update(SERPAPI_API_KEY="benchmark", SEARCH_CACHE_TTL="0", LLM_CACHE="false")
+    sys.path.insert(0, str(PROJECT_ROOT))
+    os.chdir(PROJECT_ROOT)
+
+    from mottoagents.system.provider.openai_api import OpenAIGPTAPI
+    from startup import startup
+
+    stats = Stats()
+    script = Script(SCENARIOS[name])
+    llm_class = make_llm_class(script, stats, latency)
+    for module_name, module in list(sys.modules.items()):
+        if module_name.startswith("mottoagents") and getattr(module, "LLM", None) is OpenAIGPTAPI:
+            module.LLM = llm_class
+    from mottoagents.actions.action_bank import search_and_summarize
+    search_and_summarize.SearchEngine = make_search_class(stats, search_latency)
+
+    async def main():
+        monitor = asyncio.create_task(monitor_loop(stats))
+        try:
+            await startup(SCENARIOS[name]["idea"], investment=1e9, n_round=3)
+        finally:
+            monitor.cancel()
+
+    start, cpu_start = time.perf_counter(), time.process_time()
+    asyncio.run(main())
+    wall, cpu = time.perf_counter() - start, time.process_time() - cpu_start
+    # ru_maxrss is in KB on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource else None
+    return {
+        "wall_s": round(wall, 3),
+        "loop_blocked_s": round(stats.loop_blocked, 3),
+        "max_loop_lag_ms": round(stats.max_loop_lag * 1000, 1),
+        "cpu_s": round(cpu, 3),
+        "peak_rss_mb": round(peak_rss, 1) if peak_rss is not None else None,
+        "llm_calls": stats.llm_calls,
+        "prompt_tokens": stats.prompt_tokens,
+        "prefix_hit_tokens": stats.prefix_hit_tokens,
+        "completion_tokens": stats.completion_tokens,
+        "searches": stats.searches,
+    }
+
+
+def run_scenario(name: str, latency: float, search_latency: float) -> dict:
+    args = [sys.executable, __file__, "--child", name, "--latency", str(latency), "--search-latency", str(search_latency)]
+    proc = subprocess.run(args, cwd=PROJECT_ROOT, capture_output=True, text=True)
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    raise RuntimeError(f"scenario {name} failed:\n{proc.stderr[-2000:]}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="orchestration benchmark")
+    parser.add_argument("scenarios", nargs="*", help=f"scenarios to run, among {', '.join(SCENARIOS)}")
+    parser.add_argument("--latency", default=0.2, type=float, help="seconds of every LLM call")
+    parser.add_argument("--search-latency", default=0.1, type=float, help="seconds of every search")
+    parser.add_argument("--repeat", default=1, type=int, help="runs per scenario, the median is reported")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="fail when slower than the results of this JSON file")
+    parser.add_argument("--tolerance", default=0.2, type=float, help="slowdown allowed by --compare")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = run_child(args.child, args.latency, args.search_latency)
+        print(RESULT_MARKER + json.dumps(result))
+        return 0
+
+    names = args.scenarios or list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios {', '.join(unknown)}")
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else {}
+
+    failed = False
+    results = {}
+    for name in names:
+        runs = [run_scenario(name, args.latency, args.search_latency) for _ in range(args.repeat)]
+        result = {key: statistics.median(run[key] for run in runs) if runs[0][key] is not None else None
+                  for key in runs[0]}
+        results[name] = result
+        print(f"== {name}: " + ", ".join(f"{key} {value}" for key, value in result.items()))
+
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result["llm_calls"] != base["llm_calls"]:
+            print(f"!! {name} makes {result['llm_calls']} LLM calls instead of {base['llm_calls']}")
+            failed = True
+        for key in ("wall_s", "cpu_s", "loop_blocked_s"):
+            # below 50 ms the noise is larger than any regression
+            if result[key] > max(base[key] * (1 + args.tolerance), base[key] + 0.05):
+                print(f"!! {name} {key} {result[key]} is over {base[key]} + {args.tolerance:.0%}")
+                failed = True
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(results, indent=2))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
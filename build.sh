@@ -24,7 +24,6 @@ init_docker_files() {
     required_files=(
         "docker/nginx.conf"
         "docker/supervisord.conf"
-        "docker/uwsgi.ini"
         "requirements.prod.txt"
         "setup.py"
         "README.md"
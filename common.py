@@ -1,19 +1,107 @@
 from enum import Enum
 from datetime import datetime
 import json
+import struct
+import zlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# binary frame layout: 4-byte big-endian header length, JSON header, file payload
+FRAME_HEADER = struct.Struct(">I")
+# payloads smaller than this are sent uncompressed even if compression is requested
+COMPRESS_THRESHOLD = 4 * 1024
 
 class MessageType(Enum):
     RunTask = "run_task"
     Interrupt = "interrupt"
+    File = "file"
+    FileStart = "file_start"
+    FileChunk = "file_chunk"
+    FileEnd = "file_end"
+
+class FileEncoding(Enum):
+    Json = "json"        # file content inlined in the task message (legacy)
+    Binary = "binary"    # raw bytes in a separate binary frame
+    Deflate = "deflate"  # zlib-compressed binary frame
+    Zstd = "zstd"        # zstd-compressed binary frame, falls back to deflate
 
 def timestamp():
     return datetime.strftime(datetime.now(), "%Y-%m-%d_%H:%M:%S.%f")
 
 
+def dumps(obj) -> str:
+    """Serialize obj to a JSON string, using orjson when it is installed"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(obj)
+
+
+def loads(data):
+    """Deserialize a JSON string or bytes"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
 def format_message(action = None, data = None, msg = "ok"):
     message = {
         "action": action,
         "data": data,
         "msg": msg
     }
-    return json.dumps(message)
\ No newline at end of file
+    return dumps(message)
+
+
+def _compress(raw: bytes, encoding: str) -> tuple[bytes, str]:
+    if len(raw) < COMPRESS_THRESHOLD or encoding == FileEncoding.Binary.value:
+        return raw, "identity"
+    if encoding == FileEncoding.Zstd.value and zstandard is not None:
+        return zstandard.ZstdCompressor().compress(raw), FileEncoding.Zstd.value
+    return zlib.compress(raw), FileEncoding.Deflate.value
+
+
+def format_file_frame(task_id=None, file_name=None, file_type=None, file_data="", encoding=FileEncoding.Binary.value) -> bytes:
+    """Pack a generated file into a binary websocket frame.
+
+    The file bytes travel outside the JSON envelope, so they are never escaped
+    or copied into a second string, and large payloads can be compressed.
+    """
+    raw = file_data.encode("utf-8") if isinstance(file_data, str) else file_data
+    payload, content_encoding = _compress(raw, encoding)
+    header = dumps({
+        "action": MessageType.File.value,
+        "data": {
+            "task_id": task_id,
+            "file_name": file_name,
+            "file_type": file_type,
+            "encoding": content_encoding,
+            "size": len(raw),
+        },
+        "msg": "ok"
+    }).encode("utf-8")
+    return FRAME_HEADER.pack(len(header)) + header + payload
+
+
+def parse_file_frame(frame: bytes) -> tuple[dict, bytes]:
+    """Inverse of format_file_frame, returns the header and the decoded file bytes"""
+    (size,) = FRAME_HEADER.unpack_from(frame)
+    start = FRAME_HEADER.size
+    header = loads(frame[start:start + size])
+    payload = frame[start + size:]
+    encoding = header["data"]["encoding"]
+    if encoding == FileEncoding.Deflate.value:
+        payload = zlib.decompress(payload)
+    elif encoding == FileEncoding.Zstd.value:
+        payload = zstandard.ZstdDecompressor().decompress(payload)
+    return header, payload
\ No newline at end of file
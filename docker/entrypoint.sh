@@ -59,6 +59,12 @@ else
     content_server=$content_server'        proxy_set_header Connection "Upgrade";\n'
     content_server=$content_server'        proxy_http_version 1.1;\n'
     content_server=$content_server'    }\n'
+    content_server=$content_server'    location = /healthz {\n'
+    content_server=$content_server'        proxy_pass http://127.0.0.1:9000;\n'
+    content_server=$content_server'    }\n'
+    content_server=$content_server'    location = /metrics {\n'
+    content_server=$content_server'        proxy_pass http://127.0.0.1:9000;\n'
+    content_server=$content_server'    }\n'
     content_server=$content_server'}\n'
     # Save generated server /etc/nginx/conf.d/nginx.conf
     printf "$content_server" > /etc/nginx/conf.d/nginx.conf
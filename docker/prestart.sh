@@ -1,5 +0,0 @@
-#!/bin/sh
-
-cd /app/mottoagents
-python main.py --mode service &
-sleep 2
\ No newline at end of file
@@ -6,10 +6,6 @@ import sys
 import signal
 import re
 import logging
-from mottoagents.roles import Manager, ObserverAgents, ObserverPlans
-from mottoagents.explorer import Explorer
-import startup
-import ws_service
 
 logging.basicConfig(level=logging.WARNING, format='%(asctime)s | %(levelname)-8s | %(module)s:%(funcName)s:%(lineno)d - %(message)s')
 logger = logging.getLogger(__name__)
@@ -27,10 +23,14 @@ async def commanline(investment: float = 10.0, n_round: int = 3, proxy: str = No
     if idea is None:
         print("Give me a task idea:")
         idea = input().strip()
+    import startup
     await startup.startup(idea, investment, n_round, llm_api_key=llm_api_key, serpapi_key=serpapi_key, proxy=proxy)
 
-async def service(host: str = "localhost", port: int = 9000, proxy: str=None, llm_api_key: str=None, serpapi_key: str=None):
-    await ws_service.run_service(host=host, port=port, proxy=proxy, llm_api_key=llm_api_key, serpapi_key=serpapi_key)
+async def service(host: str = "localhost", port: int = 9000, proxy: str=None, llm_api_key: str=None, serpapi_key: str=None, **limits):
+    import ws_service
+    # limits that are not given on the command line come from the environment
+    limits = {k: v for k, v in limits.items() if v is not None}
+    await ws_service.run_service(host=host, port=port, proxy=proxy, llm_api_key=llm_api_key, serpapi_key=serpapi_key, **limits)
 
 
 if __name__ == "__main__":
@@ -38,13 +38,21 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description="mottoagents")
     ### TODO: set mode default to commandline
-    parser.add_argument("--mode", default="commandline", choices=["commandline", "service"], help="mode=commandline, service")
+    parser.add_argument("--mode", default="commandline", choices=["commandline", "service", "batch"], help="mode=commandline, service, batch")
     parser.add_argument("--host", default="127.0.0.1", help="websocket backend service host")
     parser.add_argument("--port", default=9000, type=int, help="websocket backend service port")
     parser.add_argument("--proxy", default=None, type=str, help="http proxy, example: http://127.0.0.1:8080")
     parser.add_argument("--llm_api_key", default=None, type=str, help="OpenAI API key")
     parser.add_argument("--serpapi_key", default=None, type=str, help="SerpAPI key")
     parser.add_argument("--idea", default=None, type=str, help="Give me a task idea")
+    parser.add_argument("--max_active_tasks", default=None, type=int, help="tasks run at the same time in service mode, default $MAX_ACTIVE_TASKS or 4")
+    parser.add_argument("--max_queued_tasks", default=None, type=int, help="tasks waiting for a worker before new ones are rejected, default $MAX_QUEUED_TASKS or 16")
+    parser.add_argument("--max_budget", default=None, type=float, help="LLM spend in dollars after which the service rejects tasks, default $SERVICE_MAX_BUDGET or 0 for unlimited")
+    parser.add_argument("--input", default=None, type=str, help="batch mode: JSONL file of ideas")
+    parser.add_argument("--output", default="batch_results.jsonl", type=str, help="batch mode: JSONL file of results")
+    parser.add_argument("--concurrency", default=4, type=int, help="batch mode: ideas run at the same time by each process")
+    parser.add_argument("--processes", default=1, type=int, help="batch mode: worker processes")
+    parser.add_argument("--investment", default=3.0, type=float, help="batch mode: budget in dollars of each idea")
     args = parser.parse_args()
 
     proxy = None
@@ -55,6 +63,14 @@ if __name__ == "__main__":
     if args.mode == "commandline":
         asyncio.run(commanline(proxy=proxy, llm_api_key=args.llm_api_key, serpapi_key=args.serpapi_key, idea=args.idea))
     elif args.mode == "service":
-        asyncio.run(service(host=args.host, port=args.port, proxy=proxy, llm_api_key=args.llm_api_key, serpapi_key=args.serpapi_key))
+        asyncio.run(service(host=args.host, port=args.port, proxy=proxy, llm_api_key=args.llm_api_key, serpapi_key=args.serpapi_key,
+                            max_active_tasks=args.max_active_tasks, max_queued_tasks=args.max_queued_tasks, max_budget=args.max_budget))
+    elif args.mode == "batch":
+        if not args.input:
+            parser.error("--input is required in batch mode")
+        import batch
+        failed = batch.run_batch(args.input, args.output, concurrency=args.concurrency, processes=args.processes, investment=args.investment,
+                                 llm_api_key=args.llm_api_key, serpapi_key=args.serpapi_key, proxy=proxy)
+        sys.exit(1 if failed else 0)
     else:
         logger.error(f"Invalid mode: {args.mode}")
\ No newline at end of file
@@ -8,12 +8,34 @@
 from abc import ABC
 from typing import Optional
 
-from tenacity import retry, stop_after_attempt, wait_fixed
+import functools
+
+from tenacity import retry, retry_if_not_exception_type, stop_after_attempt, wait_fixed
 
 from .action_output import ActionOutput
+from mottoagents.system.config import CONFIG
+from mottoagents.system.deadline import DeadlineExceeded
 from mottoagents.system.llm import LLM
-from mottoagents.system.utils.common import OutputParser
-from mottoagents.system.logs import logger
+from mottoagents.system.metrics import RETRIES
+from mottoagents.system.tracing import span
+from mottoagents.system.utils.block_parser import BlockParser, MalformedOutputError, SectionValidator
+from mottoagents.system.utils.common import NoMoneyException, OutputParser
+from mottoagents.system.utils.stream import stream_listener
+from mottoagents.system.logs import clip, logger
+
+
+def _traced_run(run):
+    @functools.wraps(run)
+    async def wrapper(self, *args, **kwargs):
+        with span("action.run", action=str(self), role=self.profile):
+            return await run(self, *args, **kwargs)
+    return wrapper
+
+
+FORMAT_HINT = '''
+
+# Format correction
+Your previous answer was stopped because {error}. Answer again and write exactly these sections, in this order, each starting with "## ": {sections}.'''
 
 class Action(ABC):
     def __init__(self, name: str = '', context=None, llm: LLM = None, serpapi_api_key=None):
@@ -29,11 +51,19 @@ class Action(ABC):
         self.serpapi_api_key = serpapi_api_key
         self.instruct_content = None
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # every action run is traced, whoever calls it
+        if "run" in cls.__dict__:
+            cls.run = _traced_run(cls.run)
+
     def set_prefix(self, prefix, profile, proxy, api_key, serpapi_api_key):
         """Set prefix for later usage"""
         self.prefix = prefix
         self.profile = profile
         self.llm = LLM(proxy, api_key)
+        # the model router picks a model for the closest class of this action with a route
+        self.llm.route_names = tuple(cls.__name__ for cls in type(self).__mro__)
         self.serpapi_api_key = serpapi_api_key
 
     def __str__(self):
@@ -44,24 +74,40 @@ class Action(ABC):
 
     async def _aask(self, prompt: str, system_msgs: Optional[list[str]] = None) -> str:
         """Append default prefix"""
-        if not system_msgs:
-            system_msgs = []
-        system_msgs.append(self.prefix)
-        return await self.llm.aask(prompt, system_msgs)
+        # static instructions first, then the role, so that calls share the longest prefix
+        system_msgs = [*(system_msgs or []), self.prefix]
+        # the response is parsed while it streams, the parsers find it ready
+        with stream_listener(BlockParser()):
+            return await self.llm.aask(prompt, system_msgs)
 
-    @retry(stop=stop_after_attempt(2), wait=wait_fixed(1))
+    # a malformed format was already retried with a hint, asking again the same way won't help
+    @retry(stop=stop_after_attempt(2), wait=wait_fixed(1),
+           retry=retry_if_not_exception_type((MalformedOutputError, NoMoneyException, DeadlineExceeded)),
+           before_sleep=lambda retry_state: RETRIES.inc(source="action"))
     async def _aask_v1(self, prompt: str, output_class_name: str,
                        output_data_mapping: dict,
                        system_msgs: Optional[list[str]] = None) -> ActionOutput:
         """Append default prefix"""
-        if not system_msgs:
-            system_msgs = []
-        system_msgs.append(self.prefix)
-        content = await self.llm.aask(prompt, system_msgs)
-        logger.debug(content)
+        system_msgs = [*(system_msgs or []), self.prefix]
+        hint = ""
+        for attempt in range(CONFIG.output_format_retries + 1):
+            # registered last, so the other listeners have seen a token when it aborts
+            validator = SectionValidator(output_data_mapping, CONFIG.output_section_max_chars,
+                                         CONFIG.output_preamble_max_chars)
+            try:
+                with stream_listener(validator):
+                    content = await self.llm.aask(prompt + hint, system_msgs)
+                break
+            except MalformedOutputError as e:
+                if attempt == CONFIG.output_format_retries:
+                    raise
+                logger.warning(f"{self} stopped a malformed response ({e}), retrying")
+                RETRIES.inc(source="format")
+                hint = FORMAT_HINT.format(error=e, sections=", ".join(output_data_mapping))
+        logger.opt(lazy=True).debug("{}", lambda: clip(content))
         output_class = ActionOutput.create_model_class(output_class_name, output_data_mapping)
         parsed_data = OutputParser.parse_data_with_mapping(content, output_data_mapping)
-        logger.debug(parsed_data)
+        logger.opt(lazy=True).debug("{}", lambda: clip(parsed_data))
         instruct_content = output_class(**parsed_data)
         return ActionOutput(content, instruct_content)
 
@@ -5,13 +5,18 @@
 @Author  : alexanderwu
 @From    : https://github.com/geekan/MetaGPT/blob/main/metagpt/actions/search_and_summarize.py
 """
-import time
+import asyncio
 
 from mottoagents.actions import Action
 from mottoagents.system.config import Config
-from mottoagents.system.logs import logger
+from mottoagents.system.logs import clip, logger
+from mottoagents.system.metrics import RETRIES
 from mottoagents.system.schema import Message
+from mottoagents.system.tools import SearchEngineType
+from mottoagents.system.tracing import add_to_span
+from mottoagents.system.utils.common import backoff_delay
 from mottoagents.system.tools.search_engine import SearchEngine
+from mottoagents.system.tools.search_fanout import FanoutSearch
 
 SEARCH_AND_SUMMARIZE_SYSTEM = """### Requirements
 1. Please summarize the latest dialogue based on the reference information (secondary) and dialogue history (primary). Do not include text that is irrelevant to the conversation.
@@ -105,7 +110,10 @@ class SearchAndSummarize(Action):
         self.config = Config()
         self.serpapi_api_key = serpapi_api_key
         self.engine = engine or self.config.search_engine
-        self.search_engine = SearchEngine(self.engine, run_func=search_func, serpapi_api_key=serpapi_api_key)
+        if self.config.search_fanout and engine is None:
+            self.search_engine = FanoutSearch.from_config(serpapi_api_key=serpapi_api_key, search_func=search_func)
+        else:
+            self.search_engine = SearchEngine(self.engine, run_func=search_func, serpapi_api_key=serpapi_api_key)
         self.result = ""
         super().__init__(name, context, llm, serpapi_api_key)
 
@@ -115,7 +123,10 @@ class SearchAndSummarize(Action):
         no_google = not self.config.google_api_key or 'YOUR_API_KEY' == self.config.google_api_key
         no_self_serpapi = self.serpapi_api_key is None
 
-        if no_serpapi and no_google and no_serper and no_self_serpapi:
+        engines = getattr(self.search_engine, "engines", [self.search_engine])
+        local = any(engine.engine == SearchEngineType.LOCAL for engine in engines)
+
+        if no_serpapi and no_google and no_serper and no_self_serpapi and not local:
             logger.warning('Configure one of SERPAPI_API_KEY, SERPER_API_KEY, GOOGLE_API_KEY to unlock full feature')
             return ""
         
@@ -126,12 +137,16 @@ class SearchAndSummarize(Action):
             try:
                 rsp = await self.search_engine.run(query)
                 break
-            except ValueError as e:
+            except (ValueError, asyncio.TimeoutError) as e:
                 try_count += 1
                 if try_count >= 3:
                     # Retry 3 times to fail
                     raise e
-                time.sleep(1)
+                logger.warning(f"Search failed ({e!r}), retry {try_count}")
+                RETRIES.inc(source="search")
+                delay = backoff_delay(try_count - 1)
+                add_to_span("retry_sleep_s", delay)
+                await asyncio.sleep(delay)
 
         self.result = rsp
         if not rsp:
@@ -149,6 +164,6 @@ class SearchAndSummarize(Action):
             QUERY=str(context[-1])
         )
         result = await self._aask(prompt, system_prompt)
-        logger.debug(prompt)
-        logger.debug(result)
+        logger.opt(lazy=True).debug("{}", lambda: clip(prompt))
+        logger.opt(lazy=True).debug("{}", lambda: clip(result))
         return result
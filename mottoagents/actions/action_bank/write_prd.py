@@ -9,7 +9,7 @@ from typing import List, Tuple
 
 from mottoagents.actions import Action, ActionOutput
 from mottoagents.actions.action_bank.search_and_summarize import SearchAndSummarize
-from mottoagents.system.logs import logger
+from mottoagents.system.logs import clip, logger
 
 PROMPT_TEMPLATE = """
 # Context
@@ -136,11 +136,11 @@ class WritePRD(Action):
         rsp = ""
         info = f"### Search Results\n{sas.result}\n\n### Search Summary\n{rsp}"
         if sas.result:
-            logger.info(sas.result)
-            logger.info(rsp)
+            logger.opt(lazy=True).info("{}", lambda: clip(sas.result))
+            logger.opt(lazy=True).info("{}", lambda: clip(rsp))
 
         prompt = PROMPT_TEMPLATE.format(requirements=requirements, search_information=info,
                                         format_example=FORMAT_EXAMPLE)
-        logger.debug(prompt)
+        logger.opt(lazy=True).debug("{}", lambda: clip(prompt))
         prd = await self._aask_v1(prompt, "prd", OUTPUT_MAPPING)
         return prd
\ No newline at end of file
@@ -5,22 +5,11 @@ from typing import List, Tuple
 from .action import Action
 import re
 
-PROMPT_TEMPLATE = '''
+# the same on every call, sent first so that providers can reuse it, see prefix_cache.py
+PROMPT_PREFIX = '''
 -----
 You are a ChatGPT executive observer expert skilled in identifying problem-solving plans and errors in the execution process. Your goal is to check if the Execution Plan following the requirements and give your improvement suggestions. You can refer to historical suggestions in the History section, but try not to repeat them.
 
-# Question or Task
-{context}
-
-# Role List
-{roles}
-
-# Execution Plan
-{plan}
-
-# History
-{history}
-
 # Steps
 You will check the Execution Plan by following these steps:
 1. You should first understand, analyze, and disassemble the human's problem.
@@ -30,6 +19,7 @@ You will check the Execution Plan by following these steps:
 2.3. The description of each step should provide sufficient details and explain how the steps are connected to each other.
 2.4. The description of each step must also include the expected output of that step and indicate what inputs are needed for the next step. The expected output of the current step and the required input for the next step must be consistent with each other. Sometimes, you may need to extract information or values before using them. Otherwise, the next step will lack the necessary input.
 2.5. The final step should ALWAYS be an independent step that says `Language Expert: Based on the previous steps, please respond to the user's original question: XXX`.
+2.6. Each step should end with `(depends on: ...)` naming exactly the earlier steps whose output it needs, or `none`. Steps that do not need each other's output should not depend on each other, so they can be carried out at the same time.
 3. Output a summary of the inspection results above. If you find any errors or have any suggestions, please state them clearly in the Suggestions section. If there are no errors or suggestions, you MUST write 'No Suggestions' in the Suggestions section.
 
 # Format example
@@ -40,6 +30,20 @@ Your final output should ALWAYS in the following format:
 1. All expert roles can only use the existing tools {tools} for any expert role. They are not allowed to use any other tools. You CANNOT create any new tool for any expert role.
 2. You can refer to historical suggestions and feedback in the History section but DO NOT repeat historical suggestions.
 3. DO NOT ask any questions to the user or human. The final step should always be an independent step that says `Language Expert: Based on the previous steps, please provide a helpful, relevant, accurate, and detailed response to the user's original question: XXX`.
+'''
+
+PROMPT_TEMPLATE = '''
+# Question or Task
+{context}
+
+# Role List
+{roles}
+
+# Execution Plan
+{plan}
+
+# History
+{history}
 -----
 '''
 
@@ -75,7 +79,7 @@ class CheckPlans(Action):
         roles += re.findall('## Created Roles List:([\s\S]*?)##', str(context))[-1]
         plan = re.findall('## Execution Plan:([\s\S]*?)##', str(context))[-1]
         context = re.findall('## Question or Task:([\s\S]*?)##', str(context))[-1]
-        prompt = PROMPT_TEMPLATE.format(context=context, plan=plan, roles=roles, format_example=FORMAT_EXAMPLE, history=history, tools=TOOLS)
-        rsp = await self._aask_v1(prompt, "task", OUTPUT_MAPPING)
+        prompt = PROMPT_TEMPLATE.format(context=context, plan=plan, roles=roles, history=history)
+        rsp = await self._aask_v1(prompt, "task", OUTPUT_MAPPING, system_msgs=[PROMPT_PREFIX.format(format_example=FORMAT_EXAMPLE, tools=TOOLS)])
         return rsp
 
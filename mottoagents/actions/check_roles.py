@@ -6,25 +6,14 @@ from .action import Action
 import re
 import json
 
-PROMPT_TEMPLATE = '''
+# the same on every call, sent first so that providers can reuse it, see prefix_cache.py
+PROMPT_PREFIX = '''
 -----
 You are a ChatGPT executive observer expert skilled in identifying problem-solving plans and errors in the execution process. Your goal is to check if the created Expert Roles following the requirements and give your improvement suggestions. You can refer to historical suggestions in the History section, but try not to repeat them.
 
-# Question or Task
-{question}
-
 # Existing Expert Roles
 {existing_roles}
 
-# Selected Roles List
-{selected_roles}
-
-# Created Roles List
-{created_roles}
-
-# History
-{history}
-
 # Steps
 You will check the selected roles list and created roles list by following these steps:
 1. You should first understand, analyze, and break down the human's problem/task.
@@ -64,6 +53,20 @@ Your final output should ALWAYS in the following format:
 3. You can refer to historical suggestions and feedback in the History section but DO NOT repeat historical suggestions.
 4. All expert roles can only use the existing tools ({tools}) for any expert role. They are not allowed to use any other tools. You CANNOT create any new tool for any expert role.
 5. DO NOT ask any questions to the user or human. The final step should always be an independent step that says `Language Expert: Based on the previous steps, please provide a helpful, relevant, accurate, and detailed response to the user's original question: XXX`.
+'''
+
+PROMPT_TEMPLATE = '''
+# Question or Task
+{question}
+
+# Selected Roles List
+{selected_roles}
+
+# Created Roles List
+{created_roles}
+
+# History
+{history}
 -----
 '''
 
@@ -102,8 +105,9 @@ class CheckRoles(Action):
         created_roles = re.findall('## Created Roles List:([\s\S]*?)##', str(context))[0]
         selected_roles = re.findall('## Selected Roles List:([\s\S]*?)##', str(context))[0]
         
-        prompt = PROMPT_TEMPLATE.format(question=question, history=history, existing_roles=ROLES_LIST, created_roles=created_roles, selected_roles=selected_roles, format_example=FORMAT_EXAMPLE, tools=TOOLS)
-        rsp = await self._aask_v1(prompt, "task", OUTPUT_MAPPING)
+        prefix = PROMPT_PREFIX.format(existing_roles=ROLES_LIST, format_example=FORMAT_EXAMPLE, tools=TOOLS)
+        prompt = PROMPT_TEMPLATE.format(question=question, history=history, created_roles=created_roles, selected_roles=selected_roles)
+        rsp = await self._aask_v1(prompt, "task", OUTPUT_MAPPING, system_msgs=[prefix])
 
         return rsp
 
@@ -6,19 +6,14 @@ from mottoagents.system.logs import logger
 from .action import Action
 from .action_bank.search_and_summarize import SearchAndSummarize, SEARCH_AND_SUMMARIZE_SYSTEM_EN_US
 
-PROMPT_TEMPLATE = '''
+# the same on every call, sent first so that providers can reuse it, see prefix_cache.py
+PROMPT_PREFIX = '''
 -----
 You are a manager and an expert-level ChatGPT prompt engineer with expertise in multiple fields. Your goal is to break down tasks by creating multiple LLM agents, assign them roles, analyze their dependencies, and provide a detailed execution plan. You should continuously improve the role list and plan based on the suggestions in the History section.
 
-# Question or Task
-{context}
-
 # Existing Expert Roles
 {existing_roles}
 
-# History
-{history}
-
 # Steps
 You will come up with solutions for any task or problem by following these steps:
 1. You should first understand, analyze, and break down the human's problem/task.
@@ -52,20 +47,29 @@ You will come up with solutions for any task or problem by following these steps
 4.4. The description of each step must also include the expected output of that step and indicate what inputs are needed for the next step. The expected output of the current step and the required input for the next step must be consistent with each other. Sometimes, you may need to extract information or values before using them. Otherwise, the next step will lack the necessary input.
 4.5. The final step should always be an independent step that says `Language Expert: Based on the previous steps, please provide a helpful, relevant, accurate, and detailed response to the user's original question: XXX`.
 4.6. Output the execution plan as a numbered list of steps. For each step, please begin with a list of the expert roles that are involved in performing it.
+4.7. End each step with the earlier steps whose output it needs, as `(depends on: 1, 2)`, or `(depends on: none)` if it needs none. Steps that do not depend on each other are carried out at the same time.
 
 # Format example
 Your final output should ALWAYS in the following format:
 {format_example}
 
-# Suggestions
-{suggestions}
-
 # Attention
 1. Please adhere to the requirements of the existing expert roles.
 2. You can only use the existing tools {tools} for any expert role. You are not allowed to use any other tools. You CANNOT create any new tool for any expert role.
 3. Use '##' to separate sections, not '#', and write '## <SECTION_NAME>' BEFORE the code and triple quotes.
 4. DO NOT forget to create the language expert role.
 5. DO NOT ask any questions to the user or human. The final step should always be an independent step that says `Language Expert: Based on the previous steps, please provide a helpful, relevant, accurate, and detailed response to the user's original question: XXX`.
+'''
+
+PROMPT_TEMPLATE = '''
+# Question or Task
+{context}
+
+# History
+{history}
+
+# Suggestions
+{suggestions}
 -----
 '''
 
@@ -93,9 +97,9 @@ JSON BLOB 3
 ```
 
 ## Execution Plan:
-1. [ROLE 1, ROLE2, ...]: STEP 1
-2. [ROLE 1, ROLE2, ...]: STEP 2
-2. [ROLE 1, ROLE2, ...]: STEP 3
+1. [ROLE 1, ROLE2, ...]: STEP 1 (depends on: none)
+2. [ROLE 1, ROLE2, ...]: STEP 2 (depends on: none)
+3. [ROLE 1, ROLE2, ...]: STEP 3 (depends on: 1, 2)
 
 ## RoleFeedback
 feedback on the historical Role suggestions
@@ -136,9 +140,10 @@ class CreateRoles(Action):
         # info = f"## Search Results\n{sas.result}\n\n## Search Summary\n{rsp}"
 
         from mottoagents.roles import ROLES_LIST
-        prompt = PROMPT_TEMPLATE.format(context=context, format_example=FORMAT_EXAMPLE, existing_roles=ROLES_LIST, tools=TOOLS, history=history, suggestions=suggestions)
-        
-        rsp = await self._aask_v1(prompt, "task", OUTPUT_MAPPING)
+        prefix = PROMPT_PREFIX.format(format_example=FORMAT_EXAMPLE, existing_roles=ROLES_LIST, tools=TOOLS)
+        prompt = PROMPT_TEMPLATE.format(context=context, history=history, suggestions=suggestions)
+
+        rsp = await self._aask_v1(prompt, "task", OUTPUT_MAPPING, system_msgs=[prefix])
         return rsp
 
 
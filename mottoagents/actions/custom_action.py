@@ -9,24 +9,17 @@ from mottoagents.actions.action import Action
 from .action.action_output import ActionOutput
 from .action_bank.search_and_summarize import SearchAndSummarize, SEARCH_AND_SUMMARIZE_SYSTEM_EN_US
 
+from mottoagents.system.config import CONFIG
 from mottoagents.system.logs import logger
 from mottoagents.system.utils.common import OutputParser
 from mottoagents.system.schema import Message
 from mottoagents.system.const import WORKSPACE_ROOT
 from mottoagents.system.utils.common import CodeParser
 
-PROMPT_TEMPLATE = '''
+# the same for every expert with the same tools, sent first so that providers can reuse it, see prefix_cache.py
+PROMPT_PREFIX = '''
 -----
-{role} Base on the following execution result of the previous agents and completed steps and their responses, complete the following tasks as best you can. 
-
-# Task {context}
-
-# Suggestions
-{suggestions}
-
-# Execution Result of Previous Agents {previous}
-
-# Completed Steps and Responses {completed_steps} 
+Base on the execution result of the previous agents and the completed steps and their responses given below, complete the task given below as best you can.
 
 You have access to the following tools:
 # Tools {tool}
@@ -45,16 +38,31 @@ file content
 >>>END
 ```
 4.2 If you have completed all the steps required to finish the task, use the action 'Final Output' and summarize the outputs of each step in the section 'ActionInput'. Provide a detailed and comprehensive final output that solves the task in this section. Please try to retain the information from each step in the section 'ActionInput'. The final output in this section should be helpful, relevant, accurate, and detailed.
-
+{search_hint}
 
 # Format example
 Your final output should ALWAYS in the following format:
 {format_example}
 
 # Attention
-1. The input task you must finish is {context}
-2. DO NOT ask any questions to the user or human.
-3. The final output MUST be helpful, relevant, accurate, and detailed.
+1. DO NOT ask any questions to the user or human.
+2. The final output MUST be helpful, relevant, accurate, and detailed.
+'''
+
+PROMPT_TEMPLATE = '''
+{role}
+
+# Task {context}
+
+# Suggestions
+{suggestions}
+
+# Execution Result of Previous Agents {previous}
+
+# Completed Steps and Responses {completed_steps} 
+
+# Attention
+The input task you must finish is {context}
 -----
 '''
 
@@ -94,6 +102,9 @@ FINAL_OUTPUT_MAPPING = {
     "Response": (str, ...),
 }
 
+SEARCH_FANOUT_HINT = '''4.3 If you use a search tool, you can put several search queries in the section 'ActionInput', one per line. They are searched at the same time and their results are merged.
+'''
+
 class CustomAction(Action):
 
     def __init__(self, name="CustomAction", context=None, llm=None, **kwargs):
@@ -126,17 +137,20 @@ class CustomAction(Action):
         # exit()
         
         tools = list(self.tool) + ['Print', 'Write File', 'Final Output']
+        prefix = PROMPT_PREFIX.format(
+            tool=str(tools),
+            format_example=FORMAT_EXAMPLE,
+            search_hint=SEARCH_FANOUT_HINT if CONFIG.search_fanout and self.tool else ''
+        )
         prompt = PROMPT_TEMPLATE.format(
             context=task_context,
             previous=previous_context,
             role=self.role_prompt,
-            tool=str(tools),
             suggestions=self.suggestions,
             completed_steps=completed_steps,
-            format_example=FORMAT_EXAMPLE
         )
 
-        rsp = await self._aask_v1(prompt, "task", OUTPUT_MAPPING)
+        rsp = await self._aask_v1(prompt, "task", OUTPUT_MAPPING, system_msgs=[prefix])
 
         if 'Write File' in rsp.instruct_content.Action:
             filename = re.findall('>>>(.*?)\n', str(rsp.instruct_content.ActionInput))[0]
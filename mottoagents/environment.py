@@ -11,7 +11,7 @@ import re
 import json
 import datetime
 import websockets
-from common import MessageType, format_message, timestamp
+from common import MessageType, FileEncoding, format_message, format_file_frame, timestamp
 from typing import Iterable
 
 from pydantic import BaseModel, Field
@@ -20,11 +20,18 @@ from .roles import Role
 from .actions import Requirement
 from .roles import CustomRole, ActionObserver, Group, ROLES_LIST, ROLES_MAPPING
 
+from .system.config import CONFIG
+from .system.cost_ledger import CostLedger, current_ledger
+from .system.logs import logger
 from .system.memory import Memory
 from .system.schema import Message
+from .system.utils.stream import FILE_END_MARKER, FILE_START_MARKER, FileStreamParser
+
+# a file written with the 'Write File' tool, as FileStreamParser reads it
+FILE_BLOCK = re.compile(rf"^[ \t`]*{FILE_START_MARKER}(?!>|END[ \t`]*$)([^\n]+?)[ \t`]*\n[\s\S]*?{FILE_END_MARKER}", re.MULTILINE)
 
 class Environment(BaseModel):
-    """Environment, carrying a group of roles, roles can publish messages to the environment, which can be observed by other roles""""
+    """Environment, carrying a group of roles, roles can publish messages to the environment, which can be observed by other roles"""
     roles: dict[str, Role] = Field(default_factory=dict)
     memory: Memory = Field(default_factory=Memory)
     history: str = Field(default='')
@@ -38,6 +45,11 @@ class Environment(BaseModel):
     llm_api_key: str = Field(default='')
     serpapi_key: str = Field(default='')
     alg_msg_queue: object = Field(default=None)
+    file_encoding: str = Field(default=FileEncoding.Json.value)
+    # file_end events of the files streamed to the client since the last message, by file name
+    streamed_files: dict = Field(default_factory=dict)
+    # usage and budget of this task, recorded in the ledger current when it starts too
+    ledger: CostLedger = Field(default_factory=lambda: CostLedger(CONFIG.max_budget, parent=current_ledger()))
 
     class Config:
         arbitrary_types_allowed = True
@@ -62,9 +74,8 @@ class Environment(BaseModel):
             if len(agent.keys()) > 0:
                 agents_args.append(agent)
 
-        print('---------------Agents---------------')
         for i, agent in enumerate(agents_args):
-            print('Role', i, agent)
+            logger.info(f"Role {i}: {agent}")
 
         return agents_args
     
@@ -72,9 +83,8 @@ class Environment(BaseModel):
         """Parse the generated plan"""
         plan_context = re.findall('## Execution Plan([\s\S]*?)##', str(context))[0]
         steps = [v.split("\n")[0] for v in re.split("\n\d+\. ", plan_context)[1:]]
-        print('---------------Steps---------------')
         for i, step in enumerate(steps):
-            print('Step', i, step)
+            logger.info(f"Step {i}: {step}")
         
         steps.insert(0, '')
         return steps
@@ -123,6 +133,42 @@ class Environment(BaseModel):
         # init_actions.append(Requirement)
         # self.add_role(ActionObserver(steps=plan, watch_actions=init_actions, init_actions=watch_actions, proxy=self.proxy, llm_api_key=self.llm_api_key))
 
+    def file_stream(self, role: str) -> FileStreamParser:
+        """Create a parser that sends the files written by a role to the client while they are generated"""
+        names = {}
+
+        def emit(action, data):
+            if action == MessageType.FileStart.value:
+                names[data["file_id"]] = data["file_name"]
+            elif action == MessageType.FileEnd.value:
+                file_name = names.pop(data["file_id"], None)
+                if file_name and data["complete"]:
+                    self.streamed_files[file_name] = data
+            data.update(task_id=self.task_id, role=role)
+            self.alg_msg_queue.put_nowait(format_message(action=action, data=data))
+
+        return FileStreamParser(emit)
+
+    def _reference_streamed_files(self, content: str) -> tuple[str, list[dict]]:
+        """`content` with the body of each file already streamed to the client replaced by a reference.
+
+        The references, the `file_end` events of the files, are returned too. Files streamed
+        since the last message are forgotten, those of a message still being generated are
+        then sent in full.
+        """
+        streamed, self.streamed_files = self.streamed_files, {}
+        references = []
+
+        def reference(match):
+            file_name = match.group(1).strip()
+            end = streamed.pop(file_name, None)
+            if end is None:
+                return match.group(0)
+            references.append({'file_name': file_name, **{key: end[key] for key in ('file_id', 'size', 'sha256')}})
+            return f"{FILE_START_MARKER}{file_name}\n[streamed as file {end['file_id']}]\n{FILE_END_MARKER}"
+
+        return FILE_BLOCK.sub(reference, content), references
+
     async def publish_message(self, message: Message):
         """Publish information to the current environment"""
         # self.message_queue.put(message)
@@ -134,30 +180,40 @@ class Environment(BaseModel):
             self.new_roles_args = self._parser_roles(message.content)
             self.new_roles = self.create_roles(self.steps, self.new_roles_args)
 
-        filename, file_content = None, None
+        filename, file_type, file_content = None, None, None
         if hasattr(message.instruct_content, 'Type') and 'FILE' in message.instruct_content.Type:
             filename = message.instruct_content.Key
             file_type = re.findall('```(.*?)\n', str(message.content))[0]
             file_content = re.findall(f'```{file_type}([\s\S]*?)```', str(message.content))[0]
-        
+        binary_file = file_content is not None and self.file_encoding != FileEncoding.Json.value
+
         if message.role and 'ActionObserver' != message.role:
             if hasattr(message.instruct_content, 'Response'):
                 content = message.instruct_content.Response
             else:
                 content = message.content
+            streamed = []
+            if isinstance(content, str):
+                content, streamed = self._reference_streamed_files(content)
 
-            msg = {   
+            msg = {
                 'timestamp': timestamp(),
                 'role': message.role,
                 'content': content,
                 'file': {
                     'file_type': filename,
-                    'file_data': file_content,
+                    # binary clients receive the content in the following file frame
+                    'file_data': None if binary_file else file_content,
                 }
             }
+            if streamed:
+                msg['file']['streamed'] = streamed
 
             if self.alg_msg_queue:
                 self.alg_msg_queue.put_nowait(format_message(action=MessageType.RunTask.value, data={'task_id': self.task_id, 'task_message':msg}))
+                if binary_file:
+                    self.alg_msg_queue.put_nowait(format_file_frame(task_id=self.task_id, file_name=filename, file_type=file_type,
+                                                                    file_data=file_content, encoding=self.file_encoding))
         
         if 'Agents Observer' in message.role:
             
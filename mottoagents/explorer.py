@@ -11,10 +11,9 @@ from .roles import Role
 from .actions import Requirement
 from .environment import Environment
 
-from .system.config import CONFIG
+from .system.cost_ledger import use_ledger
 from .system.logs import logger
 from .system.schema import Message
-from .system.utils.common import NoMoneyException
 
 
 class Explorer(BaseModel):
@@ -29,30 +28,34 @@ class Explorer(BaseModel):
 
     def invest(self, investment: float):
         self.investment = investment
-        CONFIG.max_budget = investment
+        # the budget of this task only, other tasks of the process have their own ledger
+        self.environment.ledger.budget = investment
         logger.info(f'Investment: ${investment}.')
 
     def _check_balance(self):
-        if CONFIG.total_cost > CONFIG.max_budget:
-            raise NoMoneyException(CONFIG.total_cost, f'Insufficient funds: {CONFIG.max_budget}')
+        self.environment.ledger.check_balance()
 
-    async def start_project(self, idea=None, llm_api_key=None, proxy=None, serpapi_key=None, task_id=None, alg_msg_queue=None):
+    async def start_project(self, idea=None, llm_api_key=None, proxy=None, serpapi_key=None, task_id=None, alg_msg_queue=None, file_encoding='json'):
         self.environment.llm_api_key = llm_api_key
         self.environment.proxy = proxy
         self.environment.task_id = task_id
         self.environment.alg_msg_queue = alg_msg_queue
         self.environment.serpapi_key = serpapi_key
-        
-        await self.environment.publish_message(Message(role="Question/Task", content=idea, cause_by=Requirement))
+        self.environment.file_encoding = file_encoding
+
+        with use_ledger(self.environment.ledger):
+            await self.environment.publish_message(Message(role="Question/Task", content=idea, cause_by=Requirement))
 
     def _save(self):
         logger.info(self.json())
 
     async def run(self, n_round=3):
-        while n_round > 0:
-            # self._save()
-            n_round -= 1
-            logger.debug(f"{n_round=}")
-            self._check_balance()
-            await self.environment.run()
+        with use_ledger(self.environment.ledger):
+            while n_round > 0:
+                # self._save()
+                n_round -= 1
+                logger.debug(f"{n_round=}")
+                self._check_balance()
+                await self.environment.run()
+        logger.info(f"Task usage: {self.environment.ledger.summary()}")
         return self.environment.history
@@ -43,9 +43,7 @@ class ActionObserver(Role):
             next_state = 0
 
             self.necessary_information = rsp.instruct_content.NecessaryInformation 
-            print('*******Next Steps********')
-            print(states_prompt)
-            print('************************')
+            logger.info(f"Next steps:\n{states_prompt}")
 
             next_state, min_idx = 0, 100
             for i, state in enumerate(self._actions):
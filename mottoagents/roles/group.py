@@ -1,16 +1,24 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import asyncio
 import re
 import time
+from typing import Optional
+
 from mottoagents.actions import Action, ActionOutput
+from mottoagents.actions.action_bank.search_and_summarize import SearchAndSummarize, SEARCH_AND_SUMMARIZE_SYSTEM_EN_US
 from mottoagents.roles import Role
+from mottoagents.system.config import CONFIG
+from mottoagents.system.cost_ledger import CostLedger, current_ledger
 from mottoagents.system.logs import logger
+from mottoagents.system.metrics import REGISTRY
 from mottoagents.system.schema import Message
+from mottoagents.system.tracing import span
+from mottoagents.system.utils.plan import ancestors, critical_path, step_dependencies, strip_dependencies
+from mottoagents.system.utils.stream import exclusive_stream
 from mottoagents.actions import NextAction, CustomAction, Requirement
 
-SLEEP_RATE = 30 # sleep between calls
-
 CONTENT_TEMPLATE ="""
 ## Previous Steps and Responses
 {previous}
@@ -19,16 +27,28 @@ CONTENT_TEMPLATE ="""
 {step}
 """
 
+SPECULATION_TEMPLATE = """
+### Search Results for the Current Step
+{results}
+
+### Search Summary for the Current Step
+{summary}
+"""
+
+PLAN_SPECULATIONS = REGISTRY.counter("mottoagents_plan_speculations_total",
+                                     "Speculative searches of plan steps by outcome", ["result"])
+
 class Group(Role):
     def __init__(self, roles, steps, watch_actions, name="Alex", profile="Group", goal="Effectively delivering information according to plan.", constraints="", **kwargs):
         self.steps = steps
         self.roles = roles
-        self.next_state = []
+        self.plan = []
+        self.dependencies = []
         self._watch_action = watch_actions[-1]
         super().__init__(name, profile, goal, constraints, **kwargs)
         init_actions = []
         for role in self.roles:
-            print('Add a new role:', role['name'])
+            logger.info(f"Add a new role: {role['name']}")
             class_name = role['name'].replace(' ', '_')+'_Action'
             action_object = type(class_name, (CustomAction,), {"role_prompt":role['prompt'], "suggestions":role['suggestions'], "tool":role['tools']})
             init_actions.append(action_object)
@@ -38,75 +58,200 @@ class Group(Role):
         self.necessary_information = ''
         self.next_action.set_prefix(self._get_prefix(), self.profile, self._proxy, self._llm_api_key, self._serpapi_api_key)
 
-    async def _think(self) -> None:        
-        if len(self.steps) > 1:
-            self.steps.pop(0)
-            states_prompt = ''
-            for i, step in enumerate(self.steps):
-                states_prompt += str(i+1) + ':' + step + '\n'
-            
-            # logger.info(f"{self._setting}: ready to {self.next_action}")
-            # task = self._rc.important_memory[0]
-            # content = [task, str(self._rc.env.new_roles_args), str(self._rc.important_memory), states_prompt]
-            # rsp = await self.next_action.run(content)
-
-            self.next_step = self.steps[0]
-            next_state = 0
-
-            # self.necessary_information = rsp.instruct_content.NecessaryInformation 
-            print('*******Next Steps********')
-            print(states_prompt)
-            print('************************')
-            self.next_state = []                
-            for i, state in enumerate(self._actions):
-                name = str(state).replace('_Action', '').replace('_', ' ')
-                if name in self.next_step.split(':')[0]:
-                    self.next_state.append(i)
-        else:
-            if len(self.steps) > 0:
-                self.steps.pop(0)
-            self.next_step = ''
-            self.next_role = ''
+    async def _think(self) -> None:
+        # the first entry of a new plan is a placeholder
+        self.plan = [strip_dependencies(step) for step in self.steps if step]
+        self.dependencies = step_dependencies([step for step in self.steps if step])
+
+        for i, (step, depends) in enumerate(zip(self.plan, self.dependencies)):
+            after = ', '.join(str(j + 1) for j in sorted(depends)) or '-'
+            logger.info(f"Step {i + 1}: {step} (after: {after})")
+        if self.plan:
+            logger.info(f"{self._setting}: {len(self.plan)} steps, critical path of {critical_path(self.dependencies)}")
+
+    def _step_states(self, step: str) -> list[int]:
+        """Actions of the experts assigned to a step"""
+        states = []
+        for i, state in enumerate(self._actions):
+            name = str(state).replace('_Action', '').replace('_', ' ')
+            if name in step.split(':')[0]:
+                states.append(i)
+        return states
+
+    async def _run_step(self, step: str, previous: str):
+        """Let the experts of a step work on it in rounds, until they all give a final output.
+
+        The experts of a round answer at the same time, each from the same completed steps,
+        and their substeps are added in the order of the experts, whichever answers first.
+        An expert that gave its final output sits the next rounds out, unless
+        PLAN_EXPERT_CONSENSUS asks for all the final outputs in the same round.
+        """
+        states = self._step_states(step)
+        if not states:
+            logger.warning(f"No expert is assigned to step: {step}")
+            return Message(content='', cause_by=self._watch_action)
 
-    async def _act(self) -> Message:
-        if self.next_step == '':
-            return Message(content='', role='')
-        
         completed_steps, num_steps = '', 5
-        message = CONTENT_TEMPLATE.format(previous=str(self._rc.important_memory), step=self.next_step)
-        # context = str(self._rc.important_memory) + addition
+        message = CONTENT_TEMPLATE.format(previous=previous, step=step)
+        finals = {}
+        responses = []
 
-        steps, consensus = 0, [0 for i in self.next_state]
-        while len(self.next_state) > sum(consensus) and steps < num_steps:
+        steps = 0
+        while len(finals) < len(states) and steps < num_steps:
 
             if steps > num_steps - 2:
                 completed_steps += '\n You should synthesize the responses of previous steps and provide the final feedback.'
-                
-            for i, state in enumerate(self.next_state):
-                self._set_state(state)
-                logger.info(f"{self._setting}: ready to {self._rc.todo}")
 
-                addition = f"\n### Completed Steps and Responses\n{completed_steps}\n###"
-                context = message + addition
-                response = await self._rc.todo.run(context)
+            if CONFIG.plan_expert_consensus:
+                finals.clear()
+            # steps run concurrently, so the actions are not made the role's todo
+            pending = [state for state in states if state not in finals]
+            actions = [self._actions[state] for state in pending]
+            for action in actions:
+                logger.info(f"{self._setting}: ready to {action}")
+
+            context = message + f"\n### Completed Steps and Responses\n{completed_steps}\n###"
+            with span("plan.round", role=self.profile, round=steps + 1, experts=", ".join(map(str, actions))):
+                responses = await asyncio.gather(*[self._run_expert(action, context) for action in actions])
 
+            for action, state, response in zip(actions, pending, responses):
                 if hasattr(response.instruct_content, 'Action'):
-                    completed_steps += f'>{self._rc.todo} Substep:\n' + response.instruct_content.Action + '\n>Subresponse:\n' + response.instruct_content.Response + '\n'
+                    completed_steps += f'>{action} Substep:\n' + response.instruct_content.Action + '\n>Subresponse:\n' + response.instruct_content.Response + '\n'
                 else:
-                    consensus[i] = 1
-                time.sleep(SLEEP_RATE)
+                    finals[state] = (action, response)
+            if CONFIG.plan_step_delay:
+                await asyncio.sleep(CONFIG.plan_step_delay)
 
             steps += 1
 
-        # response.content = completed_steps
-        requirement_type = type('Requirement_Group', (Requirement,), {})
-        if isinstance(response, ActionOutput):
-            msg = Message(content=response.content, instruct_content=response.instruct_content, cause_by=self._watch_action)
+        if finals:
+            response = self._merge_final_outputs([finals[state] for state in states if state in finals])
         else:
-            msg = Message(content=response, cause_by=self._watch_action)
-        # self._rc.memory.add(msg)
+            # out of rounds, the last expert has the last word
+            response = responses[-1]
+        return Message(content=response.content, instruct_content=response.instruct_content, cause_by=self._watch_action)
+
+    async def _run_expert(self, action: Action, context: str) -> ActionOutput:
+        """Run an expert's action with a file stream parser of its own.
+
+        The experts of a step and the steps of the plan answer concurrently, a shared
+        parser would mix their tokens and close each other's files.
+        """
+        with self._file_stream():
+            return await action.run(context)
+
+    @staticmethod
+    def _merge_final_outputs(finals: list[tuple[Action, ActionOutput]]) -> ActionOutput:
+        """One output of the final outputs of several experts, in the order of the experts"""
+        if len(finals) == 1:
+            return finals[0][1]
+
+        # every final output repeats the completed steps its expert saw, keep them once
+        last = finals[-1][1].instruct_content
+        prefix = last.Response.split('>>>> Final Output')[0]
+        outputs = ''
+        for action, output in finals:
+            match = re.search(r'>>>> Final Output\n([\s\S]*)\n>>>>', output.instruct_content.Response)
+            body = match.group(1) if match else output.instruct_content.Response
+            outputs += f'>>>> Final Output of {action}\n{body}\n>>>>\n'
+
+        instruct_content = type(last)(Step=last.Step, Response=prefix + outputs)
+        content = f"\n## Step\n{last.Step}\n## Response\n{prefix}{outputs}"
+        return ActionOutput(content, instruct_content)
+
+    def _speculative(self, i: int) -> bool:
+        """Whether step i waits for other steps and has an expert with a search tool"""
+        return bool(self.dependencies[i]) and any(self._actions[state].tool for state in self._step_states(self.plan[i]))
+
+    async def _speculate(self, i: int, dependencies: list[asyncio.Event], ledger: CostLedger) -> str:
+        """Search and summarize for step i once the steps it depends on have started.
+
+        The query is the step itself, the experts' own queries come from the results of the
+        steps before, so the summary only adds to the reference of the step. Its LLM calls
+        are charged to `ledger`, whose budget is shared by the speculations of the plan, and
+        answer in at most PLAN_SPECULATION_MAX_TOKENS. The search isn't paid for when the
+        budget left can't cover the summary, and nothing reaches the step's file stream.
+        """
+        await asyncio.gather(*[event.wait() for event in dependencies])
+        step = self.plan[i]
+        query = step.split(':', 1)[-1].strip()
+        expert = next(self._actions[state] for state in self._step_states(step) if self._actions[state].tool)
+        llm = expert.llm.with_budget(ledger, max_tokens=min(CONFIG.max_tokens_rsp, CONFIG.plan_speculation_max_tokens))
+        # without the search results yet, the least the summary can cost
+        estimate = llm.estimate_cost([{"role": "system", "content": SEARCH_AND_SUMMARIZE_SYSTEM_EN_US},
+                                       {"role": "user", "content": query}])
+        if ledger.remaining is not None and estimate > ledger.remaining:
+            logger.info(f"{self._setting}: no budget left to speculate for step {i + 1}")
+            return ''
+        sas = SearchAndSummarize(serpapi_api_key=expert.serpapi_api_key, llm=llm)
+        with span("plan.speculate", role=self.profile, step=i + 1), exclusive_stream():
+            summary = await sas.run(context=[Message(query)], system_text=SEARCH_AND_SUMMARIZE_SYSTEM_EN_US)
+        return SPECULATION_TEMPLATE.format(results=sas.result, summary=summary) if summary else ''
+
+    async def _commit_speculation(self, i: int, speculation: Optional[asyncio.Task]) -> str:
+        """The reference step i starts with, waiting for its speculation if it is still running"""
+        if speculation is None:
+            return ''
+        try:
+            reference = await speculation
+        except Exception as e:
+            # over budget or the search failed, the experts search by themselves
+            logger.warning(f"{self._setting}: discarded the speculative search of step {i + 1} ({e!r})")
+            reference = ''
+        PLAN_SPECULATIONS.inc(result="committed" if reference else "discarded")
+        return reference
+
+    async def _act(self) -> Message:
+        if not self.plan:
+            self.steps.clear()
+            return Message(content='', role='')
+
+        # every step sees the task and the results of the steps it depends on
+        task = list(self._rc.important_memory)
+        last = len(self.plan) - 1
+        results = {}
+        semaphore = asyncio.Semaphore(max(1, CONFIG.plan_workers))
+        # a step's speculation starts when the steps it depends on start, see _speculate
+        started = [asyncio.Event() for _ in self.plan]
+        speculations = {}
+        ledger = CostLedger(CONFIG.plan_speculation_budget, parent=current_ledger()) if CONFIG.plan_speculation else None
+
+        async def run(i):
+            if ledger is not None and self._speculative(i):
+                speculations[i] = asyncio.create_task(
+                    self._speculate(i, [started[j] for j in self.dependencies[i]], ledger))
+            await asyncio.gather(*[tasks[j] for j in self.dependencies[i]])
+            with span("plan.step", role=self.profile, step=i + 1, description=self.plan[i]) as current:
+                queued_at = time.perf_counter()
+                async with semaphore:
+                    started[i].set()
+                    if current is not None:
+                        current.set(queue_wait_s=time.perf_counter() - queued_at)
+                    previous = task + [results[j] for j in sorted(ancestors(self.dependencies, i))]
+                    reference = await self._commit_speculation(i, speculations.pop(i, None))
+                    results[i] = await self._run_step(self.plan[i], str(previous) + reference)
+            if i != last:
+                # the final step is published by run()
+                await self._publish_message(results[i])
+
+        tasks = []
+        for i in range(len(self.plan)):
+            # dependencies are earlier steps, their tasks exist already
+            tasks.append(asyncio.create_task(run(i)))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for t in tasks:
+                t.cancel()
+            # speculations of the steps that never started, e.g. after a failed step
+            for speculation in speculations.values():
+                if speculation.done() and not speculation.cancelled():
+                    speculation.exception()
+                speculation.cancel()
+                PLAN_SPECULATIONS.inc(result="discarded")
+            self.steps.clear()
 
-        return msg
+        return results[last]
 
     async def _observe(self) -> int:
         """Observe from the environment, obtain all important information, and add to memory"""
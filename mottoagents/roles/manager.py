@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import asyncio
 from typing import Iterable, Type
 
 from pydantic import BaseModel, Field
@@ -22,39 +23,40 @@ class Manager(Role):
         self._watch([Requirement])
 
     async def _act(self) -> Message:
-        logger.info(f"{self._setting}: ready to {self._rc.todo}")
+        create_roles, check_roles, check_plans = self._actions
+        logger.info(f"{self._setting}: ready to {create_roles}")
 
         roles_plan, suggestions_roles, suggestions_plan = '', '', ''
         suggestions, num_steps = '', 3
 
-        steps, consensus = 0, False
-        while not consensus and steps < num_steps:
-            self._set_state(0)
-            response = await self._rc.todo.run(self._rc.important_memory, history=roles_plan, suggestions=suggestions)
+        for step in range(num_steps):
+            response = await create_roles.run(self._rc.important_memory, history=roles_plan, suggestions=suggestions)
             roles_plan = str(response.instruct_content)
-            if 'No Suggestions' not in suggestions_roles or 'No Suggestions' not in suggestions_plan:
-                self._set_state(1)
-                history_roles = f"## Role Suggestions\n{suggestions_roles}\n\n## Feedback\n{response.instruct_content.RoleFeedback}"
-                _suggestions_roles = await self._rc.todo.run(response.content, history=history_roles)
-                suggestions_roles += _suggestions_roles.instruct_content.Suggestions
-
-                self._set_state(2)
-                history_plan = f"## Plan Suggestions\n{suggestions_roles}\n\n## Feedback\n{response.instruct_content.PlanFeedback}"
-                _suggestions_plan = await self._rc.todo.run(response.content, history=history_plan)
-                suggestions_plan += _suggestions_plan.instruct_content.Suggestions
-
-            suggestions = f"## Role Suggestions\n{_suggestions_roles.instruct_content.Suggestions}\n\n## Plan Suggestions\n{_suggestions_plan.instruct_content.Suggestions}"
-                
-            if 'No Suggestions' in suggestions_roles and 'No Suggestions' in suggestions_plan:
-                consensus = True
-
-            steps += 1
+            if step == num_steps - 1:
+                # suggestions on the last plan would never be used
+                break
+
+            # both checks only read the plan, so they run at the same time
+            history_roles = f"## Role Suggestions\n{suggestions_roles}\n\n## Feedback\n{response.instruct_content.RoleFeedback}"
+            history_plan = f"## Plan Suggestions\n{suggestions_plan}\n\n## Feedback\n{response.instruct_content.PlanFeedback}"
+            _suggestions_roles, _suggestions_plan = await asyncio.gather(
+                check_roles.run(response.content, history=history_roles),
+                check_plans.run(response.content, history=history_plan),
+            )
+            role_suggestions = _suggestions_roles.instruct_content.Suggestions
+            plan_suggestions = _suggestions_plan.instruct_content.Suggestions
+            suggestions_roles += role_suggestions
+            suggestions_plan += plan_suggestions
+
+            if 'No Suggestions' in role_suggestions and 'No Suggestions' in plan_suggestions:
+                break
+            suggestions = f"## Role Suggestions\n{role_suggestions}\n\n## Plan Suggestions\n{plan_suggestions}"
 
         if isinstance(response, ActionOutput):
             msg = Message(content=response.content, instruct_content=response.instruct_content,
-                          role=self.profile, cause_by=type(self._rc.todo))
+                          role=self.profile, cause_by=type(create_roles))
         else:
-            msg = Message(content=response, role=self.profile, cause_by=type(self._rc.todo))
+            msg = Message(content=response, role=self.profile, cause_by=type(create_roles))
         self._rc.memory.add(msg)
 
         return msg
\ No newline at end of file
@@ -15,10 +15,13 @@ from pydantic import BaseModel, Field
 # from mottoagents.environment import Environment
 from mottoagents.actions import Action, ActionOutput
 from mottoagents.system.config import CONFIG
+from mottoagents.system.cost_ledger import charge_role
 from mottoagents.system.llm import LLM
 from mottoagents.system.logs import logger
 from mottoagents.system.memory import Memory, LongTermMemory
 from mottoagents.system.schema import Message
+from mottoagents.system.tracing import span
+from mottoagents.system.utils.stream import exclusive_stream
 
 PREFIX_TEMPLATE = """You are a {profile}, named {name}, your goal is {goal}, and the constraint is {constraints}. """
 
@@ -165,6 +168,13 @@ class Role:
         """Set the environment where the role works. The role can speak to the environment and receive messages through observation"""
         self._rc.env = env
 
+    def _set_state(self, state):
+        """Update the current state and the action to do next"""
+        self._rc.state = state
+        logger.debug(self._actions)
+        self._rc.todo = self._actions[self._rc.state]
+
+    @property
     def profile(self) -> str:
         """Get role description (position)"""
         return self._setting.profile
@@ -173,6 +183,11 @@ class Role:
         """Get role prefix"""
         return f"{self._setting}: {self._rc.todo}"
 
+    def _file_stream(self):
+        """Stream the files written in the block to the client, with a parser of its own"""
+        env = self._rc.env
+        return exclusive_stream(*([env.file_stream(self._setting.profile)] if env and env.alg_msg_queue else []))
+
     async def _think(self) -> None:
         """Think about what to do, decide the next action"""
         if self._rc.todo is None:
@@ -210,9 +225,11 @@ class Role:
 
     async def _react(self) -> Message:
         """Think first, then act"""
-        await self._think()
+        with span("role.think", role=self.profile):
+            await self._think()
         logger.debug(f"{self._setting}: {self._rc.state=}, will do {self._rc.todo}")
-        return await self._act()
+        with span("role.act", role=self.profile, action=str(self._rc.todo)):
+            return await self._act()
 
     def recv(self, message: Message) -> None:
         """Add message to history."""
@@ -231,6 +248,10 @@ class Role:
 
     async def run(self, message=None):
         """Observe, and based on observation results, think and act"""
+        with span("role.run", role=self.profile, name=self._setting.name), charge_role(self.profile):
+            return await self._run(message)
+
+    async def _run(self, message=None):
         if message:
             if isinstance(message, str):
                 message = Message(message)
@@ -238,11 +259,18 @@ class Role:
                 self.recv(message)
             if isinstance(message, list):
                 self.recv(Message("\n".join(message)))
-        elif not await self._observe():
-            # If there's no new information, suspend and wait
-            logger.debug(f"{self._setting}: no news. waiting.")
-            return
-        rsp = await self._react()
+        else:
+            with span("role.observe", role=self.profile) as observe:
+                news = await self._observe()
+                if observe is not None:
+                    observe.set(news=news)
+            if not news:
+                # If there's no new information, suspend and wait
+                logger.debug(f"{self._setting}: no news. waiting.")
+                return
+        # stream written files to the client while the response is generated
+        with self._file_stream():
+            rsp = await self._react()
         # Publish the reply to the environment, wait for the next subscriber to process
         await self._publish_message(rsp)
         return rsp
@@ -10,53 +10,22 @@ based on system designs and requirements. The Engineer can work independently
 or collaborate with other roles to implement software solutions.
 """
 import asyncio
+import re
 import shutil
-from collections import OrderedDict
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 from mottoagents.system.const import WORKSPACE_ROOT
 from mottoagents.system.logs import logger
 from mottoagents.system.schema import Message
+from mottoagents.system.tracing import span
 from mottoagents.system.utils.common import CodeParser
+from mottoagents.system.utils.plan import ancestors
 from mottoagents.system.utils.special_tokens import MSG_SEP, FILENAME_CODE_SEP
 from mottoagents.roles import Role
 from mottoagents.actions import WriteCode, WriteCodeReview, WriteTasks, WriteDesign
 
-async def gather_ordered_k(coros, k) -> list:
-    """Execute coroutines with a maximum concurrency of k, preserving order.
-    
-    Args:
-        coros: List of coroutines to execute
-        k: Maximum number of concurrent coroutines
-        
-    Returns:
-        list: Results in the same order as input coroutines
-    """
-    tasks = OrderedDict()
-    results = [None] * len(coros)
-    done_queue = asyncio.Queue()
-
-    for i, coro in enumerate(coros):
-        if len(tasks) >= k:
-            done, _ = await asyncio.wait(tasks.keys(), return_when=asyncio.FIRST_COMPLETED)
-            for task in done:
-                index = tasks.pop(task)
-                await done_queue.put((index, task.result()))
-        task = asyncio.create_task(coro)
-        tasks[task] = i
-
-    if tasks:
-        done, _ = await asyncio.wait(tasks.keys())
-        for task in done:
-            index = tasks[task]
-            await done_queue.put((index, task.result()))
-
-    while not done_queue.empty():
-        index, result = await done_queue.get()
-        results[index] = result
-
-    return results
-
 
 class Engineer(Role):
     """Engineer role responsible for implementing code based on designs.
@@ -102,6 +71,52 @@ class Engineer(Role):
             return task_msg.instruct_content.dict().get("Task list")
         return CodeParser.parse_file_list(block="Task list", text=task_msg.content)
 
+    @classmethod
+    def parse_dependencies(cls, task_msg: Message, tasks: list[str]) -> list[set[int]]:
+        """Find the files each task depends on from the Logic Analysis of the tasks.
+
+        A file depends on the earlier files of the task list that its analysis names or
+        imports. The task list puts prerequisites first, so later files are ignored and the
+        dependencies never form a cycle. A file without analysis depends on every earlier file.
+
+        Args:
+            task_msg (Message): Message of WriteTasks
+            tasks (list[str]): Filenames of the task list
+
+        Returns:
+            list[set[int]]: Indexes of the earlier tasks each task depends on
+        """
+        analysis = []
+        if task_msg is not None:
+            try:
+                if task_msg.instruct_content:
+                    analysis = task_msg.instruct_content.dict().get("Logic Analysis") or []
+                else:
+                    analysis = CodeParser.parse_file_list(block="Logic Analysis", text=task_msg.content)
+            except Exception as e:
+                logger.warning(f"No Logic Analysis in the tasks, files are written in order: {e!r}")
+        descriptions = {}
+        for entry in analysis:
+            if isinstance(entry, (list, tuple)) and len(entry) >= 2:
+                descriptions.setdefault(str(entry[0]).strip(), " ".join(str(item) for item in entry[1:]))
+
+        patterns = []
+        for task in tasks:
+            path = Path(task.strip())
+            # the filename, or an import of its module
+            patterns.append(re.compile(
+                rf"(?<![\w.]){re.escape(path.name)}(?!\w)|\b(?:from|import)\s+[\w.]*\b{re.escape(path.stem)}\b"
+            ))
+
+        dependencies = []
+        for i, task in enumerate(tasks):
+            description = descriptions.get(task.strip())
+            if description is None:
+                dependencies.append(set(range(i)))
+            else:
+                dependencies.append({j for j in range(i) if patterns[j].search(description)})
+        return dependencies
+
     @classmethod
     def parse_code(cls, code_text: str) -> str:
         """Parse code from text.
@@ -164,105 +179,81 @@ class Engineer(Role):
         if message in self._rc.important_memory:
             self.todos = self.parse_tasks(message)
 
-    async def _act_mp(self) -> Message:
-        # self.recreate_workspace()
-        todo_coros = []
-        for todo in self.todos:
-            todo_coro = WriteCode(llm=self._llm).run(
-                context=self._rc.memory.get_by_actions([WriteTasks, WriteDesign]),
-                filename=todo
-            )
-            todo_coros.append(todo_coro)
+    async def _write_todo(self, todo: str, context: str) -> tuple[str, Path]:
+        code = await WriteCode(llm=self._llm).run(context=context, filename=todo)
+        return code, self.write_file(todo, code)
 
-        rsps = await gather_ordered_k(todo_coros, self.n_borg)
-        for todo, code_rsp in zip(self.todos, rsps):
-            _ = self.parse_code(code_rsp)
-            logger.info(todo)
-            logger.info(code_rsp)
-            # self.write_file(todo, code)
-            msg = Message(content=code_rsp, role=self.profile, cause_by=type(self._rc.todo))
-            self._rc.memory.add(msg)
-            del self.todos[0]
+    async def _review_todo(self, todo: str, context: str, code: str) -> tuple[str, Path]:
+        try:
+            code = await WriteCodeReview(llm=self._llm).run(context=context, code=code, filename=todo)
+        except Exception as e:
+            logger.error(f"code review of {todo} failed: {e!r}")
+        return code, self.write_file(todo, code)
 
-        logger.info(f'Done {self.get_workspace()} generating.')
-        msg = Message(content="all done.", role=self.profile, cause_by=type(self._rc.todo))
-        return msg
+    @asynccontextmanager
+    async def _slot(self, span_name: str, todo: str):
+        """Trace `span_name` for `todo` while it waits for and then holds one of the `n_borg` workers"""
+        with span(span_name, role=self.profile, filename=todo) as current:
+            queued_at = time.perf_counter()
+            async with self._workers:
+                if current is not None:
+                    current.set(queue_wait_s=time.perf_counter() - queued_at)
+                yield
 
-    async def _act_sp(self) -> Message:
-        code_msg_all = [] # gather all code info, will pass to qa_engineer for tests later
-        for todo in self.todos:
-            code = await WriteCode(llm=self._llm).run(
-                context=self._rc.history,
-                filename=todo
-            )
-            # logger.info(todo)
-            # logger.info(code_rsp)
-            # code = self.parse_code(code_rsp)
-            file_path = self.write_file(todo, code)
-            msg = Message(content=code, role=self.profile, cause_by=type(self._rc.todo))
-            self._rc.memory.add(msg)
+    async def _act_mp(self) -> Message:
+        """Write the files of the task list, up to `n_borg` at a time.
 
-            code_msg = todo + FILENAME_CODE_SEP + str(file_path)
-            code_msg_all.append(code_msg)
+        A file starts as soon as the files it depends on are written and sees their code,
+        so independent files are written at the same time. Its review runs while the files
+        depending on it are being written, they see the code before the review.
+        """
+        todos = list(self.todos)
+        task_msgs = self._rc.memory.get_by_action(WriteTasks)
+        dependencies = self.parse_dependencies(task_msgs[-1] if task_msgs else None, todos)
+        # Select essential information from history to reduce prompt length: the design and the tasks
+        base_context = [m.content for m in self._rc.memory.get_by_actions([WriteDesign, WriteTasks])]
+        self._workers = asyncio.Semaphore(max(1, self.n_borg))
+        written = {}
 
-        logger.info(f'Done {self.get_workspace()} generating.')
-        msg = Message(
-            content=MSG_SEP.join(code_msg_all),
-            role=self.profile,
-            cause_by=type(self._rc.todo),
-            send_to="ActionObserver"
-        )
-        return msg
+        async def write(i):
+            await asyncio.gather(*[writes[j] for j in dependencies[i]])
+            context = base_context + [written[j] for j in sorted(ancestors(dependencies, i))]
+            async with self._slot("engineer.write", todos[i]):
+                code, file_path = await self._write_todo(todos[i], "\n".join(context))
+            written[i] = code
+            return code, file_path, "\n".join(context)
+
+        async def review(i):
+            code, file_path, context = await writes[i]
+            if not self.use_code_review:
+                return code, file_path
+            async with self._slot("engineer.review", todos[i]):
+                return await self._review_todo(todos[i], context, code)
 
-    async def _act_sp_precision(self) -> Message:
-        code_msg_all = [] # gather all code info, will pass to qa_engineer for tests later
-        for todo in self.todos:
-            """
-            # Select essential information from history to reduce prompt length (manually summarized experience)
-            1. All Architect information
-            2. All ProjectManager information
-            3. Do we need other code (currently yes)?
-            TODO: The goal is no. After clear task breakdown, based on design thinking, we should be able to write individual files clearly without other code. If not, it indicates we need clearer definitions. This is key to writing longer code.
-            """
-            context = []
-            msg = self._rc.memory.get_by_actions([WriteDesign, WriteTasks, WriteCode])
-            for m in msg:
-                context.append(m.content)
-            context_str = "\n".join(context)
-            # Write code
-            code = await WriteCode(llm=self._llm).run(
-                context=context_str,
-                filename=todo
-            )
-            # code review
-            if self.use_code_review:
-                try:
-                    rewrite_code = await WriteCodeReview(llm=self._llm).run(
-                        context=context_str,
-                        code=code,
-                        filename=todo
-                    )
-                    code = rewrite_code
-                except Exception as e:
-                    logger.error("code review failed!", e)
-                    pass
-            file_path = self.write_file(todo, code)
-            msg = Message(content=code, role=self.profile, cause_by=WriteCode)
-            self._rc.memory.add(msg)
+        # dependencies are earlier files, their tasks exist already
+        writes = []
+        for i in range(len(todos)):
+            writes.append(asyncio.create_task(write(i)))
+        reviews = [asyncio.create_task(review(i)) for i in range(len(todos))]
+        try:
+            results = await asyncio.gather(*reviews)
+        finally:
+            for t in writes + reviews:
+                t.cancel()
 
-            code_msg = todo + FILENAME_CODE_SEP + str(file_path)
-            code_msg_all.append(code_msg)
+        code_msg_all = []  # gather all code info, will pass to qa_engineer for tests later
+        for todo, (code, file_path) in zip(todos, results):
+            self._rc.memory.add(Message(content=code, role=self.profile, cause_by=WriteCode))
+            code_msg_all.append(todo + FILENAME_CODE_SEP + str(file_path))
 
         logger.info(f'Done {self.get_workspace()} generating.')
         msg = Message(
             content=MSG_SEP.join(code_msg_all),
             role=self.profile,
-            cause_by=type(self._rc.todo),
+            cause_by=WriteCode,
             send_to="ActionObserver"
         )
         return msg
 
     async def _act(self) -> Message:
-        if self.use_code_review:
-            return await self._act_sp_precision()
-        return await self._act_sp()
\ No newline at end of file
+        return await self._act_mp()
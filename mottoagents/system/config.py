@@ -8,12 +8,11 @@ It handles loading configuration from YAML files and environment variables,
 and provides access to various system settings like API keys and service endpoints.
 """
 import os
-import openai
 
 import yaml
 
 from .const import PROJECT_ROOT
-from .logs import logger
+from .logs import define_log_level, logger
 from .utils.singleton import Singleton
 from .tools import SearchEngineType, WebBrowserEngineType
 
@@ -55,9 +54,59 @@ class Config(metaclass=Singleton):
         google_api_key (str): Google API key
         google_cse_id (str): Google Custom Search Engine ID
         search_engine (SearchEngineType): Default search engine to use
+        search_cache_ttl (float): Seconds search results are cached, 0 disables the cache
+        search_cache_size (int): Entries kept by the in-memory search cache
+        search_cache_dir (str): Directory of a search cache shared between processes
+        search_timeout (float): Seconds a search may take before it is abandoned
+        search_timeouts (dict): Per engine overrides of search_timeout
+        search_workers (int): Threads running blocking search clients
+        search_fanout (bool): Search every line of a tool input on several engines at once
+        search_fanout_engines (list): Engines of the fan-out search, defaults to search_engine
+        search_fanout_results (int): Merged results kept by the fan-out search
+        local_search_dir (str): Documents searched by the local search engine
+        local_search_index (str): File the local search index is saved to
+        local_search_rerank (bool): Rerank local search results with FAISS embeddings
+        local_search_refresh (float): Seconds between two scans of local_search_dir
         web_browser_engine (WebBrowserEngineType): Web browser engine type
         long_term_memory (bool): Whether to enable long-term memory
-        max_budget (float): Maximum budget for API calls
+        max_budget (float): Default budget of a task in dollars, see Explorer.invest
+        llm_cache (bool): Whether to cache LLM responses
+        llm_cache_size (int): Entries kept by the in-memory response cache
+        llm_cache_dir (str): Directory of a response cache shared between processes
+        plan_workers (int): Plan steps carried out at the same time
+        plan_step_delay (float): Seconds to wait after each round of expert responses of a plan step
+        plan_expert_consensus (bool): Experts of a step keep working until they all give a final output in the same round
+        plan_speculation (bool): Search for a step with a search tool while the steps it depends on run
+        plan_speculation_budget (float): Dollars the speculative work of a plan may spend, 0 for no limit
+        plan_speculation_max_tokens (int): Maximum tokens of a speculative summary
+        output_format_retries (int): Immediate retries of a response aborted for its format
+        output_section_max_chars (int): Longest section of a structured response, 0 for no limit
+        output_preamble_max_chars (int): Longest text before its first section, 0 for no limit
+        tracing (bool): Whether to trace tasks, roles, actions, LLM calls and searches
+        trace_file (str): File the spans are appended to, relative to the project root
+        loop_monitor (bool): Whether to measure the event loop lag and sample the stacks that block it
+        loop_stall_threshold (float): Seconds a callback may block the event loop before its stack is sampled
+        log_level (str): Level of the console log
+        log_file_level (str): Level of logs/log.txt
+        log_json (bool): Whether the log file holds JSON records
+        log_rotation (str): Size, e.g. "20 MB", or interval after which the log file is rotated
+        log_retention (int): Rotated log files to keep
+        log_module_levels (str): Levels of some modules, e.g. "mottoagents.roles=DEBUG,mottoagents.system=WARNING"
+        log_max_chars (int): Longest logged message, 0 for no limit
+        model_routes (dict): Models of each action class name in order of preference, see model_router.py
+        model_costs (dict): Dollars per 1k prompt and completion tokens of models missing from TOKEN_COSTS
+        router_latency_slo (float): Average latency over which a routed model is tried last, 0 for no limit
+        router_cooldown (float): Seconds a routed model is skipped after a failure
+        task_timeout (float): Seconds a task may run, its LLM calls and retries stop at this deadline, 0 for no limit
+        llm_timeout (float): Seconds an LLM call may take, 0 for no limit
+        llm_hedge (bool): Whether to send a second request when the first one is slower than usual
+        llm_hedge_percentile (float): Percentile of the recent latencies of a model after which a request is hedged
+        llm_hedge_delay (float): Least seconds to wait before hedging a request
+        llm_hedge_api_key (str): OpenAI key of the hedged requests when there is no other model to route to
+        prompt_cache (bool): Whether to mark the static prefix of prompts for the providers that cache on request
+        prompt_cache_ttl (float): Seconds a provider keeps a prompt prefix, to estimate the hit rate
+        prompt_cache_min_tokens (int): Shortest prompt prefix a provider caches
+        ollama_keep_alive (str): How long Ollama keeps a model and its computed prompts loaded, e.g. "30m"
     """
 
     _instance = None
@@ -97,6 +146,19 @@ class Config(metaclass=Singleton):
         self.google_api_key = self._get("GOOGLE_API_KEY")
         self.google_cse_id = self._get("GOOGLE_CSE_ID")
         self.search_engine = self._get("SEARCH_ENGINE", SearchEngineType.SERPAPI_GOOGLE)
+        self.search_cache_ttl = self._get("SEARCH_CACHE_TTL", 3600)
+        self.search_cache_size = int(self._get("SEARCH_CACHE_SIZE", 256))
+        self.search_cache_dir = self._get("SEARCH_CACHE_DIR")
+        self.search_timeout = float(self._get("SEARCH_TIMEOUT", 30))
+        self.search_timeouts = self._get("SEARCH_TIMEOUTS", {})
+        self.search_workers = int(self._get("SEARCH_WORKERS", 8))
+        self.search_fanout = self._get_bool("SEARCH_FANOUT", False)
+        self.search_fanout_engines = self._get("SEARCH_FANOUT_ENGINES", [])
+        self.search_fanout_results = int(self._get("SEARCH_FANOUT_RESULTS", 8))
+        self.local_search_dir = self._get("LOCAL_SEARCH_DIR")
+        self.local_search_index = self._get("LOCAL_SEARCH_INDEX")
+        self.local_search_rerank = self._get_bool("LOCAL_SEARCH_RERANK", False)
+        self.local_search_refresh = self._get("LOCAL_SEARCH_REFRESH", 5)
         
         # Browser settings
         self.web_browser_engine = WebBrowserEngineType(self._get("WEB_BROWSER_ENGINE", "playwright"))
@@ -117,11 +179,68 @@ class Config(metaclass=Singleton):
         self.ollama_custom_model = self._get("OLLAMA_CUSTOM_MODEL", {})
         
         # System settings
-        self.long_term_memory = self._get('LONG_TERM_MEMORY', False)
+        self.long_term_memory = self._get_bool("LONG_TERM_MEMORY", False)
         if self.long_term_memory:
             logger.warning("LONG_TERM_MEMORY is True")
         self.max_budget = self._get("MAX_BUDGET", 10.0)
-        self.total_cost = 0.0
+
+        # LLM response cache
+        self.llm_cache = self._get_bool("LLM_CACHE", False)
+        self.llm_cache_size = int(self._get("LLM_CACHE_SIZE", 1024))
+        self.llm_cache_dir = self._get("LLM_CACHE_DIR")
+
+        # Execution plan
+        self.plan_workers = int(self._get("PLAN_WORKERS", 4))
+        self.plan_step_delay = float(self._get("PLAN_STEP_DELAY", 0))
+        self.plan_expert_consensus = self._get_bool("PLAN_EXPERT_CONSENSUS", False)
+        self.plan_speculation = self._get_bool("PLAN_SPECULATION", False)
+        self.plan_speculation_budget = float(self._get("PLAN_SPECULATION_BUDGET", 0.1))
+        self.plan_speculation_max_tokens = int(self._get("PLAN_SPECULATION_MAX_TOKENS", 400))
+
+        # Structured output validation while streaming
+        self.output_format_retries = int(self._get("OUTPUT_FORMAT_RETRIES", 2))
+        self.output_section_max_chars = int(self._get("OUTPUT_SECTION_MAX_CHARS", 24000))
+        self.output_preamble_max_chars = int(self._get("OUTPUT_PREAMBLE_MAX_CHARS", 8000))
+
+        # Tracing
+        self.tracing = self._get_bool("TRACING", False)
+        self.trace_file = self._get("TRACE_FILE", "logs/traces.jsonl")
+
+        # Event loop diagnostics
+        self.loop_monitor = self._get_bool("LOOP_MONITOR", False)
+        self.loop_stall_threshold = float(self._get("LOOP_STALL_THRESHOLD", 0.1))
+
+        # Logging
+        self.log_level = self._get("LOG_LEVEL", "INFO")
+        self.log_file_level = self._get("LOG_FILE_LEVEL", "DEBUG")
+        self.log_json = self._get_bool("LOG_JSON", False)
+        self.log_rotation = self._get("LOG_ROTATION", "20 MB")
+        self.log_retention = int(self._get("LOG_RETENTION", 10))
+        self.log_module_levels = self._get("LOG_MODULE_LEVELS", "")
+        self.log_max_chars = int(self._get("LOG_MAX_CHARS", 4000))
+
+        # Model routing
+        self.model_routes = self._get("MODEL_ROUTES", {})
+        self.model_costs = self._get("MODEL_COSTS", {})
+        self.router_latency_slo = float(self._get("ROUTER_LATENCY_SLO", 0))
+        self.router_cooldown = float(self._get("ROUTER_COOLDOWN", 30))
+
+        # Deadlines and hedging
+        self.task_timeout = float(self._get("TASK_TIMEOUT", 0))
+        self.llm_timeout = float(self._get("LLM_TIMEOUT", 300))
+        self.llm_hedge = self._get_bool("LLM_HEDGE", False)
+        self.llm_hedge_percentile = float(self._get("LLM_HEDGE_PERCENTILE", 95))
+        self.llm_hedge_delay = float(self._get("LLM_HEDGE_DELAY", 10))
+        self.llm_hedge_api_key = self._get("LLM_HEDGE_API_KEY", "")
+
+        # Prompt prefix caching
+        self.prompt_cache = self._get_bool("PROMPT_CACHE", True)
+        self.prompt_cache_ttl = float(self._get("PROMPT_CACHE_TTL", 300))
+        self.prompt_cache_min_tokens = int(self._get("PROMPT_CACHE_MIN_TOKENS", 1024))
+        self.ollama_keep_alive = self._get("OLLAMA_KEEP_ALIVE", "30m")
+
+        define_log_level(self.log_level, self.log_file_level, serialize=self.log_json, rotation=self.log_rotation,
+                         retention=self.log_retention, module_levels=self.log_module_levels, max_chars=self.log_max_chars)
 
     def _init_with_config_files_and_env(self, configs: dict, yaml_file):
         """Load configuration from files and environment variables.
@@ -163,6 +282,21 @@ class Config(metaclass=Singleton):
         """
         return self._configs.get(*args, **kwargs)
 
+    def _get_bool(self, key: str, default: bool = False) -> bool:
+        """Get a flag, the strings 1, true and yes of environment variables are true.
+
+        Args:
+            key (str): The configuration key to look up
+            default (bool): The value when the key is not set
+
+        Returns:
+            bool: The flag
+        """
+        value = self._get(key, default)
+        if isinstance(value, str):
+            return value.strip().lower() in ("1", "true", "yes")
+        return bool(value)
+
     def get(self, key, *args, **kwargs):
         """Get a configuration value, raising an error if not found.
         
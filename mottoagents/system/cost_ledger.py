@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File    : cost_ledger.py
+@Desc    : per task ledger of LLM calls, tokens, latency and dollars, with a budget
+
+Every task has its own CostLedger, carried by its Environment and made current with
+`use_ledger` while the task runs, so tasks sharing a process never see each other's
+costs or budgets. Ledgers nest: a ledger opened while another one is current records
+its usage in that one too, e.g. a task's ledger in the batch item's, and every ledger
+ends in the process ledger the service reports. Usage is also split by the role that
+made the call.
+
+Before a call is sent it reserves its worst case cost, its prompt tokens and MAX_TOKENS
+completion tokens, in its ledger and the ones above. Concurrent calls of a task can't
+overshoot the budget together, and the reservation is released once the call is done
+and its real usage recorded.
+"""
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from mottoagents.system.utils.common import NoMoneyException
+
+
+class Usage:
+    """Counters of LLM usage"""
+
+    __slots__ = ("calls", "prompt_tokens", "cached_tokens", "completion_tokens", "latency", "total_cost")
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.latency = 0.0
+        self.total_cost = 0.0
+
+    def _add(self, calls=0, prompt_tokens=0, cached_tokens=0, completion_tokens=0, latency=0.0, total_cost=0.0):
+        self.calls += calls
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += cached_tokens
+        self.completion_tokens += completion_tokens
+        self.latency += latency
+        self.total_cost += total_cost
+
+    def to_dict(self) -> dict:
+        return {key: getattr(self, key) for key in Usage.__slots__}
+
+
+class CostLedger(Usage):
+    """Usage and budget of a task.
+
+    Attributes:
+        budget (float): Dollars the task may spend, 0 for no limit
+        parent (CostLedger): Ledger the usage is also recorded in
+        reserved (float): Dollars reserved by the calls in flight
+        roles (dict[str, Usage]): Usage of each role
+    """
+
+    __slots__ = ("budget", "parent", "reserved", "roles", "_lock")
+
+    def __init__(self, budget: float = 0, parent: Optional["CostLedger"] = None):
+        super().__init__()
+        self.budget = budget
+        self.parent = parent
+        self.reserved = 0.0
+        self.roles = {}
+        self._lock = threading.Lock()
+
+    @property
+    def remaining(self) -> Optional[float]:
+        """Dollars left to reserve, None without a budget"""
+        if not self.budget:
+            return None
+        return self.budget - self.total_cost - self.reserved
+
+    def reserve(self, amount: float) -> float:
+        """Reserve `amount` dollars here and in the ledgers above.
+
+        Raises:
+            NoMoneyException: If a budget can't cover the spent, reserved and new amounts
+        """
+        with self._lock:
+            if self.budget and self.total_cost + self.reserved + amount > self.budget:
+                raise NoMoneyException(self.total_cost, f'Insufficient funds: {self.budget}')
+            self.reserved += amount
+        if self.parent is not None:
+            try:
+                self.parent.reserve(amount)
+            except BaseException:
+                with self._lock:
+                    self.reserved -= amount
+                raise
+        return amount
+
+    def release(self, amount: float):
+        with self._lock:
+            self.reserved -= amount
+        if self.parent is not None:
+            self.parent.release(amount)
+
+    def record(self, role: Optional[str] = None, **counters):
+        """Add usage, e.g. `record(prompt_tokens=10, total_cost=0.01)`, to this ledger and the ones above"""
+        with self._lock:
+            self._add(**counters)
+            role = role or current_role()
+            if role:
+                self.roles.setdefault(role, Usage())._add(**counters)
+        if self.parent is not None:
+            self.parent.record(role, **counters)
+
+    def check_balance(self):
+        """Raises NoMoneyException once the spent amount is over the budget"""
+        if self.budget and self.total_cost > self.budget:
+            raise NoMoneyException(self.total_cost, f'Insufficient funds: {self.budget}')
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {**self.to_dict(), "budget": self.budget,
+                    "roles": {role: usage.to_dict() for role, usage in self.roles.items()}}
+
+
+_process_ledger = CostLedger()
+_current_ledger: ContextVar[Optional[CostLedger]] = ContextVar("cost_ledger", default=None)
+_current_role: ContextVar[Optional[str]] = ContextVar("cost_role", default=None)
+
+
+def process_ledger() -> CostLedger:
+    """The ledger of every call made by this process"""
+    return _process_ledger
+
+
+def current_ledger() -> CostLedger:
+    """The ledger of the running task, the process ledger outside of any task"""
+    return _current_ledger.get() or _process_ledger
+
+
+def current_role() -> Optional[str]:
+    return _current_role.get()
+
+
+@contextmanager
+def use_ledger(ledger: CostLedger):
+    """Record the calls made in this context, and the tasks it starts, in `ledger`"""
+    token = _current_ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _current_ledger.reset(token)
+
+
+@contextmanager
+def track_task_cost(budget: float = 0):
+    """Record the calls made in this context in a new ledger under the current one"""
+    with use_ledger(CostLedger(budget, parent=current_ledger())) as ledger:
+        yield ledger
+
+
+@contextmanager
+def charge_role(role: str):
+    """Split the usage of the calls made in this context under `role`"""
+    token = _current_role.set(role)
+    try:
+        yield
+    finally:
+        _current_role.reset(token)
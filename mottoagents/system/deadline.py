@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File    : deadline.py
+@Desc    : deadlines carried by the context of a task down to its LLM calls
+
+A deadline is kept in a ContextVar, like the cost ledger: `deadline(TASK_TIMEOUT)` around
+a task bounds every call made inside it, nested deadlines can only shorten it, and the
+asyncio tasks a role starts inherit it. Calls take the time that is left, capped by their
+own timeout, and retries never sleep past it.
+"""
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Optional, TypeVar
+
+T = TypeVar("T")
+
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """The task ran out of time, retrying won't help"""
+
+
+@contextmanager
+def deadline(seconds: float):
+    """Bound the block to `seconds` from now, or to the current deadline if it is earlier. 0 for no limit"""
+    if not seconds:
+        yield
+        return
+    current = _deadline.get()
+    end = time.monotonic() + seconds
+    token = _deadline.set(end if current is None else min(current, end))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the deadline, None without one"""
+    end = _deadline.get()
+    return None if end is None else end - time.monotonic()
+
+
+def timeout_for(cap: float = 0) -> Optional[float]:
+    """Timeout of a call: the time left, at most `cap` seconds if given"""
+    left = remaining()
+    if not cap:
+        return left
+    return cap if left is None else min(cap, left)
+
+
+async def run_with_deadline(awaitable: Awaitable[T], cap: float = 0) -> T:
+    """Await `awaitable` within the deadline and `cap` seconds.
+
+    Raises:
+        DeadlineExceeded: If the deadline passed
+        asyncio.TimeoutError: If the call took more than `cap` seconds
+    """
+    timeout = timeout_for(cap)
+    if timeout is None:
+        return await awaitable
+    if timeout <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise DeadlineExceeded("No time left before the deadline")
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        left = remaining()
+        if left is not None and left <= 0:
+            raise DeadlineExceeded("The deadline passed") from None
+        raise
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File    : diagnostics.py
+@Desc    : event loop stall detection and on demand profiling
+
+A LoopMonitor measures how late the event loop wakes a heartbeat task. A watchdog thread
+looks at the heartbeat: once the loop has not come back for LOOP_STALL_THRESHOLD seconds,
+a callback is blocking it, and the watchdog samples the stack of the loop's thread until
+it comes back. The stall is logged with the stack that blocked it, and the time spent in
+each stack is added up, so the worst offenders (a time.sleep, a sync client, a pickle)
+stand out in `report()`.
+
+`sample_stacks` is a sampling profiler of every thread, its output is in the collapsed
+format of flamegraph.pl and speedscope, the same as `py-spy record --format raw`.
+`profile_loop` runs cProfile on the loop's thread, i.e. every callback of the loop.
+"""
+import asyncio
+import cProfile
+import io
+import marshal
+import pstats
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from mottoagents.system.config import CONFIG
+from mottoagents.system.const import PROJECT_ROOT
+from mottoagents.system.logs import logger
+from mottoagents.system.metrics import REGISTRY
+
+LOOP_LAG = REGISTRY.gauge("mottoagents_event_loop_lag_seconds", "Lag of the last event loop heartbeat")
+LOOP_BLOCKED = REGISTRY.counter("mottoagents_event_loop_blocked_seconds_total", "Seconds the event loop was late")
+LOOP_STALLS = REGISTRY.counter("mottoagents_event_loop_stalls_total", "Callbacks that blocked the event loop over the threshold")
+
+MAX_PROFILE_SECONDS = 60
+_profiling = threading.Lock()
+
+
+def _frame_name(frame) -> str:
+    filename = frame.f_code.co_filename
+    root = str(PROJECT_ROOT)
+    if filename.startswith(root):
+        filename = filename[len(root):].lstrip("/\\")
+    return f"{frame.f_code.co_name} ({filename}:{frame.f_lineno})"
+
+
+def collapse_stack(frame) -> str:
+    """The stack ending in `frame`, outermost first, separated by `;`"""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class LoopMonitor:
+    """Measure the lag of the running event loop and sample the stack of a blocked loop
+
+    Attributes:
+        threshold (float): Seconds without a heartbeat after which the loop is stalled
+        interval (float): Seconds between heartbeats, and between samples of a stall
+        lag (float): Lag of the last heartbeat
+        max_lag (float): Longest lag seen
+        blocked (float): Total lag
+        stalls (int): Number of stalls
+        stacks (dict[str, list]): Samples and seconds of each collapsed stack seen in a stall
+    """
+
+    def __init__(self, threshold: float = 0.1, interval: float = None, max_stacks: int = 100):
+        self.threshold = threshold
+        self.interval = interval or min(0.05, threshold / 2)
+        self.max_stacks = max_stacks
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.blocked = 0.0
+        self.stalls = 0
+        self.stacks = {}
+        self.users = 0
+        self._beat = time.perf_counter()
+        self._loop_thread = None
+        self._task = None
+        self._thread = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start watching the running loop"""
+        self._loop_thread = threading.get_ident()
+        self._beat = time.perf_counter()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _heartbeat(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self._beat = time.perf_counter()
+            self.lag = max(0.0, self._beat - start - self.interval)
+            LOOP_LAG.set(self.lag)
+            if self.lag:
+                self.blocked += self.lag
+                self.max_lag = max(self.max_lag, self.lag)
+                LOOP_BLOCKED.inc(self.lag)
+
+    def _watch(self):
+        stalled_beat, sampled_at = None, 0.0
+        while not self._stopped.wait(self.interval):
+            beat, now = self._beat, time.perf_counter()
+            if now - beat < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            try:
+                stack = collapse_stack(frame)
+                if beat != stalled_beat:
+                    # a new stall, the loop was blocked since its last heartbeat
+                    stalled_beat, seconds = beat, now - beat
+                    self.stalls += 1
+                    LOOP_STALLS.inc()
+                    logger.warning(f"Event loop blocked for {seconds:.3f}s in:\n{''.join(traceback.format_stack(frame))}")
+                else:
+                    seconds = now - sampled_at
+                sampled_at = now
+            finally:
+                del frame
+            self._add_sample(stack, seconds)
+
+    def _add_sample(self, stack: str, seconds: float):
+        with self._lock:
+            if stack not in self.stacks and len(self.stacks) >= self.max_stacks:
+                stack = "[other]"
+            samples = self.stacks.setdefault(stack, [0, 0.0])
+            samples[0] += 1
+            samples[1] += seconds
+
+    def report(self, top: int = 10) -> dict:
+        """Lag statistics and the stacks that blocked the loop longest"""
+        with self._lock:
+            stacks = sorted(self.stacks.items(), key=lambda item: item[1][1], reverse=True)[:top]
+        return {
+            "threshold_s": self.threshold,
+            "lag_s": round(self.lag, 4),
+            "max_lag_s": round(self.max_lag, 4),
+            "blocked_s": round(self.blocked, 4),
+            "stalls": self.stalls,
+            "stacks": [{"stack": stack, "samples": samples, "seconds": round(seconds, 4)}
+                       for stack, (samples, seconds) in stacks],
+        }
+
+
+_monitors = {}
+
+
+def get_loop_monitor() -> Optional[LoopMonitor]:
+    """The monitor of the running loop, if any"""
+    return _monitors.get(asyncio.get_running_loop())
+
+
+@asynccontextmanager
+async def watch_loop(enabled: bool = None):
+    """Monitor the running loop for the block, yields None unless LOOP_MONITOR (or `enabled`) is set.
+
+    Blocks running at the same time on a loop share its monitor, it stops with the last of them.
+    """
+    if not (CONFIG.loop_monitor if enabled is None else enabled):
+        yield None
+        return
+
+    loop = asyncio.get_running_loop()
+    monitor = _monitors.get(loop)
+    if monitor is None:
+        monitor = _monitors[loop] = LoopMonitor(float(CONFIG.loop_stall_threshold))
+        monitor.start()
+    monitor.users += 1
+    try:
+        yield monitor
+    finally:
+        monitor.users -= 1
+        if not monitor.users:
+            monitor.stop()
+            _monitors.pop(loop, None)
+            if monitor.stalls:
+                logger.warning(f"Event loop stalls: {monitor.report(top=5)}")
+
+
+def sample_stacks(seconds: float, interval: float = 0.005) -> str:
+    """Sample the stacks of every other thread for `seconds`, in the collapsed format
+
+    Each line is a stack, outermost frame first, prefixed with its thread's name, and the
+    number of samples it was seen in. Blocks the calling thread, run it in an executor.
+    """
+    if not _profiling.acquire(blocking=False):
+        raise RuntimeError("A profile is already running")
+    try:
+        me = threading.get_ident()
+        counts = Counter()
+        deadline = time.perf_counter() + min(seconds, MAX_PROFILE_SECONDS)
+        while time.perf_counter() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != me:
+                    counts[f"{names.get(ident, ident)};{collapse_stack(frame)}"] += 1
+            frame = None
+            time.sleep(interval)
+    finally:
+        _profiling.release()
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+async def profile_loop(seconds: float, output: str = "text", sort: str = "cumulative", limit: int = 60):
+    """Run cProfile on the running loop for `seconds`
+
+    Returns the `limit` first functions sorted by `sort` as text, or with `output="pstats"`
+    the marshalled stats that `pstats.Stats` and snakeviz load.
+    """
+    if not _profiling.acquire(blocking=False):
+        raise RuntimeError("A profile is already running")
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        try:
+            await asyncio.sleep(min(seconds, MAX_PROFILE_SECONDS))
+        finally:
+            profiler.disable()
+    finally:
+        _profiling.release()
+
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    if output == "pstats":
+        return marshal.dumps(stats.stats)
+    stats.sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
@@ -6,23 +6,26 @@
 @File    : https://github.com/geekan/MetaGPT/blob/main/metagpt/document_store/document.py
 """
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-import pandas as pd
-from langchain.document_loaders import (
-    TextLoader,
-    UnstructuredPDFLoader,
-    UnstructuredWordDocumentLoader,
-)
-from langchain.text_splitter import CharacterTextSplitter
-from tqdm import tqdm
+if TYPE_CHECKING:
+    import pandas as pd
 
 
-def validate_cols(content_col: str, df: pd.DataFrame):
+def validate_cols(content_col: str, df: "pd.DataFrame"):
     if content_col not in df.columns:
         raise ValueError
 
 
 def read_data(data_path: Path):
+    import pandas as pd
+    from langchain.document_loaders import (
+        TextLoader,
+        UnstructuredPDFLoader,
+        UnstructuredWordDocumentLoader,
+    )
+    from langchain.text_splitter import CharacterTextSplitter
+
     suffix = data_path.suffix
     if '.xlsx' == suffix:
         data = pd.read_excel(data_path)
@@ -47,6 +50,8 @@ def read_data(data_path: Path):
 class Document:
 
     def __init__(self, data_path, content_col='content', meta_col='metadata'):
+        import pandas as pd
+
         self.data = read_data(data_path)
         if isinstance(self.data, pd.DataFrame):
             validate_cols(content_col, self.data)
@@ -54,6 +59,8 @@ class Document:
         self.meta_col = meta_col
 
     def _get_docs_and_metadatas_by_df(self) -> (list, list):
+        from tqdm import tqdm
+
         df = self.data
         docs = []
         metadatas = []
@@ -73,6 +80,8 @@ class Document:
         return docs, metadatas
 
     def get_docs_and_metadatas(self) -> (list, list):
+        import pandas as pd
+
         if isinstance(self.data, pd.DataFrame):
             return self._get_docs_and_metadatas_by_df()
         elif isinstance(self.data, list):
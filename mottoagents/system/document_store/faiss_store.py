@@ -9,14 +9,10 @@ import pickle
 from pathlib import Path
 from typing import Optional
 
-import faiss
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.vectorstores import FAISS
-
 from mottoagents.system.const import DATA_PATH
 from mottoagents.system.document_store.base_store import LocalStore
 from mottoagents.system.document_store.document import Document
-from mottoagents.system.logs import logger
+from mottoagents.system.logs import clip, logger
 
 
 class FaissStore(LocalStore):
@@ -30,6 +26,8 @@ class FaissStore(LocalStore):
         if not (index_file.exists() and store_file.exists()):
             logger.info("Missing at least one of index_file/store_file, load failed and return None")
             return None
+        import faiss
+
         index = faiss.read_index(str(index_file))
         with open(str(store_file), "rb") as f:
             store = pickle.load(f)
@@ -37,10 +35,15 @@ class FaissStore(LocalStore):
         return store
 
     def _write(self, docs, metadatas):
+        from langchain.embeddings import OpenAIEmbeddings
+        from langchain.vectorstores import FAISS
+
         store = FAISS.from_texts(docs, OpenAIEmbeddings(openai_api_version="2020-11-07"), metadatas=metadatas)
         return store
 
     def persist(self):
+        import faiss
+
         index_file, store_file = self._get_index_and_store_fname()
         store = self.store
         index = self.store.index
@@ -52,7 +55,7 @@ class FaissStore(LocalStore):
 
     def search(self, query, expand_cols=False, sep='\n', *args, k=5, **kwargs):
         rsp = self.store.similarity_search(query, k=k)
-        logger.debug(rsp)
+        logger.opt(lazy=True).debug("{}", lambda: clip(rsp))
         if expand_cols:
             return str(sep.join([f"{x.page_content}: {x.metadata}" for x in rsp]))
         else:
@@ -4,12 +4,25 @@
 @File    : llm.py
 @From    : https://github.com/geekan/MetaGPT/blob/main/metagpt/llm.py
 """
+from functools import lru_cache
+
 from .provider.anthropic_api import Claude2 as Claude
 from .provider.openai_api import OpenAIGPTAPI as LLM
 
-DEFAULT_LLM = LLM()
-CLAUDE_LLM = Claude()
+_DEFAULT_INSTANCES = {"DEFAULT_LLM": LLM, "CLAUDE_LLM": Claude}
+
+
+@lru_cache(maxsize=None)
+def _default_instance(name):
+    return _DEFAULT_INSTANCES[name]()
+
+
+def __getattr__(name):
+    # DEFAULT_LLM and CLAUDE_LLM are created on first access
+    if name in _DEFAULT_INSTANCES:
+        return _default_instance(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 async def ai_func(prompt):
-    return await DEFAULT_LLM.aask(prompt)
+    return await _default_instance("DEFAULT_LLM").aask(prompt)
@@ -3,18 +3,78 @@
 @Author  : alexanderwu
 @File    : logs.py
 @From    : https://github.com/geekan/MetaGPT/blob/main/metagpt/logs.py
+
+Records are written by a background thread (`enqueue`), a log call only puts the record
+on a queue, and the records of forked workers go through the same queue. The log file
+rotates at LOG_ROTATION and keeps LOG_RETENTION files, with LOG_JSON it holds one JSON
+record per line. LOG_MODULE_LEVELS overrides the level of some modules, e.g.
+`mottoagents.system.provider=INFO,mottoagents.roles=DEBUG`, and messages longer than
+LOG_MAX_CHARS are truncated.
+
+Prompts, responses and other large payloads are logged lazily and clipped, so they are
+only formatted when a sink keeps their level:
+    logger.opt(lazy=True).debug("{}", lambda: clip(messages))
 """
+import reprlib
 import sys
 
 from loguru import logger as _logger
 
 from .const import PROJECT_ROOT
 
+_max_chars = 4000
+
+
+def clip(value, limit: int = None) -> str:
+    """`value` as a string of at most `limit` (LOG_MAX_CHARS) characters
+
+    Containers are shortened element by element with reprlib, so a long list of
+    messages is never formatted as a whole only to be cut.
+    """
+    limit = _max_chars if limit is None else limit
+    if limit and isinstance(value, (list, tuple, dict, set, frozenset)):
+        shortener = reprlib.Repr()
+        shortener.maxstring = shortener.maxother = limit
+        shortener.maxlist = shortener.maxtuple = shortener.maxdict = shortener.maxset = shortener.maxfrozenset = 32
+        text = shortener.repr(value)
+    else:
+        text = value if isinstance(value, str) else str(value)
+    if limit and len(text) > limit:
+        return f"{text[:limit]}... [{len(text) - limit} more chars]"
+    return text
+
+
+def _truncate(record):
+    if _max_chars and len(record["message"]) > _max_chars:
+        record["message"] = clip(record["message"])
+
+
+def parse_module_levels(levels: str) -> dict[str, str]:
+    """`module=LEVEL,...` as a dict"""
+    parsed = {}
+    for item in (levels or "").split(","):
+        module, _, level = item.partition("=")
+        if module.strip() and level.strip():
+            parsed[module.strip()] = level.strip().upper()
+    return parsed
+
+
+def define_log_level(print_level="INFO", logfile_level="DEBUG", serialize=False, rotation="20 MB", retention=10,
+                     module_levels: str = "", max_chars: int = 4000):
+    global _max_chars
+    _max_chars = max_chars
+    overrides = parse_module_levels(module_levels)
+
+    def sink_options(level):
+        # the sink takes the lowest level, the filter applies the level of each module
+        lowest = min([level, *overrides.values()], key=lambda name: _logger.level(name).no)
+        return {"level": lowest, "filter": {"": level, **overrides}, "enqueue": True}
 
-def define_log_level(print_level="INFO", logfile_level="DEBUG"):
     _logger.remove()
-    _logger.add(sys.stderr, level=print_level)
-    _logger.add(PROJECT_ROOT / 'logs/log.txt', level=logfile_level)
+    _logger.configure(patcher=_truncate)
+    _logger.add(sys.stderr, **sink_options(print_level))
+    _logger.add(PROJECT_ROOT / 'logs/log.txt', serialize=serialize, rotation=rotation, retention=retention,
+                **sink_options(logfile_level))
     return _logger
 
 
@@ -6,8 +6,11 @@ from collections import defaultdict
 from typing import Iterable, Type
 
 from mottoagents.actions import Action
+from mottoagents.system.metrics import REGISTRY
 from mottoagents.system.schema import Message
 
+MEMORY_MESSAGES = REGISTRY.gauge("mottoagents_memory_messages", "Messages held by the memories of the roles and environments")
+
 
 class Memory:
     """The most basic memory: super-memory"""
@@ -23,6 +26,7 @@ class Memory:
         if message in self.storage:
             return
         self.storage.append(message)
+        MEMORY_MESSAGES.inc()
         if message.cause_by:
             self.index[message.cause_by].append(message)
 
@@ -42,11 +46,13 @@ class Memory:
     def delete(self, message: Message):
         """Delete the specified message from storage, while updating the index"""
         self.storage.remove(message)
+        MEMORY_MESSAGES.dec()
         if message.cause_by and message in self.index[message.cause_by]:
             self.index[message.cause_by].remove(message)
 
     def clear(self):
         """Clear storage and index"""
+        MEMORY_MESSAGES.dec(len(self.storage))
         self.storage = []
         self.index = defaultdict(list)
 
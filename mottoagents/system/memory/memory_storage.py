@@ -3,17 +3,21 @@
 # @Desc   : the implement of memory storage
 # https://github.com/geekan/MetaGPT/blob/main/metagpt/memory/memory_storage.py
 
-from typing import List
+from typing import TYPE_CHECKING, List
 from pathlib import Path
 
-from langchain.vectorstores.faiss import FAISS
-
 from mottoagents.system.const import DATA_PATH, MEM_TTL
 from mottoagents.system.logs import logger
+from mottoagents.system.metrics import REGISTRY
 from mottoagents.system.schema import Message
 from mottoagents.system.utils.serialize import serialize_message, deserialize_message
 from mottoagents.system.document_store.faiss_store import FaissStore
 
+MEMORY_STORAGE_DOCUMENTS = REGISTRY.gauge("mottoagents_memory_storage_documents", "Messages in the long term memory stores")
+
+if TYPE_CHECKING:
+    from langchain.vectorstores.faiss import FAISS
+
 
 class MemoryStorage(FaissStore):
     """
@@ -27,7 +31,7 @@ class MemoryStorage(FaissStore):
         self.threshold: float = 0.1  # experience value. TODO The threshold to filter similar memories
         self._initialized: bool = False
 
-        self.store: FAISS = None  # Faiss engine
+        self.store: "FAISS" = None  # Faiss engine
 
     @property
     def is_initialized(self) -> bool:
@@ -47,6 +51,7 @@ class MemoryStorage(FaissStore):
             for _id, document in self.store.docstore._dict.items():
                 messages.append(deserialize_message(document.metadata.get("message_ser")))
             self._initialized = True
+            MEMORY_STORAGE_DOCUMENTS.inc(len(messages))
 
         return messages
 
@@ -72,6 +77,7 @@ class MemoryStorage(FaissStore):
             self._initialized = True
         else:
             self.store.add_texts(texts=docs, metadatas=metadatas)
+        MEMORY_STORAGE_DOCUMENTS.inc()
         self.persist()
         logger.info(f"Agent {self.role_id}'s memory_storage add a message")
 
@@ -103,5 +109,7 @@ class MemoryStorage(FaissStore):
         if storage_fpath and storage_fpath.exists():
             storage_fpath.unlink(missing_ok=True)
 
+        if self.store:
+            MEMORY_STORAGE_DOCUMENTS.dec(len(self.store.docstore._dict))
         self.store = None
         self._initialized = False
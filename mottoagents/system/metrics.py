@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File    : metrics.py
+@Desc    : minimal in-process metrics registry rendered in the Prometheus text format
+
+Worker processes can't be scraped, they write a snapshot of their registry to a file
+instead (`write_snapshot`). The service merges the snapshots of the running workers into
+what it serves (`collect`), and adds the counters and histograms of a finished worker to
+its own registry, so totals survive the worker while its gauges go away with it.
+"""
+import json
+import os
+import threading
+from bisect import bisect_left
+from pathlib import Path
+
+INF = float("inf")
+# seconds, from a cached answer to a long completion
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, INF)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, labelvalues) -> str:
+    if not labelnames:
+        return ""
+    pairs = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(labelnames, labelvalues))
+    return "{" + pairs + "}"
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == INF else str(float(bound))
+
+
+class Metric:
+    """A named family of samples, one per combination of label values"""
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(k, "") for k in self.labelnames)
+
+    def samples(self) -> list[tuple[str, tuple, tuple, float]]:
+        """(name, label names, label values, value) of every sample"""
+        with self._lock:
+            return [(self.name, self.labelnames, key, value) for key, value in self._values.items()]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labelnames, key, value in self.samples():
+            lines.append(f"{name}{_format_labels(labelnames, key)} {value}")
+        return "\n".join(lines)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            values = [[list(key), value] for key, value in self._values.items()]
+        return {"kind": self.kind, "documentation": self.documentation, "labelnames": list(self.labelnames),
+                "values": values}
+
+    def merge(self, values: list):
+        """Add the values of a snapshot of the same metric"""
+        with self._lock:
+            for key, value in values:
+                key = tuple(key)
+                self._values[key] = self._values.get(key, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """Observations counted in buckets, each value is the count of every bucket and the sum"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        buckets = sorted(float(b) for b in buckets)
+        if not buckets or buckets[-1] != INF:
+            buckets.append(INF)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * len(self.buckets) + [0.0]
+            counts[bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def samples(self) -> list[tuple[str, tuple, tuple, float]]:
+        labelnames = self.labelnames + ("le",)
+        samples = []
+        with self._lock:
+            for key, counts in self._values.items():
+                total = 0
+                for bound, count in zip(self.buckets, counts):
+                    total += count
+                    samples.append((f"{self.name}_bucket", labelnames, key + (_format_bound(bound),), total))
+                samples.append((f"{self.name}_sum", self.labelnames, key, counts[-1]))
+                samples.append((f"{self.name}_count", self.labelnames, key, total))
+        return samples
+
+    def snapshot(self) -> dict:
+        snapshot = super().snapshot()
+        snapshot["buckets"] = [_format_bound(b) for b in self.buckets]
+        return snapshot
+
+    def merge(self, values: list):
+        with self._lock:
+            for key, counts in values:
+                key = tuple(key)
+                current = self._values.get(key)
+                if current is None:
+                    self._values[key] = list(counts)
+                else:
+                    self._values[key] = [a + b for a, b in zip(current, counts)]
+
+
+class Registry:
+    _kinds = {"counter": Counter, "gauge": Gauge, "histogram": Histogram}
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def merge(self, snapshot: dict, gauges: bool = True):
+        """Add the samples of another registry's snapshot, without its gauges if `gauges` is False"""
+        for name, family in snapshot.items():
+            cls = self._kinds.get(family["kind"])
+            if cls is None or (cls is Gauge and not gauges):
+                continue
+            kwargs = {"buckets": [float(b) for b in family["buckets"]]} if cls is Histogram else {}
+            metric = self._get_or_create(cls, name, family["documentation"], family["labelnames"], **kwargs)
+            metric.merge(family["values"])
+
+    def reset(self):
+        """Zero every metric, e.g. in a worker forked from the service"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+
+
+REGISTRY = Registry()
+
+# recorded by several modules
+RETRIES = REGISTRY.counter("mottoagents_retries_total", "Retried calls", ["source"])
+CACHE_LOOKUPS = REGISTRY.counter("mottoagents_cache_lookups_total", "Cache lookups by cache and result", ["cache", "result"])
+
+
+def write_atomic(path, data: bytes):
+    """Write `data` to `path`, readers never see a partial file"""
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def write_snapshot(path, registry: Registry = REGISTRY):
+    """Write the registry to `path`, readers never see a partial file"""
+    write_atomic(path, json.dumps(registry.snapshot()).encode())
+
+
+def read_snapshot(path) -> dict:
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def collect(directory, registry: Registry = REGISTRY) -> Registry:
+    """A registry of `registry` and the snapshots in `directory`"""
+    merged = Registry()
+    merged.merge(registry.snapshot())
+    for path in sorted(Path(directory).glob("*.json")):
+        merged.merge(read_snapshot(path))
+    return merged
@@ -7,14 +7,14 @@
 @From    : https://github.com/geekan/MetaGPT/blob/main/metagpt/provider/anthropic_api.py
 """
 
-import anthropic
-from anthropic import Anthropic
-
 from mottoagents.system.config import CONFIG
 
 
 class Claude2:
     def ask(self, prompt):
+        import anthropic
+        from anthropic import Anthropic
+
         client = Anthropic(api_key=CONFIG.claude_api_key)
 
         res = client.completions.create(
@@ -25,6 +25,9 @@ class Claude2:
         return res.completion
 
     async def aask(self, prompt):
+        import anthropic
+        from anthropic import Anthropic
+
         client = Anthropic(api_key=CONFIG.claude_api_key)
 
         res = client.completions.create(
@@ -5,8 +5,9 @@
 from abc import abstractmethod
 from typing import Optional
 
-from mottoagents.system.logs import logger
+from mottoagents.system.logs import clip, logger
 from mottoagents.system.provider.base_chatbot import BaseChatbot
+from mottoagents.system.tracing import span
 
 
 class BaseGPTAPI(BaseChatbot):
@@ -39,8 +40,9 @@ class BaseGPTAPI(BaseChatbot):
         else:
             message = [self._default_system_msg(), self._user_msg(msg)]
 
-        rsp = await self.acompletion_text(message, stream=True)
-        logger.debug(message)
+        with span("llm.aask", model=str(getattr(self, "model", ""))):
+            rsp = await self.acompletion_text(message, stream=True)
+        logger.opt(lazy=True).debug("{}", lambda: clip(message))
         # logger.debug(rsp)
         return rsp
 
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File    : model_router.py
+@Desc    : pick the model of each action from declared routes and live statistics
+
+MODEL_ROUTES maps action class names to the models they may use, in order of preference,
+e.g. a local Ollama model first for CheckRoles and GPT-4 for WriteCode. An action without
+a route of its own uses the route of its closest base class, then `default`. Models are
+litellm names: `gpt-4`, `claude-2` or `ollama/llama2`.
+
+The router keeps the latency and the error rate of every model. A model that fails or is
+rate limited cools down for ROUTER_COOLDOWN seconds, doubled at each failure in a row, and
+the call falls back to the next model of the route. A model slower than ROUTER_LATENCY_SLO
+or failing more often than not is tried after the others. Without MODEL_ROUTES there is no
+router and every call uses OPENAI_API_MODEL.
+"""
+import time
+from typing import Iterable, Optional
+
+from mottoagents.system.config import CONFIG
+from mottoagents.system.metrics import REGISTRY
+from mottoagents.system.utils.token_counter import TOKEN_COSTS
+
+ROUTER_FAILURES = REGISTRY.counter("mottoagents_router_failures_total", "Failed calls of routed models", ["model", "reason"])
+_ALPHA = 0.2
+_NO_COST = {"prompt": 0.0, "completion": 0.0}
+
+
+def provider_of(model: str) -> str:
+    if model.startswith("ollama/"):
+        return "ollama"
+    if model.startswith(("claude", "anthropic/")):
+        return "anthropic"
+    return "openai"
+
+
+def completion_kwargs(model: str) -> dict:
+    """Arguments litellm needs to reach the provider of `model`"""
+    provider = provider_of(model)
+    if provider == "ollama":
+        # a loaded model keeps the computation of the prompts it has seen
+        kwargs = {"api_base": CONFIG.ollama_host}
+        return {**kwargs, "keep_alive": CONFIG.ollama_keep_alive} if CONFIG.ollama_keep_alive else kwargs
+    if provider == "anthropic" and CONFIG.claude_api_key:
+        return {"api_key": CONFIG.claude_api_key}
+    return {}
+
+
+def model_costs(model: str) -> dict:
+    """Dollars per 1k prompt and completion tokens, from TOKEN_COSTS or MODEL_COSTS, free otherwise"""
+    return TOKEN_COSTS.get(model) or (CONFIG.model_costs or {}).get(model) or _NO_COST
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    return getattr(error, "status_code", None) == 429 or "RateLimit" in type(error).__name__
+
+
+class ModelStats:
+    """Moving averages of a model's latency and errors"""
+
+    __slots__ = ("calls", "latency", "error_rate", "failures", "cooldown_until")
+
+    def __init__(self):
+        self.calls = 0
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.failures = 0
+        self.cooldown_until = 0.0
+
+    def to_dict(self) -> dict:
+        return {key: getattr(self, key) for key in ModelStats.__slots__}
+
+
+class ModelRouter:
+    """Ordered models of each route, the healthy and fast ones first
+
+    Attributes:
+        routes (dict[str, list[str]]): Models of each action class name, and of `default`
+        latency_slo (float): Seconds of average latency over which a model is tried last, 0 for no limit
+        cooldown (float): Seconds a model is skipped after a failure
+        stats (dict[str, ModelStats]): Statistics of every model used
+    """
+
+    def __init__(self, routes: dict[str, list[str]], latency_slo: float = 0, cooldown: float = 30):
+        self.routes = {name: [models] if isinstance(models, str) else list(models) for name, models in routes.items()}
+        self.latency_slo = latency_slo
+        self.cooldown = cooldown
+        self.stats = {}
+
+    def _stats(self, model: str) -> ModelStats:
+        stats = self.stats.get(model)
+        if stats is None:
+            stats = self.stats[model] = ModelStats()
+        return stats
+
+    def route(self, names: Iterable[str], default: str) -> list[str]:
+        """Declared models of the first of `names` with a route, `default` without any"""
+        for name in names:
+            if name in self.routes:
+                return self.routes[name]
+        return self.routes.get("default") or [default]
+
+    def candidates(self, names: Iterable[str], default: str) -> list[str]:
+        """Models to try in order: healthy ones in declared order, slow or failing ones, cooling ones"""
+        now = time.monotonic()
+        ready, cooling = [], []
+        for model in self.route(names, default):
+            stats = self._stats(model)
+            (cooling if stats.cooldown_until > now else ready).append(model)
+
+        def degraded(model):
+            stats = self.stats[model]
+            return stats.error_rate > 0.5 or bool(self.latency_slo and stats.latency > self.latency_slo)
+
+        # sorted is stable, the declared order holds within each group
+        ready.sort(key=degraded)
+        cooling.sort(key=lambda model: self.stats[model].cooldown_until)
+        return ready + cooling
+
+    def record_success(self, model: str, latency: float):
+        stats = self._stats(model)
+        stats.latency = latency if not stats.latency else (1 - _ALPHA) * stats.latency + _ALPHA * latency
+        stats.error_rate *= 1 - _ALPHA
+        stats.calls += 1
+        stats.failures = 0
+        stats.cooldown_until = 0.0
+
+    def record_failure(self, model: str, error: BaseException):
+        stats = self._stats(model)
+        stats.error_rate = (1 - _ALPHA) * stats.error_rate + _ALPHA
+        stats.calls += 1
+        stats.failures += 1
+        stats.cooldown_until = time.monotonic() + self.cooldown * min(2 ** (stats.failures - 1), 10)
+        ROUTER_FAILURES.inc(model=model, reason="rate_limit" if is_rate_limited(error) else "error")
+
+    def report(self) -> dict:
+        return {model: stats.to_dict() for model, stats in self.stats.items()}
+
+
+_router = None
+
+
+def get_model_router() -> Optional[ModelRouter]:
+    """The process wide router, None without MODEL_ROUTES"""
+    global _router
+    if _router is None and CONFIG.model_routes:
+        _router = ModelRouter(CONFIG.model_routes, latency_slo=CONFIG.router_latency_slo, cooldown=CONFIG.router_cooldown)
+    return _router
+
+
+def set_model_router(router: Optional[ModelRouter]):
+    global _router
+    _router = router
@@ -7,38 +7,72 @@
 """
 import asyncio
 import time
+from contextlib import suppress
 from functools import wraps
-from typing import NamedTuple
-
-import openai
-import litellm
+from typing import NamedTuple, Optional
 
 from mottoagents.system.config import CONFIG
-from mottoagents.system.logs import logger
+from mottoagents.system.cost_ledger import CostLedger, current_ledger
+from mottoagents.system.deadline import DeadlineExceeded, remaining, run_with_deadline
+from mottoagents.system.logs import clip, logger
+from mottoagents.system.metrics import REGISTRY, RETRIES
 from mottoagents.system.provider.base_gpt_api import BaseGPTAPI
-from mottoagents.system.utils.singleton import Singleton
-from mottoagents.system.utils.token_counter import (
-    TOKEN_COSTS,
-    count_message_tokens,
-    count_string_tokens,
-)
+from mottoagents.system.provider.model_router import completion_kwargs, get_model_router, model_costs, provider_of
+from mottoagents.system.provider.prefix_cache import (get_prefix_tracker, mark_prefix, reported_cached_tokens,
+                                                      stable_prefix)
+from mottoagents.system.provider.resilience import (FATAL, LLM_ERRORS, classify_error, hedge_delay, hedged,
+                                                    latency_window, retry_delay)
+from mottoagents.system.tracing import add_to_span, set_span_attributes
+from mottoagents.system.utils.block_parser import MalformedOutputError
+from mottoagents.system.utils.cache import get_response_cache
+from mottoagents.system.utils.common import NoMoneyException
+from mottoagents.system.utils.stream import close_stream, notify_stream
+from mottoagents.system.utils.token_counter import count_message_tokens, count_string_tokens
+
+TOKEN_BUCKETS = (64, 256, 1024, 2048, 4096, 8192, 16384, 32768, 131072)
+LLM_REQUESTS = REGISTRY.counter("mottoagents_llm_requests_total", "LLM completions by outcome", ["model", "status"])
+LLM_LATENCY = REGISTRY.histogram("mottoagents_llm_latency_seconds", "Duration of LLM completions", ["model"])
+LLM_FIRST_TOKEN = REGISTRY.histogram("mottoagents_llm_first_token_seconds", "Time to the first token of streamed completions", ["model"])
+LLM_TOKENS = REGISTRY.histogram("mottoagents_llm_tokens", "Tokens of each LLM completion", ["model", "kind"], buckets=TOKEN_BUCKETS)
+LLM_RATE_LIMIT_WAIT = REGISTRY.histogram("mottoagents_llm_rate_limit_wait_seconds", "Time spent waiting for the rate limiter")
 
 
 def retry(max_retries):
+    """Retry the errors worth retrying after a delay fit for them, never past the deadline, see resilience.py"""
     def decorator(f):
         @wraps(f)
         async def wrapper(*args, **kwargs):
             for i in range(max_retries):
                 try:
                     return await f(*args, **kwargs)
-                except Exception:
-                    if i == max_retries - 1:
+                except (NoMoneyException, MalformedOutputError, DeadlineExceeded) as e:
+                    # out of budget, unparsable output or out of time: another attempt fails the same way
+                    LLM_ERRORS.inc(kind=classify_error(e))
+                    raise
+                except Exception as e:
+                    kind = classify_error(e)
+                    LLM_ERRORS.inc(kind=kind)
+                    if kind in FATAL or i == max_retries - 1:
+                        raise
+                    delay = retry_delay(kind, i, e)
+                    left = remaining()
+                    if left is not None and delay >= left:
                         raise
-                    await asyncio.sleep(2 ** i)
+                    logger.warning(f"LLM call failed ({kind}: {e!r}), retrying in {delay:.1f}s")
+                    add_to_span("retry_sleep_s", delay)
+                    RETRIES.inc(source="llm")
+                    await asyncio.sleep(delay)
         return wrapper
     return decorator
 
 
+async def _aclose(response):
+    aclose = getattr(response, "aclose", None)
+    if aclose is not None:
+        with suppress(Exception):
+            await aclose()
+
+
 class RateLimiter:
     """Rate control class, each call goes through wait_if_needed, sleep if rate control is needed"""
     def __init__(self, rpm):
@@ -56,7 +90,11 @@ class RateLimiter:
         if elapsed_time < self.interval * num_requests:
             remaining_time = self.interval * num_requests - elapsed_time
             logger.info(f"sleep {remaining_time}")
+            add_to_span("rate_limit_sleep_s", remaining_time)
+            LLM_RATE_LIMIT_WAIT.observe(remaining_time)
             await asyncio.sleep(remaining_time)
+        else:
+            LLM_RATE_LIMIT_WAIT.observe(0)
 
         self.last_call_time = time.time()
 
@@ -68,81 +106,30 @@ class Costs(NamedTuple):
     total_budget: float
 
 
-class CostManager(metaclass=Singleton):
-    """Calculate API usage costs"""
-    def __init__(self):
-        self.total_prompt_tokens = 0
-        self.total_completion_tokens = 0
-        self.total_cost = 0
-        self.total_budget = 0
-
-    def update_cost(self, prompt_tokens, completion_tokens, model):
-        """
-        Update the total cost, prompt tokens, and completion tokens.
-
-        Args:
-        prompt_tokens (int): The number of tokens used in the prompt.
-        completion_tokens (int): The number of tokens used in the completion.
-        model (str): The model used for the API call.
-        """
-        self.total_prompt_tokens += prompt_tokens
-        self.total_completion_tokens += completion_tokens
-        cost = (
-            prompt_tokens * TOKEN_COSTS[model]["prompt"]
-            + completion_tokens * TOKEN_COSTS[model]["completion"]
-        ) / 1000
-        self.total_cost += cost
-        logger.info(f"Total running cost: ${self.total_cost:.3f} | Max budget: ${CONFIG.max_budget:.3f} | "
-                    f"Current cost: ${cost:.3f}, {prompt_tokens=}, {completion_tokens=}")
-        CONFIG.total_cost = self.total_cost
-
-    def get_total_prompt_tokens(self):
-        """
-        Get the total number of prompt tokens.
-
-        Returns:
-        int: The total number of prompt tokens.
-        """
-        return self.total_prompt_tokens
-
-    def get_total_completion_tokens(self):
-        """
-        Get the total number of completion tokens.
-
-        Returns:
-        int: The total number of completion tokens.
-        """
-        return self.total_completion_tokens
-
-    def get_total_cost(self):
-        """
-        Get the total cost of API calls.
-
-        Returns:
-        float: The total cost of API calls.
-        """
-        return self.total_cost
-
-    def get_costs(self) -> Costs:
-        """Get all costs"""
-        return Costs(self.total_prompt_tokens, self.total_completion_tokens, self.total_cost, self.total_budget)
-
-
 class OpenAIGPTAPI(BaseGPTAPI, RateLimiter):
     """
     Check https://platform.openai.com/examples for examples
     """
-    def __init__(self, proxy='', api_key=''):
+    def __init__(self, proxy='', api_key='', max_tokens: Optional[int] = None, ledger: Optional[CostLedger] = None):
+        import openai
+
         self.proxy = proxy
         self.api_key = api_key
         self.__init_openai(CONFIG)
         self.llm = openai
         self.stops = None
         self.model = CONFIG.openai_api_model
-        self._cost_manager = CostManager()
+        self.max_tokens = max_tokens or CONFIG.max_tokens_rsp
+        # charged instead of the ledger of the running task when set
+        self.ledger = ledger
+        # class names of the action using this LLM, most specific first, see model_router.py
+        self.route_names = ()
         RateLimiter.__init__(self, rpm=self.rpm)
 
     def __init_openai(self, config):
+        import openai
+        import litellm
+
         if self.proxy != '':
             openai.proxy = self.proxy
         else:
@@ -160,52 +147,165 @@ class OpenAIGPTAPI(BaseGPTAPI, RateLimiter):
             litellm.api_version = config.openai_api_version
         self.rpm = int(config.get("RPM", 10))
 
-    async def _achat_completion_stream(self, messages: list[dict]) -> str:
-        response = await litellm.acompletion(
-            **self._cons_kwargs(messages),
-            stream=True
-        )
-
-        # create variables to collect the stream of chunks
-        collected_chunks = []
-        collected_messages = []
-        # iterate through the stream of events
-        async for chunk in response:
-            collected_chunks.append(chunk)  # save the event response
-            chunk_message = chunk['choices'][0]['delta']  # extract the message
-            collected_messages.append(chunk_message)  # save the message
-            if "content" in chunk_message:
-                print(chunk_message["content"], end="")
-
-        full_reply_content = ''.join([m.get('content', '') for m in collected_messages])
-        usage = self._calc_usage(messages, full_reply_content)
-        self._update_costs(usage)
+    def with_budget(self, ledger: CostLedger, max_tokens: Optional[int] = None) -> "OpenAIGPTAPI":
+        """A client of the same models and key charging `ledger`, whose completions answer in at most `max_tokens`"""
+        llm = OpenAIGPTAPI(self.proxy, self.api_key, max_tokens=max_tokens or self.max_tokens, ledger=ledger)
+        llm.model, llm.stops, llm.route_names = self.model, self.stops, self.route_names
+        return llm
+
+    def _ledger(self) -> CostLedger:
+        return self.ledger or current_ledger()
+
+    def _hedge_target(self, model: str) -> tuple[str, dict]:
+        """Model and extra arguments of a hedged request: the next model of the route, else `model` itself
+        with LLM_HEDGE_API_KEY if set"""
+        router = get_model_router()
+        if router is not None:
+            for candidate in router.candidates(self.route_names, self.model):
+                if candidate != model:
+                    return candidate, {}
+        if CONFIG.llm_hedge_api_key and provider_of(model) == "openai":
+            return model, {"api_key": CONFIG.llm_hedge_api_key}
+        return model, {}
+
+    async def _hedged(self, request, messages: list[dict], model: str, hedge: tuple, kind: str, discard) -> tuple:
+        """`request(model)`, hedged by `request(*hedge)` after the usual `kind` latency of `model`.
+
+        The caller has reserved the cost of both requests. The one that loses is paid for:
+        `discard` records the usage of a response that came too late, a cancelled request
+        is charged its prompt.
+        """
+        alternate, extra = hedge
+
+        async def paid(model, **extra):
+            try:
+                return await request(model, **extra)
+            except asyncio.CancelledError:
+                self._update_costs(self._calc_usage(messages, "", model), model)
+                raise
+
+        return await hedged(lambda: paid(model), lambda: paid(alternate, **extra), hedge_delay(model, kind), discard=discard)
+
+    async def _open_stream(self, messages: list[dict], model: str, hedge: tuple = None) -> tuple:
+        """Response, chunk iterator, first chunk and model of the first request to send a chunk"""
+        import litellm
+
+        async def request(model, **extra):
+            start = time.perf_counter()
+            response = await litellm.acompletion(**{**self._cons_kwargs(messages, model), **extra}, stream=True)
+            chunks = response.__aiter__()
+            try:
+                first = await chunks.__anext__()
+            except StopAsyncIteration:
+                first = None
+            except BaseException:
+                await _aclose(response)
+                raise
+            latency_window(model, "first_token").add(time.perf_counter() - start)
+            return response, chunks, first, model
+
+        async def discard(opened):
+            response, _, _, model = opened
+            await _aclose(response)
+            self._update_costs(self._calc_usage(messages, "", model), model)
+
+        if hedge is None:
+            return await request(model)
+        # nothing reaches the stream listeners before a request wins, the loser never shows
+        return await self._hedged(request, messages, model, hedge, "first_token", discard)
+
+    async def _achat_completion_stream(self, messages: list[dict], model: str = None, hedge: tuple = None) -> str:
+        model = model or self.model
+        start = time.perf_counter()
+        response, chunks, first, model = await self._open_stream(messages, model, hedge)
+
+        async def stream():
+            if first is not None:
+                yield first
+                async for chunk in chunks:
+                    yield chunk
+
+        # only the text of each delta is kept, listeners see it as it arrives
+        collected_contents = []
+        reported = None
+        aborted = False
+        try:
+            # iterate through the stream of events
+            async for chunk in stream():
+                # some providers end the stream with their usage, which tells the cached tokens
+                reported = chunk.get('usage') or reported
+                if not chunk['choices']:
+                    continue
+                chunk_message = chunk['choices'][0]['delta']  # extract the message
+                content = chunk_message.get('content')
+                if content:
+                    if not collected_contents:
+                        first_token = time.perf_counter() - start
+                        set_span_attributes(first_token_s=first_token)
+                        LLM_FIRST_TOKEN.observe(first_token, model=model)
+                    collected_contents.append(content)
+                    notify_stream(content)
+        except BaseException:
+            # a listener aborted the completion, the connection failed or the call was cancelled:
+            # stop the generation, and the listeners don't judge the cut response
+            aborted = True
+            await _aclose(response)
+            raise
+        finally:
+            # the tokens of an aborted completion are paid for too
+            full_reply_content = ''.join(collected_contents)
+            usage = self._calc_usage(messages, full_reply_content, model)
+            self._update_costs(usage, model, reported)
+            close_stream(aborted)
+
         return full_reply_content
 
-    def _cons_kwargs(self, messages: list[dict]) -> dict:
-        if CONFIG.openai_api_type == 'azure':
+    def _cons_kwargs(self, messages: list[dict], model: str = None) -> dict:
+        model = model or self.model
+        if CONFIG.openai_api_type == 'azure' and provider_of(model) == "openai":
             kwargs = {
                 "deployment_id": CONFIG.deployment_id,
                 "messages": messages,
-                "max_tokens": CONFIG.max_tokens_rsp,
+                "max_tokens": self.max_tokens,
                 "n": 1,
                 "stop": self.stops,
                 "temperature": 0.3
             }
         else:
             kwargs = {
-                "model": self.model,
-                "messages": messages,
-                "max_tokens": CONFIG.max_tokens_rsp,
+                "model": model,
+                "messages": mark_prefix(messages, model),
+                "max_tokens": self.max_tokens,
                 "n": 1,
                 "stop": self.stops,
-                "temperature": 0.3
+                "temperature": 0.3,
+                **completion_kwargs(model)
             }
         return kwargs
 
-    async def _achat_completion(self, messages: list[dict]) -> dict:
-        rsp = await self.llm.ChatCompletion.acreate(**self._cons_kwargs(messages))
-        self._update_costs(rsp.get('usage'))
+    async def _achat_completion(self, messages: list[dict], model: str = None, hedge: tuple = None) -> dict:
+        model = model or self.model
+
+        async def request(model, **extra):
+            start = time.perf_counter()
+            kwargs = {**self._cons_kwargs(messages, model), **extra}
+            if provider_of(model) == "openai":
+                rsp = await self.llm.ChatCompletion.acreate(**kwargs)
+            else:
+                import litellm
+                rsp = await litellm.acompletion(**kwargs)
+            latency_window(model, "completion").add(time.perf_counter() - start)
+            return rsp, model
+
+        async def discard(answered):
+            rsp, model = answered
+            self._update_costs(rsp.get('usage'), model)
+
+        if hedge is None:
+            rsp, model = await request(model)
+        else:
+            rsp, model = await self._hedged(request, messages, model, hedge, "completion", discard)
+        self._update_costs(rsp.get('usage'), model)
         return rsp
 
     def _chat_completion(self, messages: list[dict]) -> dict:
@@ -226,16 +326,96 @@ class OpenAIGPTAPI(BaseGPTAPI, RateLimiter):
     @retry(max_retries=6)
     async def acompletion_text(self, messages: list[dict], stream=False) -> str:
         """when streaming, print each token in place."""
-        if stream:
-            return await self._achat_completion_stream(messages)
-        rsp = await self._achat_completion(messages)
-        return self.get_choice_text(rsp)
-
-    def _calc_usage(self, messages: list[dict], rsp: str) -> dict:
+        router = get_model_router()
+        cache = get_response_cache()
+        if cache is not None:
+            # keyed by the declared models, whichever of them answers
+            models = router.route(self.route_names, self.model) if router else [self.model]
+            key = cache.make_key(model=",".join(models), messages=messages, max_tokens=self.max_tokens, stop=self.stops)
+            text = cache.get(key)
+            if text is not None:
+                set_span_attributes(cache_hit=True)
+                LLM_REQUESTS.inc(model=models[0], status="cached")
+                if stream:
+                    # replay the cached response to the stream listeners
+                    notify_stream(text)
+                    close_stream()
+                return text
+
+        if router is None:
+            text = await self._completion_text(messages, stream, self.model)
+        else:
+            candidates = router.candidates(self.route_names, self.model)
+            for i, model in enumerate(candidates):
+                start = time.perf_counter()
+                try:
+                    text = await self._completion_text(messages, stream, model)
+                except (NoMoneyException, MalformedOutputError, DeadlineExceeded):
+                    # the budget, the response or the deadline is at fault, not the model
+                    raise
+                except Exception as e:
+                    router.record_failure(model, e)
+                    if i == len(candidates) - 1:
+                        raise
+                    logger.warning(f"{model} failed ({e!r}), falling back to {candidates[i + 1]}")
+                    continue
+                router.record_success(model, time.perf_counter() - start)
+                set_span_attributes(model=model)
+                break
+
+        if cache is not None:
+            cache.set(key, text)
+        return text
+
+    async def _completion_text(self, messages: list[dict], stream: bool, model: str) -> str:
+        # the worst case cost is held until the real usage is recorded
+        ledger = self._ledger()
+        reserved = ledger.reserve(self.estimate_cost(messages, model)) if ledger.remaining is not None else 0.0
+        hedge = None
+        if CONFIG.llm_hedge:
+            # a hedged call may pay for two requests, it isn't hedged if the budget can't cover both
+            alternate, extra = self._hedge_target(model)
+            try:
+                if ledger.remaining is not None:
+                    reserved += ledger.reserve(self.estimate_cost(messages, alternate))
+                hedge = (alternate, extra)
+            except NoMoneyException:
+                logger.debug(f"Not hedging {model}, the budget can't cover a second request")
+        prefix = stable_prefix(messages)
+        if prefix:
+            prefix_tokens = count_message_tokens(prefix, model)
+            set_span_attributes(prefix_tokens=prefix_tokens,
+                                prefix_hit=get_prefix_tracker().observe(model, prefix, prefix_tokens))
+        start, status = time.perf_counter(), "error"
+        try:
+            # bounded by LLM_TIMEOUT and the time left to the task
+            if stream:
+                text = await run_with_deadline(self._achat_completion_stream(messages, model, hedge), CONFIG.llm_timeout)
+            else:
+                rsp = await run_with_deadline(self._achat_completion(messages, model, hedge), CONFIG.llm_timeout)
+                text = self.get_choice_text(rsp)
+            status = "ok"
+        finally:
+            latency = time.perf_counter() - start
+            ledger.release(reserved)
+            ledger.record(calls=1, latency=latency)
+            LLM_REQUESTS.inc(model=model, status=status)
+            LLM_LATENCY.observe(latency, model=model)
+        return text
+
+    def estimate_cost(self, messages: list[dict], model: str = None) -> float:
+        """Cost of the call if the completion uses all of its max tokens, MAX_TOKENS by default"""
+        model = model or self.model
+        prompt_tokens = count_message_tokens(messages, model)
+        costs = model_costs(model)
+        return (prompt_tokens * costs["prompt"] + self.max_tokens * costs["completion"]) / 1000
+
+    def _calc_usage(self, messages: list[dict], rsp: str, model: str = None) -> dict:
         """Calculate API usage costs"""
+        model = model or self.model
         usage = {}
-        prompt_tokens = count_message_tokens(messages, self.model)
-        completion_tokens = count_string_tokens(rsp, self.model)
+        prompt_tokens = count_message_tokens(messages, model)
+        completion_tokens = count_string_tokens(rsp, model)
         usage['prompt_tokens'] = prompt_tokens
         usage['completion_tokens'] = completion_tokens
         return usage
@@ -246,12 +426,12 @@ class OpenAIGPTAPI(BaseGPTAPI, RateLimiter):
         all_results = []
 
         for small_batch in split_batches:
-            logger.info(small_batch)
+            logger.opt(lazy=True).info("{}", lambda: clip(small_batch))
             await self.wait_if_needed(len(small_batch))
 
             future = [self.acompletion(prompt) for prompt in small_batch]
             results = await asyncio.gather(*future)
-            logger.info(results)
+            logger.opt(lazy=True).info("{}", lambda: clip(results))
             all_results.extend(results)
 
         return all_results
@@ -263,13 +443,33 @@ class OpenAIGPTAPI(BaseGPTAPI, RateLimiter):
         for idx, raw_result in enumerate(raw_results, start=1):
             result = self.get_choice_text(raw_result)
             results.append(result)
-            logger.info(f"Result of task {idx}: {result}")
+            logger.opt(lazy=True).info("Result of task {}: {}", lambda: idx, lambda: clip(result))
         return results
 
-    def _update_costs(self, usage: dict):
+    def _update_costs(self, usage: dict, model: str = None, reported: dict = None):
+        """Record `usage`, with the cached tokens of the provider's `reported` usage if it differs"""
+        model = model or self.model
         prompt_tokens = int(usage['prompt_tokens'])
         completion_tokens = int(usage['completion_tokens'])
-        self._cost_manager.update_cost(prompt_tokens, completion_tokens, self.model)
+        # read from the provider's prefix cache, at the "cached" price of MODEL_COSTS if there is one
+        cached_tokens = min(reported_cached_tokens(reported or usage), prompt_tokens)
+        add_to_span("prompt_tokens", prompt_tokens)
+        add_to_span("completion_tokens", completion_tokens)
+        LLM_TOKENS.observe(prompt_tokens, model=model, kind="prompt")
+        LLM_TOKENS.observe(completion_tokens, model=model, kind="completion")
+        if cached_tokens:
+            add_to_span("cached_tokens", cached_tokens)
+            LLM_TOKENS.observe(cached_tokens, model=model, kind="cached")
+        costs = model_costs(model)
+        cost = ((prompt_tokens - cached_tokens) * costs["prompt"] + cached_tokens * costs.get("cached", costs["prompt"])
+                + completion_tokens * costs["completion"]) / 1000
+        ledger = self._ledger()
+        ledger.record(prompt_tokens=prompt_tokens, cached_tokens=cached_tokens, completion_tokens=completion_tokens,
+                      total_cost=cost)
+        logger.info(f"Total running cost: ${ledger.total_cost:.3f} | Max budget: ${ledger.budget:.3f} | "
+                    f"Current cost: ${cost:.3f}, {prompt_tokens=}, {completion_tokens=}")
 
     def get_costs(self) -> Costs:
-        return self._cost_manager.get_costs()
+        """Usage of the running task, or of the ledger of this client"""
+        ledger = self._ledger()
+        return Costs(ledger.prompt_tokens, ledger.completion_tokens, ledger.total_cost, ledger.budget)
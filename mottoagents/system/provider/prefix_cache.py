@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File    : prefix_cache.py
+@Desc    : make prompts reusable by the prefix caches of providers and measure how often they are
+
+Actions send their static instructions and the role as system messages and only what
+changes from call to call as the last message, so every message but the last is the
+stable prefix of a call. Providers reuse the computation of a prefix they have seen
+recently: OpenAI does it by itself for prefixes of 1024 tokens or more, Anthropic for the
+blocks marked with `cache_control` (`mark_prefix`), and Ollama as long as the model stays
+loaded (`OLLAMA_KEEP_ALIVE`).
+
+PrefixTracker remembers the prefixes sent to each model for PROMPT_CACHE_TTL seconds, the
+hits it counts are the calls a provider could serve from its cache. The cached tokens the
+providers report are counted separately, as LLM tokens of kind `cached`.
+"""
+import hashlib
+import json
+import threading
+import time
+from typing import Optional
+
+from mottoagents.system.config import CONFIG
+from mottoagents.system.metrics import REGISTRY
+from mottoagents.system.provider.model_router import provider_of
+
+PREFIX_LOOKUPS = REGISTRY.counter("mottoagents_llm_prefix_lookups_total",
+                                  "LLM calls by whether their prompt prefix was recently sent", ["model", "result"])
+PREFIX_TOKENS = REGISTRY.counter("mottoagents_llm_prefix_tokens_total",
+                                 "Prompt prefix tokens by whether they were recently sent", ["model", "result"])
+
+
+def stable_prefix(messages: list[dict]) -> list[dict]:
+    """The messages every call of the same action and role starts with"""
+    return messages[:-1]
+
+
+def mark_prefix(messages: list[dict], model: str) -> list[dict]:
+    """`messages` with the end of the prefix marked for the providers that need it"""
+    if not CONFIG.prompt_cache or provider_of(model) != "anthropic" or len(messages) < 2:
+        return messages
+    last = messages[-2]
+    if not isinstance(last.get("content"), str):
+        return messages
+    block = {"type": "text", "text": last["content"], "cache_control": {"type": "ephemeral"}}
+    return [*messages[:-2], {**last, "content": [block]}, messages[-1]]
+
+
+def _field(obj, name: str):
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+
+def reported_cached_tokens(usage) -> int:
+    """Prompt tokens a provider says it read from its cache, 0 if it doesn't say"""
+    if not usage:
+        return 0
+    details = _field(usage, "prompt_tokens_details")
+    cached = _field(details, "cached_tokens") if details else None
+    return int(cached or _field(usage, "cache_read_input_tokens") or 0)
+
+
+class PrefixTracker:
+    """Prompt prefixes sent to each model lately
+
+    Attributes:
+        ttl (float): Seconds a provider keeps a prefix after its last use
+        min_tokens (int): Shortest prefix a provider caches
+    """
+
+    def __init__(self, ttl: float = 300, min_tokens: int = 1024):
+        self.ttl = ttl
+        self.min_tokens = min_tokens
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def observe(self, model: str, prefix: list[dict], tokens: int) -> Optional[bool]:
+        """Whether `prefix` was sent to `model` within the TTL, None if it is too short to be cached"""
+        # Ollama reuses whatever it has computed for the loaded model
+        min_tokens = 0 if provider_of(model) == "ollama" else self.min_tokens
+        if not prefix or tokens < min_tokens:
+            return None
+        digest = hashlib.sha1(json.dumps(prefix, sort_keys=True).encode("utf-8")).hexdigest()
+        now = time.monotonic()
+        with self._lock:
+            last = self._seen.get((model, digest))
+            self._seen[(model, digest)] = now
+            if len(self._seen) > 4096:
+                self._seen = {key: seen for key, seen in self._seen.items() if now - seen < self.ttl}
+        hit = last is not None and now - last < self.ttl
+        result = "hit" if hit else "miss"
+        PREFIX_LOOKUPS.inc(model=model, result=result)
+        PREFIX_TOKENS.inc(tokens, model=model, result=result)
+        return hit
+
+    def report(self) -> dict:
+        """Hit rate of the calls and of the prefix tokens of each model"""
+        report = {}
+        lookups, tokens = PREFIX_LOOKUPS.samples(), PREFIX_TOKENS.samples()
+        for samples, kind in ((lookups, "calls"), (tokens, "tokens")):
+            for _, _, (model, result), value in samples:
+                report.setdefault(model, {}).setdefault(kind, {"hit": 0, "miss": 0})[result] = value
+        for counts in report.values():
+            for kind in list(counts):
+                total = counts[kind]["hit"] + counts[kind]["miss"]
+                counts[f"{kind}_hit_rate"] = counts[kind]["hit"] / total if total else 0.0
+        return report
+
+
+_tracker = None
+
+
+def get_prefix_tracker() -> PrefixTracker:
+    """The process wide tracker"""
+    global _tracker
+    if _tracker is None:
+        _tracker = PrefixTracker(CONFIG.prompt_cache_ttl, CONFIG.prompt_cache_min_tokens)
+    return _tracker
+
+
+def set_prefix_tracker(tracker: Optional[PrefixTracker]):
+    global _tracker
+    _tracker = tracker
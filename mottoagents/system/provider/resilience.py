@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File    : resilience.py
+@Desc    : retries classified by error and hedged LLM requests
+
+A failed call is retried according to the kind of its error: timeouts and server errors
+soon, rate limits after their Retry-After or a longer backoff, and budget, deadline,
+malformed output and invalid request errors not at all. Delays are jittered and never
+go past the task's deadline.
+
+A hedged call starts a second request, to the next model of the route or the same one,
+when the first hasn't answered after the LLM_HEDGE_PERCENTILE of the model's recent
+times to first token, or of its completions when not streaming, and at least
+LLM_HEDGE_DELAY. Whichever answers first is used and the other is cancelled.
+"""
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from mottoagents.system.config import CONFIG
+from mottoagents.system.deadline import DeadlineExceeded
+from mottoagents.system.metrics import REGISTRY
+from mottoagents.system.provider.model_router import is_rate_limited
+from mottoagents.system.utils.block_parser import MalformedOutputError
+from mottoagents.system.utils.common import NoMoneyException, backoff_delay
+
+T = TypeVar("T")
+
+LLM_ERRORS = REGISTRY.counter("mottoagents_llm_errors_total", "Failed LLM calls by kind of error", ["kind"])
+LLM_HEDGES = REGISTRY.counter("mottoagents_llm_hedges_total", "Hedged LLM calls by the request that answered", ["winner"])
+
+# errors that fail the same way however often they are retried
+FATAL = {"budget", "deadline", "malformed", "invalid"}
+_INVALID_STATUS = {400, 401, 403, 404, 422}
+_INVALID_NAMES = ("AuthenticationError", "InvalidRequestError", "BadRequestError", "PermissionDeniedError",
+                  "NotFoundError", "ContextWindowExceededError")
+_SERVER_NAMES = ("APIConnectionError", "ServiceUnavailableError", "InternalServerError", "APIError")
+
+
+def classify_error(error: BaseException) -> str:
+    """One of budget, deadline, malformed, invalid, rate_limit, timeout, server or unknown"""
+    if isinstance(error, NoMoneyException):
+        return "budget"
+    if isinstance(error, DeadlineExceeded):
+        return "deadline"
+    if isinstance(error, MalformedOutputError):
+        return "malformed"
+    if is_rate_limited(error):
+        return "rate_limit"
+    name = type(error).__name__
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)) or "Timeout" in name:
+        return "timeout"
+    status = getattr(error, "status_code", None)
+    if status in _INVALID_STATUS or name in _INVALID_NAMES:
+        return "invalid"
+    if (isinstance(status, int) and status >= 500) or name in _SERVER_NAMES or isinstance(error, ConnectionError):
+        return "server"
+    return "unknown"
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay(kind: str, attempt: int, error: BaseException = None) -> float:
+    """Seconds to wait before retry number `attempt` (from 0) of an error of `kind`"""
+    if kind == "rate_limit":
+        after = _retry_after(error) if error is not None else None
+        return after if after is not None else backoff_delay(attempt, base=2, cap=60)
+    if kind in ("timeout", "server"):
+        return backoff_delay(attempt, base=0.5, cap=8)
+    return backoff_delay(attempt, base=1, cap=30)
+
+
+class LatencyWindow:
+    """The most recent latencies of a model"""
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """The `p`th percentile, None until there are `min_samples` samples"""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+_windows = {}
+
+
+def latency_window(model: str, kind: str) -> LatencyWindow:
+    """Recent times to the first token (`first_token`) or of whole completions (`completion`) of `model`"""
+    window = _windows.get((model, kind))
+    if window is None:
+        window = _windows[(model, kind)] = LatencyWindow()
+    return window
+
+
+def hedge_delay(model: str, kind: str) -> float:
+    """Seconds to wait for `model` before hedging, at least LLM_HEDGE_DELAY"""
+    observed = latency_window(model, kind).percentile(CONFIG.llm_hedge_percentile)
+    return max(CONFIG.llm_hedge_delay, observed or 0)
+
+
+async def hedged(primary: Callable[[], Awaitable[T]], hedge: Callable[[], Awaitable[T]], delay: float,
+                 discard: Callable[[T], Awaitable] = None) -> T:
+    """The result of `primary`, or of `hedge` started after `delay` seconds if it answers first.
+
+    The slower request is cancelled, `discard` releases its result if both finish together.
+    If one of them fails the other one is still awaited. When the caller is cancelled, or
+    times out, both requests are cancelled.
+    """
+    first = asyncio.ensure_future(primary())
+    second, winner = None, None
+    try:
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            winner = first
+            return first.result()
+
+        second = asyncio.ensure_future(hedge())
+        pending = {first, second}
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in (first, second):
+                if task in done and winner is None and not task.cancelled() and task.exception() is None:
+                    winner = task
+        if winner is None:
+            # both failed, the error of the primary request is the one reported
+            return first.result()
+        LLM_HEDGES.inc(winner="hedge" if winner is second else "primary")
+        return winner.result()
+    finally:
+        for task in (first, second):
+            if task is None:
+                continue
+            if not task.done():
+                task.cancel()
+            elif task is not winner and discard is not None and not task.cancelled() and task.exception() is None:
+                await discard(task.result())
@@ -16,6 +16,7 @@ class SearchEngineType(Enum):
     SERPER_GOOGLE = "serper"
     DIRECT_GOOGLE = "google"
     DUCK_DUCK_GO = "ddg"
+    LOCAL = "local"
     CUSTOM_ENGINE = "custom"
 
 
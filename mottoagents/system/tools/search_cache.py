@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File    : search_cache.py
+@Desc    : cache of search results shared by every SearchEngine of a process
+
+Results are keyed by engine, normalized query and parameters and expire after
+`SEARCH_CACHE_TTL` seconds (0 disables the cache). They are stored like the LLM responses,
+in an LRU of `SEARCH_CACHE_SIZE` entries or with diskcache in `SEARCH_CACHE_DIR`.
+Identical queries running at the same time share a single request.
+"""
+import asyncio
+import hashlib
+import json
+import re
+from typing import Any, Awaitable, Callable, Optional
+
+from mottoagents.system.config import CONFIG
+from mottoagents.system.utils.cache import ResponseCache
+
+
+def normalize_query(query: str) -> str:
+    # line breaks are kept, they separate the items of multi-line queries
+    lines = (re.sub(r"[ \t]+", " ", line).strip() for line in query.lower().splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+class SearchCache(ResponseCache):
+    def __init__(self, ttl: float = 3600, size: int = 256, directory: Optional[str] = None):
+        super().__init__(size=size, directory=directory, ttl=ttl, name="search")
+        self._inflight = {}
+
+    @staticmethod
+    def make_key(engine: str, query: str, **params) -> str:
+        raw = json.dumps([engine, normalize_query(query), params], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value, or run `fetch` once for all concurrent callers of the same key"""
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        loop = asyncio.get_running_loop()
+        future = self._inflight.get(key)
+        if future is not None and future.get_loop() is loop:
+            await asyncio.wait({future})
+            if not future.cancelled():
+                return future.result()
+            # the caller doing the request was cancelled, take over
+            return await self.get_or_fetch(key, fetch)
+
+        future = loop.create_future()
+        self._inflight[key] = future
+        try:
+            value = await fetch()
+        except Exception as e:
+            future.set_exception(e)
+            # the waiters see the exception, don't warn when there are none
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            future.set_result(value)
+            # empty results are not worth keeping, the next call tries again
+            if value:
+                self.set(key, value)
+            return value
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+
+_search_cache = None
+
+
+def get_search_cache() -> Optional[SearchCache]:
+    """The cache of search results, None when SEARCH_CACHE_TTL is 0"""
+    global _search_cache
+    ttl = float(CONFIG.search_cache_ttl)
+    if _search_cache is None and ttl > 0:
+        _search_cache = SearchCache(ttl=ttl, size=CONFIG.search_cache_size, directory=CONFIG.search_cache_dir)
+    return _search_cache
+
+
+def set_search_cache(cache: Optional[SearchCache]):
+    global _search_cache
+    _search_cache = cache
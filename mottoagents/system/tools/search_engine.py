@@ -12,16 +12,54 @@ SerpAPI, and custom search implementations.
 """
 from __future__ import annotations
 
+import asyncio
+import functools
+import inspect
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
-from mottoagents.system.config import Config
-from mottoagents.system.logs import logger
+from mottoagents.system.config import CONFIG
+from mottoagents.system.logs import clip, logger
+from mottoagents.system.metrics import REGISTRY
+from mottoagents.system.tracing import span
+from .search_cache import get_search_cache
+from .search_engine_local import get_local_search
 from .search_engine_serpapi import SerpAPIWrapper
 from .search_engine_serper import SerperWrapper
 
-config = Config()
 from mottoagents.system.tools import SearchEngineType
 
+_executor = None
+
+
+def _search_executor() -> ThreadPoolExecutor:
+    """Bounded pool for the blocking search clients, so they never run on the event loop"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=CONFIG.search_workers, thread_name_prefix="search")
+    return _executor
+
+
+async def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_search_executor(), functools.partial(func, *args, **kwargs))
+
+
+SEARCH_LATENCY = REGISTRY.histogram("mottoagents_search_latency_seconds", "Duration of search requests, cache hits excluded",
+                                    ["engine", "status"])
+
+
+@contextmanager
+def _observe_request(engine: str):
+    start, status = time.perf_counter(), "error"
+    try:
+        yield
+        status = "ok"
+    finally:
+        SEARCH_LATENCY.observe(time.perf_counter() - start, engine=engine, status=status)
+
 
 class SearchEngine:
     """Search engine interface supporting multiple backend implementations.
@@ -31,6 +69,7 @@ class SearchEngine:
     - Direct Google search
     - SerpAPI Google search
     - Serper Google search
+    - Local BM25 search over a directory of documents
     - Custom search implementations
     
     Note: For Google search, a global proxy (like Proxifier) may be required.
@@ -40,20 +79,24 @@ class SearchEngine:
         run_func (callable): Custom search function for custom implementations
         engine (SearchEngineType): The search engine to use
         serpapi_api_key (str): API key for SerpAPI
+        timeout (float): Seconds a search may take
     """
 
-    def __init__(self, engine=None, run_func=None, serpapi_api_key=None):
+    def __init__(self, engine=None, run_func=None, serpapi_api_key=None, timeout=None):
         """Initialize the search engine.
         
         Args:
             engine (SearchEngineType, optional): Search engine to use
-            run_func (callable, optional): Custom search function
+            run_func (callable, optional): Custom search function, sync or async
             serpapi_api_key (str, optional): SerpAPI key
+            timeout (float, optional): Seconds a search may take, defaults to the engine's configured timeout
         """
-        self.config = Config()
+        self.config = CONFIG
         self.run_func = run_func
-        self.engine = engine or self.config.search_engine
+        self.engine = SearchEngineType(engine or self.config.search_engine)
         self.serpapi_api_key = serpapi_api_key
+        self.timeout = timeout or self.config.search_timeouts.get(self.engine.value, self.config.search_timeout)
+        self._api = None
 
     @classmethod
     def run_google(cls, query, max_results=8):
@@ -67,12 +110,26 @@ class SearchEngine:
             list: Search results
         """
         results = google_official_search(query, num_results=max_results)
-        logger.info(results)
+        logger.opt(lazy=True).info("{}", lambda: clip(results))
         return results
 
+    def _get_api(self):
+        """Get the API wrapper of the engine, it is created once and reused for every query"""
+        if self._api is None:
+            if self.engine == SearchEngineType.SERPAPI_GOOGLE:
+                self._api = SerpAPIWrapper(serpapi_api_key=self.serpapi_api_key)
+            elif self.engine == SearchEngineType.SERPER_GOOGLE:
+                self._api = SerperWrapper()
+            elif self.engine == SearchEngineType.LOCAL:
+                self._api = get_local_search()
+        return self._api
+
     async def run(self, query: str, max_results=8):
         """Execute a search using the configured search engine.
         
+        Results are served from the search cache when possible, and identical
+        queries running at the same time share one request.
+        
         Args:
             query (str): Search query
             max_results (int): Maximum number of results to return
@@ -82,20 +139,112 @@ class SearchEngine:
             
         Raises:
             NotImplementedError: If the selected engine is not supported
+            asyncio.TimeoutError: If the search takes longer than the timeout
         """
+        # a search span without a search.request child was answered by the cache
+        with span("search", engine=self.engine.value, query=query):
+            cache = self._get_cache()
+            if cache is None:
+                return await self._run(query, max_results)
+
+            key = cache.make_key(self._cache_engine(), query, max_results=max_results)
+            return await cache.get_or_fetch(key, lambda: self._run(query, max_results))
+
+    async def _run(self, query: str, max_results=8):
+        with span("search.request", engine=self.engine.value), _observe_request(self.engine.value):
+            return await asyncio.wait_for(self._search(query, max_results), timeout=self.timeout)
+
+    def _get_cache(self):
+        # the local index is as fast as the cache and has to see new documents
+        return None if self.engine == SearchEngineType.LOCAL else get_search_cache()
+
+    def _cache_engine(self, kind: str = "") -> str:
+        engine = self.engine.value + kind
+        if self.engine == SearchEngineType.CUSTOM_ENGINE:
+            engine += f":{getattr(self.run_func, '__qualname__', repr(self.run_func))}"
+        return engine
+
+    async def results(self, query: str, max_results=8) -> list[dict]:
+        """Search and return the ranked results as a list of {title, snippet, link} dicts.
+
+        Used by the fan-out search to merge the rankings of several engines. Custom
+        engines returning text give a single result holding it as the snippet.
+
+        Raises:
+            ValueError: If the engine reports an error
+            asyncio.TimeoutError: If the search takes longer than the timeout
+        """
+        return (await self.results_many([query], max_results))[0]
+
+    async def results_many(self, queries: list[str], max_results=8) -> list[list[dict]]:
+        """Ranked results of every query, Serper answers all uncached queries in one request"""
+        with span("search", engine=self.engine.value, query="\n".join(queries)):
+            return await self._results_many(queries, max_results)
+
+    async def _results_many(self, queries: list[str], max_results=8) -> list[list[dict]]:
+        cache = self._get_cache()
+        keys = [cache.make_key(self._cache_engine(":results"), query, max_results=max_results) if cache else None
+                for query in queries]
+        results = [cache.get(key) if cache else None for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if not missing:
+            return results
+
+        if self.engine == SearchEngineType.SERPER_GOOGLE:
+            fetched = await asyncio.wait_for(self._search_results([queries[i] for i in missing], max_results),
+                                             timeout=self.timeout)
+            if cache:
+                for i, result in zip(missing, fetched):
+                    if result:
+                        cache.set(keys[i], result)
+        else:
+            async def fetch(query):
+                return (await asyncio.wait_for(self._search_results([query], max_results), timeout=self.timeout))[0]
+
+            fetched = await asyncio.gather(*[
+                cache.get_or_fetch(keys[i], functools.partial(fetch, queries[i])) if cache else fetch(queries[i])
+                for i in missing
+            ])
+        for i, result in zip(missing, fetched):
+            results[i] = result
+        return results
+
+    async def _search_results(self, queries: list[str], max_results=8) -> list[list[dict]]:
+        with span("search.request", engine=self.engine.value, queries=len(queries)), _observe_request(self.engine.value):
+            return await self._fetch_results(queries, max_results)
+
+    async def _fetch_results(self, queries: list[str], max_results=8) -> list[list[dict]]:
+        if self.engine == SearchEngineType.SERPER_GOOGLE:
+            rsp = await self._get_api().results(queries)
+            return [SerperWrapper._process_results(res)[:max_results] for res in rsp]
+
+        query, = queries
         if self.engine == SearchEngineType.SERPAPI_GOOGLE:
-            if self.serpapi_api_key is not None:
-                api = SerpAPIWrapper(serpapi_api_key=self.serpapi_api_key)
-            else:
-                api = SerpAPIWrapper()
-            rsp = await api.run(query)
+            rsp = SerpAPIWrapper._process_results(await self._get_api().results(query))
         elif self.engine == SearchEngineType.DIRECT_GOOGLE:
-            rsp = SearchEngine.run_google(query, max_results)
-        elif self.engine == SearchEngineType.SERPER_GOOGLE:
-            api = SerperWrapper()
-            rsp = await api.run(query)
+            rsp = await run_blocking(google_official_search, query, num_results=max_results)
+            if isinstance(rsp, str):
+                raise ValueError(rsp)
+        elif self.engine == SearchEngineType.LOCAL:
+            rsp = await run_blocking(self._get_api().results, query, max_results)
+        else:
+            rsp = await self._search(query, max_results)
+            if not isinstance(rsp, list):
+                rsp = [{"snippet": str(rsp)}] if rsp else []
+        return [rsp[:max_results]]
+
+    async def _search(self, query: str, max_results=8):
+        if self.engine in (SearchEngineType.SERPAPI_GOOGLE, SearchEngineType.SERPER_GOOGLE):
+            rsp = await self._get_api().run(query)
+        elif self.engine == SearchEngineType.DIRECT_GOOGLE:
+            rsp = await run_blocking(SearchEngine.run_google, query, max_results)
+        elif self.engine == SearchEngineType.LOCAL:
+            rsp = await run_blocking(self._get_api().run, query, max_results)
         elif self.engine == SearchEngineType.CUSTOM_ENGINE:
-            rsp = self.run_func(query)
+            if inspect.iscoroutinefunction(self.run_func):
+                rsp = await self.run_func(query)
+            else:
+                rsp = await run_blocking(self.run_func, query)
         else:
             raise NotImplementedError
         return rsp
@@ -119,8 +268,8 @@ def google_official_search(query: str, num_results: int = 8, focus=['snippet', '
     from googleapiclient.errors import HttpError
 
     try:
-        api_key = config.google_api_key
-        custom_search_engine_id = config.google_cse_id
+        api_key = CONFIG.google_api_key
+        custom_search_engine_id = CONFIG.google_cse_id
 
         with build("customsearch", "v1", developerKey=api_key) as service:
             result = (
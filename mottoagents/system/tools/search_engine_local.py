@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File    : search_engine_local.py
+@Desc    : offline search engine over a directory of documents
+
+Files under `LOCAL_SEARCH_DIR` are split into chunks (Markdown by paragraphs, every other
+format through `document_store.document.read_data`) and kept in a BM25 inverted index.
+The directory is rescanned at most every `LOCAL_SEARCH_REFRESH` seconds and only added,
+changed or deleted files are reindexed. With `LOCAL_SEARCH_INDEX` the index is pickled
+so later runs start warm. `LOCAL_SEARCH_RERANK` reorders the best BM25 candidates by
+embedding similarity with FAISS, which needs the embedding API.
+"""
+import math
+import pickle
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Optional
+
+from mottoagents.system.config import CONFIG
+from mottoagents.system.logs import logger
+
+TEXT_SUFFIXES = (".md", ".markdown")
+DATA_SUFFIXES = (".txt", ".csv", ".json", ".xlsx", ".doc", ".docx", ".pdf")
+INDEX_VERSION = 1
+
+_token_pattern = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> list[str]:
+    return _token_pattern.findall(text.lower())
+
+
+def split_text(text: str, chunk_size: int = 1000) -> list[str]:
+    """Paragraphs of `text`, short consecutive ones are joined up to `chunk_size` characters"""
+    chunks = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) > chunk_size:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def load_chunks(path: Path, chunk_size: int = 1000) -> list[str]:
+    if path.suffix in TEXT_SUFFIXES:
+        return split_text(path.read_text(encoding="utf-8", errors="ignore"), chunk_size)
+
+    from mottoagents.system.document_store.document import read_data
+
+    data = read_data(path)
+    if isinstance(data, list):
+        return [doc.page_content for doc in data if doc.page_content.strip()]
+    # a DataFrame, use its content column or every column of the row
+    if "content" in data.columns:
+        return [str(content) for content in data["content"] if str(content).strip()]
+    return ["\n".join(f"{col}: {value}" for col, value in row.items()) for _, row in data.iterrows()]
+
+
+class BM25Index:
+    """Inverted index of text chunks ranked with Okapi BM25"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)  # term -> {doc id: term frequency}
+        self.docs = {}  # doc id -> result dict, its length and its terms
+        self.total_length = 0
+        self._next_id = 0
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add(self, text: str, **meta) -> int:
+        doc_id = self._next_id
+        self._next_id += 1
+        counts = Counter(tokenize(text))
+        for term, count in counts.items():
+            self.postings[term][doc_id] = count
+        length = sum(counts.values())
+        self.docs[doc_id] = {"snippet": text, **meta, "length": length, "terms": tuple(counts)}
+        self.total_length += length
+        return doc_id
+
+    def remove(self, doc_id: int):
+        doc = self.docs.pop(doc_id)
+        self.total_length -= doc["length"]
+        for term in doc["terms"]:
+            postings = self.postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self.postings[term]
+
+    def search(self, query: str, k: int = 8) -> list[tuple[int, float]]:
+        """Best `k` (doc id, score) pairs, ties are broken by doc id to stay reproducible"""
+        if not self.docs:
+            return []
+        n = len(self.docs)
+        avg_length = self.total_length / n or 1
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                length = self.docs[doc_id]["length"]
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / avg_length))
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+
+class LocalSearch:
+    """Search engine over the documents of a directory.
+
+    Attributes:
+        directory (Path): Root of the corpus, searched recursively
+        index_path (Path): Pickle of the index, optional
+        rerank (bool): Reorder the BM25 candidates by embedding similarity
+        refresh_interval (float): Seconds between two scans of the directory
+    """
+
+    def __init__(self, directory, index_path=None, rerank: bool = False, refresh_interval: float = 5,
+                 chunk_size: int = 1000):
+        self.directory = Path(directory)
+        self.index_path = Path(index_path) if index_path else None
+        self.rerank = rerank
+        self.refresh_interval = refresh_interval
+        self.chunk_size = chunk_size
+        self.index = BM25Index()
+        self.files = {}  # path -> (mtime_ns, size, doc ids)
+        self.vectors = {}  # doc id -> embedding, filled by the rerank
+        self._refreshed_at = None
+        self._embeddings = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not (self.index_path and self.index_path.exists()):
+            return
+        with open(self.index_path, "rb") as f:
+            state = pickle.load(f)
+        if state.get("version") != INDEX_VERSION or state.get("directory") != str(self.directory.resolve()):
+            logger.info(f"Ignore the local search index {self.index_path}, it was built for another corpus")
+            return
+        self.index, self.files, self.vectors = state["index"], state["files"], state["vectors"]
+
+    def _persist(self):
+        if not self.index_path:
+            return
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        state = {"version": INDEX_VERSION, "directory": str(self.directory.resolve()),
+                 "index": self.index, "files": self.files, "vectors": self.vectors}
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f)
+        tmp_path.replace(self.index_path)
+
+    def _remove_file(self, path: str):
+        for doc_id in self.files.pop(path)[2]:
+            self.index.remove(doc_id)
+            self.vectors.pop(doc_id, None)
+
+    def refresh(self, force: bool = False) -> int:
+        """Reindex the files added, changed or deleted since the last scan, returns their number"""
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._refreshed_at is not None and now - self._refreshed_at < self.refresh_interval:
+                return 0
+            self._refreshed_at = now
+            if not self.directory.is_dir():
+                raise ValueError(f"LOCAL_SEARCH_DIR {self.directory} is not a directory")
+
+            changed = 0
+            seen = set()
+            for file in sorted(self.directory.rglob("*")):
+                if not file.is_file() or file.suffix.lower() not in TEXT_SUFFIXES + DATA_SUFFIXES:
+                    continue
+                path = str(file)
+                seen.add(path)
+                stat = file.stat()
+                entry = self.files.get(path)
+                if entry and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+                    continue
+                if entry:
+                    self._remove_file(path)
+                try:
+                    chunks = load_chunks(file, self.chunk_size)
+                except Exception as e:
+                    logger.warning(f"Skip {path} in the local search index: {e!r}")
+                    chunks = []
+                title = str(file.relative_to(self.directory))
+                doc_ids = [self.index.add(chunk, title=title, link=f"{file.as_uri()}#{i}")
+                           for i, chunk in enumerate(chunks)]
+                self.files[path] = (stat.st_mtime_ns, stat.st_size, doc_ids)
+                changed += 1
+            for path in set(self.files) - seen:
+                self._remove_file(path)
+                changed += 1
+
+            if changed:
+                logger.info(f"Local search reindexed {changed} files, {len(self.index)} chunks")
+                self._persist()
+            return changed
+
+    def results(self, query: str, max_results: int = 8) -> list[dict]:
+        """Ranked {title, snippet, link} dicts of the chunks matching `query`"""
+        self.refresh()
+        with self._lock:
+            hits = self.index.search(query, max_results * 4 if self.rerank else max_results)
+            doc_ids = [doc_id for doc_id, _ in hits]
+            if self.rerank and len(doc_ids) > 1:
+                doc_ids = self._rerank(query, doc_ids)
+            focus = ("title", "snippet", "link")
+            return [{key: self.index.docs[doc_id][key] for key in focus} for doc_id in doc_ids[:max_results]]
+
+    def _rerank(self, query: str, doc_ids: list[int]) -> list[int]:
+        import faiss
+        import numpy as np
+
+        if self._embeddings is None:
+            from langchain.embeddings import OpenAIEmbeddings
+
+            self._embeddings = OpenAIEmbeddings(openai_api_version="2020-11-07")
+        missing = [doc_id for doc_id in doc_ids if doc_id not in self.vectors]
+        if missing:
+            vectors = self._embeddings.embed_documents([self.index.docs[doc_id]["snippet"] for doc_id in missing])
+            self.vectors.update(zip(missing, vectors))
+
+        matrix = np.array([self.vectors[doc_id] for doc_id in doc_ids], dtype="float32")
+        faiss.normalize_L2(matrix)
+        index = faiss.IndexFlatIP(matrix.shape[1])
+        index.add(matrix)
+        query_vector = np.array([self._embeddings.embed_query(query)], dtype="float32")
+        faiss.normalize_L2(query_vector)
+        _, order = index.search(query_vector, len(doc_ids))
+        return [doc_ids[i] for i in order[0] if i >= 0]
+
+    def run(self, query: str, max_results: int = 8) -> str:
+        """Search and format the results like SerpAPIWrapper._process_response"""
+        results = self.results(query, max_results)
+        toret = results[0]["snippet"] if results else "No good search result found"
+        return str(toret) + '\n' + str(results)
+
+
+_local_search = {}
+_local_search_lock = threading.Lock()
+
+
+def get_local_search(directory: Optional[str] = None) -> LocalSearch:
+    """The process wide LocalSearch of `directory`, defaults to LOCAL_SEARCH_DIR"""
+    directory = directory or CONFIG.local_search_dir
+    if not directory:
+        raise ValueError("Set LOCAL_SEARCH_DIR to use the local search engine")
+    with _local_search_lock:
+        if directory not in _local_search:
+            _local_search[directory] = LocalSearch(
+                directory,
+                index_path=CONFIG.local_search_index,
+                rerank=CONFIG.local_search_rerank,
+                refresh_interval=float(CONFIG.local_search_refresh),
+            )
+        return _local_search[directory]
@@ -8,10 +8,9 @@
 """
 from typing import Any, Dict, Optional, Tuple
 
-import aiohttp
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, validator
 
-from mottoagents.system.config import Config
+from mottoagents.system.config import CONFIG
 
 
 class SerpAPIWrapper(BaseModel):
@@ -31,13 +30,16 @@ class SerpAPIWrapper(BaseModel):
             "hl": "en",
         }
     )
-    config = Config()
-    serpapi_api_key: Optional[str] = config.serpapi_api_key
-    aiosession: Optional[aiohttp.ClientSession] = None
+    serpapi_api_key: Optional[str] = None
+    aiosession: Any = None  #: optional aiohttp.ClientSession
 
     class Config:
         arbitrary_types_allowed = True
 
+    @validator("serpapi_api_key", always=True)
+    def _default_api_key(cls, v):
+        return v or CONFIG.serpapi_api_key
+
     async def run(self, query: str, **kwargs: Any) -> str:
         """Run query through SerpAPI and parse result async."""
         return self._process_response(await self.results(query))
@@ -56,6 +58,8 @@ class SerpAPIWrapper(BaseModel):
 
         url, params = construct_url_and_params()
         if not self.aiosession:
+            import aiohttp
+
             async with aiohttp.ClientSession() as session:
                 async with session.get(url, params=params) as response:
                     res = await response.json()
@@ -107,10 +111,19 @@ class SerpAPIWrapper(BaseModel):
         else:
             toret = "No good search result found"
 
+        return str(toret) + '\n' + str(SerpAPIWrapper._process_results(res))
+
+    @staticmethod
+    def _process_results(res: dict) -> list[dict]:
+        """Title, snippet and link of the answer box and the organic results, in rank order."""
+        focus = ['title', 'snippet', 'link']
+        get_focused = lambda x: {i: j for i, j in x.items() if i in focus}
+
+        if "error" in res.keys():
+            raise ValueError(f"Got error from SerpAPI: {res['error']}")
         toret_l = []
         if "answer_box" in res.keys() and "snippet" in res["answer_box"].keys():
             toret_l += [get_focused(res["answer_box"])]
         if res.get("organic_results"):
             toret_l += [get_focused(i) for i in res.get("organic_results")]
-
-        return str(toret) + '\n' + str(toret_l)
+        return toret_l
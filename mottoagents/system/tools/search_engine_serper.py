@@ -9,10 +9,9 @@
 import json
 from typing import Any, Dict, Optional, Tuple
 
-import aiohttp
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, validator
 
-from mottoagents.system.config import Config
+from mottoagents.system.config import CONFIG
 
 
 class SerperWrapper(BaseModel):
@@ -30,13 +29,16 @@ class SerperWrapper(BaseModel):
             "num": 10
         }
     )
-    config = Config()
-    serper_api_key: Optional[str] = config.serper_api_key
-    aiosession: Optional[aiohttp.ClientSession] = None
+    serper_api_key: Optional[str] = None
+    aiosession: Any = None  #: optional aiohttp.ClientSession
 
     class Config:
         arbitrary_types_allowed = True
 
+    @validator("serper_api_key", always=True)
+    def _default_api_key(cls, v):
+        return v or CONFIG.serper_api_key
+
     async def run(self, query: str, **kwargs: Any) -> str:
         """Run query through Serper and parse result async."""
         queries = query.split("\n")
@@ -53,11 +55,13 @@ class SerperWrapper(BaseModel):
 
         url, payloads, headers = construct_url_and_payload_and_headers()
         if not self.aiosession:
+            import aiohttp
+
             async with aiohttp.ClientSession() as session:
                 async with session.post(url, data=payloads, headers=headers) as response:
                     res = await response.json()
         else:
-            async with self.aiosession.get.post(url, data=payloads, headers=headers) as response:
+            async with self.aiosession.post(url, data=payloads, headers=headers) as response:
                 res = await response.json()
 
         return res
@@ -112,10 +116,19 @@ class SerperWrapper(BaseModel):
         else:
             toret = "No good search result found"
 
+        return str(toret) + '\n' + str(SerperWrapper._process_results(res))
+
+    @staticmethod
+    def _process_results(res: dict) -> list[dict]:
+        """Title, snippet and link of the answer box and the organic results, in rank order."""
+        focus = ['title', 'snippet', 'link']
+        def get_focused(x): return {i: j for i, j in x.items() if i in focus}
+
+        if "error" in res.keys():
+            raise ValueError(f"Got error from Serper: {res['error']}")
         toret_l = []
         if "answer_box" in res.keys() and "snippet" in res["answer_box"].keys():
             toret_l += [get_focused(res["answer_box"])]
         if res.get("organic"):
             toret_l += [get_focused(i) for i in res.get("organic")]
-
-        return str(toret) + '\n' + str(toret_l)
+        return toret_l
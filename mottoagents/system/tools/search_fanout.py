@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File    : search_fanout.py
+@Desc    : run several sub-queries on several search engines at once and merge the results
+
+Every (engine, sub-query) pair is searched concurrently, so a tool step gets the evidence
+of all of them in the latency of the slowest one. Results are deduplicated by URL and
+their rankings merged with reciprocal rank fusion: a result scores 1 / (k + rank) for
+every ranking it appears in. Engines or queries that fail are logged and skipped.
+"""
+import asyncio
+from typing import Optional
+from urllib.parse import urlsplit
+
+from mottoagents.system.config import CONFIG
+from mottoagents.system.logs import logger
+from mottoagents.system.tools import SearchEngineType
+from .search_engine import SearchEngine
+
+
+def normalize_url(url: str) -> str:
+    """Key of a result URL: scheme, `www.`, fragment and trailing slash don't matter"""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    path = parts.path.rstrip("/")
+    return f"{host}{path}?{parts.query}" if parts.query else f"{host}{path}"
+
+
+def reciprocal_rank_fusion(rankings: list[list[dict]], k: int = 60, max_results: Optional[int] = None) -> list[dict]:
+    """Merge ranked result lists into one, best first.
+
+    Args:
+        rankings (list[list[dict]]): Results of each (engine, query), best first
+        k (int): Damping constant, higher values flatten the weight of the top ranks
+        max_results (int, optional): Number of merged results to keep
+
+    Returns:
+        list[dict]: Unique results, the first occurrence of each is kept
+    """
+    scores = {}
+    merged = {}
+    for ranking in rankings:
+        seen = set()
+        for rank, result in enumerate(ranking, start=1):
+            key = normalize_url(result["link"]) if result.get("link") else result.get("title") or result.get("snippet")
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            merged.setdefault(key, result)
+    # sorted is stable, ties keep the order results were first seen
+    keys = sorted(merged, key=lambda key: scores[key], reverse=True)
+    return [merged[key] for key in keys[:max_results]]
+
+
+def split_queries(query: str) -> list[str]:
+    """Sub-queries of a tool input, one per non-empty line, without duplicates"""
+    queries = []
+    for line in query.splitlines():
+        line = line.strip().lstrip("-*").strip()
+        if line and line not in queries:
+            queries.append(line)
+    return queries
+
+
+class FanoutSearch:
+    """Search a batch of sub-queries across several engines and merge the rankings.
+
+    Attributes:
+        engines (list[SearchEngine]): Engines queried for every sub-query
+        max_results (int): Results requested per engine and query
+        k (int): Reciprocal rank fusion constant
+    """
+
+    def __init__(self, engines: list[SearchEngine], max_results: int = 8, k: int = 60):
+        self.engines = engines
+        self.max_results = max_results
+        self.k = k
+
+    @classmethod
+    def from_config(cls, serpapi_api_key=None, search_func=None) -> "FanoutSearch":
+        """Fan out over `SEARCH_FANOUT_ENGINES`, or the default engine when it is empty"""
+        engines = [SearchEngineType(engine) for engine in CONFIG.search_fanout_engines] or [CONFIG.search_engine]
+        return cls(
+            [SearchEngine(engine, run_func=search_func, serpapi_api_key=serpapi_api_key) for engine in engines],
+            max_results=CONFIG.search_fanout_results,
+        )
+
+    async def results(self, queries: list[str], max_results: Optional[int] = None) -> list[dict]:
+        """Merged results of every query on every engine.
+
+        Raises:
+            ValueError: If every search failed
+        """
+        searches = []
+        for engine in self.engines:
+            if engine.engine == SearchEngineType.SERPER_GOOGLE:
+                # Serper takes the whole batch in one request
+                searches.append((engine, queries, engine.results_many(queries, self.max_results)))
+            else:
+                searches.extend((engine, [query], engine.results_many([query], self.max_results)) for query in queries)
+
+        outcomes = await asyncio.gather(*[search for _, _, search in searches], return_exceptions=True)
+        rankings = []
+        errors = []
+        for (engine, batch, _), outcome in zip(searches, outcomes):
+            if isinstance(outcome, BaseException):
+                if not isinstance(outcome, Exception):
+                    raise outcome
+                logger.warning(f"Fan-out search of {batch} on {engine.engine.value} failed: {outcome!r}")
+                errors.append(outcome)
+            else:
+                rankings.extend(outcome)
+        if errors and len(errors) == len(searches):
+            raise ValueError(f"Every fan-out search failed: {errors[0]!r}")
+        return reciprocal_rank_fusion(rankings, k=self.k, max_results=max_results or self.max_results)
+
+    async def run(self, query: str, max_results: Optional[int] = None) -> str:
+        """Search the sub-queries of `query`, one per line, and format the merged results"""
+        results = await self.results(split_queries(query) or [query], max_results)
+        if not results:
+            return ""
+        best = results[0].get("snippet") or results[0].get("title", "")
+        # same layout as SerpAPIWrapper._process_response
+        return f"{best}\n{results}"
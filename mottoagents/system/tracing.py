@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File    : tracing.py
+@Desc    : lightweight tracing of tasks, roles, actions, LLM calls and searches
+
+Spans follow the OpenTelemetry data model (128 bit trace ids, 64 bit span ids, parent
+ids, nanosecond timestamps, typed attributes and a status) and each finished span is
+written as one line of OTLP/JSON, so the file can be replayed into any OpenTelemetry
+collector. The current span is kept in a ContextVar: concurrent roles and plan steps each
+get their own parent, and asyncio tasks start under the span that was current when they
+were created.
+
+Tracing is enabled with `TRACING`, spans are appended to `TRACE_FILE` by a background
+thread: finishing a span only puts it on a queue, and the spans queued meanwhile are
+written together. When it is disabled `span` yields None, which costs a function call and
+a config lookup.
+"""
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Optional
+
+from mottoagents.system.config import CONFIG
+from mottoagents.system.const import PROJECT_ROOT
+from mottoagents.system.logs import logger
+
+SERVICE_NAME = "mottoagents"
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # OTLP/JSON encodes 64 bit integers as strings
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Span:
+    """A timed operation, with the attributes that explain its duration"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None, /, **attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.error = None
+
+    @property
+    def duration(self) -> float:
+        """Seconds from the start to the end, or to now for an open span"""
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, key: str, amount: float):
+        """Accumulate a count or a duration, e.g. tokens or seconds slept"""
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": "SPAN_KIND_INTERNAL",
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": "STATUS_CODE_ERROR", "message": self.error} if self.error else {"code": "STATUS_CODE_OK"},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class JsonExporter:
+    """Append finished spans to a file from a background thread, one OTLP/JSON export request per line
+
+    The spans queued while a batch is written go into the next one, of at most `batch_size` spans.
+    """
+
+    def __init__(self, path, batch_size: int = 512):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._pid = None
+        atexit.register(self.flush)
+
+    def _start(self):
+        # a forked worker neither inherits the writer thread nor the spans queued in its parent
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._resource = {"attributes": [
+                {"key": "service.name", "value": _otlp_value(SERVICE_NAME)},
+                {"key": "process.pid", "value": _otlp_value(os.getpid())},
+            ]}
+            threading.Thread(target=self._write, name="span-exporter", daemon=True).start()
+            self._pid = os.getpid()
+
+    def export(self, span: Span):
+        if self._pid != os.getpid():
+            self._start()
+        self._queue.put(span)
+
+    def flush(self):
+        """Wait until the spans exported so far are written"""
+        if self._pid == os.getpid():
+            self._queue.join()
+
+    def _write(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            request = {"resourceSpans": [{
+                "resource": self._resource,
+                "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": [span.to_otlp() for span in batch]}],
+            }]}
+            try:
+                # a single append per batch, so worker processes can share the file
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(request, ensure_ascii=False) + "\n")
+            except OSError as e:
+                logger.warning(f"Failed to write {len(batch)} spans to {self.path}: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+
+class MemoryExporter:
+    """Keep finished spans in a list, for benchmarks and debugging"""
+
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span: Span):
+        self.spans.append(span)
+
+    def flush(self):
+        pass
+
+
+class Tracer:
+    def __init__(self, exporter):
+        self.exporter = exporter
+
+    @contextmanager
+    def span(self, name: str, /, **attributes):
+        parent = _current_span.get()
+        span = Span(name, parent.trace_id if parent else os.urandom(16).hex(), parent.span_id if parent else None,
+                    **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+            self.exporter.export(span)
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+_tracer = None
+
+
+def get_tracer() -> Optional[Tracer]:
+    """The process wide tracer, None when tracing is disabled"""
+    global _tracer
+    if _tracer is None and CONFIG.tracing:
+        _tracer = Tracer(JsonExporter(PROJECT_ROOT / CONFIG.trace_file))
+    return _tracer
+
+
+def set_tracer(tracer: Optional[Tracer]):
+    global _tracer
+    _tracer = tracer
+
+
+def flush_spans():
+    """Write the finished spans still queued, e.g. before a worker process exits"""
+    if _tracer is not None:
+        _tracer.exporter.flush()
+
+
+@contextmanager
+def span(name: str, /, **attributes):
+    """Trace the block as a child of the current span, yields None when tracing is disabled"""
+    tracer = get_tracer()
+    if tracer is None:
+        yield None
+        return
+    with tracer.span(name, **attributes) as current:
+        yield current
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def add_to_span(key: str, amount: float):
+    """Accumulate `amount` on the current span, if any"""
+    current = _current_span.get()
+    if current is not None:
+        current.add(key, amount)
+
+
+def set_span_attributes(**attributes):
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attributes)
@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File    : block_parser.py
+@Desc    : single pass parser of the `## Section` / fenced code layout of LLM responses
+
+A response is read line by line, as a whole or token by token from the LLM stream, into
+a `ParsedDocument` holding its sections and the fenced code blocks of each section.
+Headers inside a fenced block are code, unless the fences are unbalanced, in which case
+the response is split on every header like the original `text.split("##")`.
+
+Documents are kept in a small LRU keyed by their text, so OutputParser and CodeParser
+calls on the same response parse it once, and a `BlockParser` registered as a stream
+listener leaves the parsed document of a completion in it when the stream ends.
+"""
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional
+
+FENCE = "```"
+HEADER = "##"
+CACHE_SIZE = 64
+
+
+@lru_cache(maxsize=32)
+def code_pattern(lang: str = "") -> re.Pattern:
+    return re.compile(rf'```{lang}.*?\s+(.*?)```', re.DOTALL)
+
+
+class Section:
+    """A `## title` and its content, the first line is the title of text before any header"""
+
+    __slots__ = ("raw_title", "content", "fences")
+
+    def __init__(self, raw_title: str, content: str, fences: list[tuple[str, str]]):
+        self.raw_title = raw_title
+        self.content = content
+        self.fences = fences  # (info string, body) of every complete fenced block
+
+    @property
+    def title(self) -> str:
+        # handle potential LLM formatting issues
+        return self.raw_title[:-1] if self.raw_title.endswith(":") else self.raw_title
+
+    def code(self, lang: str = "") -> str:
+        """Body of the first fenced block whose info string starts with `lang`
+
+        Raises:
+            ValueError: If the section has no such block
+        """
+        for info, body in self.fences:
+            if info.startswith(lang):
+                return body.lstrip()
+        match = code_pattern(lang).search(self.content)
+        if match is None:
+            raise ValueError(f"No {lang or 'code'} block in section {self.raw_title!r}")
+        return match.group(1)
+
+
+class ParsedDocument:
+    """Sections of a response, in order"""
+
+    def __init__(self, text: str, sections: list[Section]):
+        self.text = text
+        self.sections = sections
+
+    def blocks(self, raw_titles: bool = False) -> dict[str, str]:
+        """Title to content of every section, a repeated title keeps its last content"""
+        return {section.raw_title if raw_titles else section.title: section.content for section in self.sections}
+
+    def section(self, name: str) -> Optional[Section]:
+        """Section whose title contains `name`, the first in the order of `blocks`"""
+        by_title = {}
+        for section in self.sections:
+            by_title[section.raw_title] = section
+        for title, section in by_title.items():
+            if name in title:
+                return section
+        return None
+
+    def code(self, lang: str = "") -> str:
+        """Body of the first fenced block of the whole document
+
+        Raises:
+            ValueError: If there is no such block
+        """
+        for section in self.sections:
+            for info, body in section.fences:
+                if info.startswith(lang):
+                    return body.lstrip()
+        match = code_pattern(lang).search(self.text)
+        if match is None:
+            raise ValueError(f"No {lang or 'code'} block in the document")
+        return match.group(1)
+
+
+class BlockParser:
+    """Incremental parser, `feed` it text and `close` it to get the document.
+
+    It has the `feed` / `close` interface of the stream listeners, so registered with
+    `stream_listener` it parses a completion while it is generated.
+    """
+
+    def __init__(self, fence_aware: bool = True):
+        self.fence_aware = fence_aware
+        self.document = None
+        self._reset()
+
+    def _reset(self):
+        self._chunks = []
+        self._partial = ""
+        self._sections = []
+        self._title = None
+        self._lines = []
+        self._fences = []
+        self._fence_info = None
+        self._fence_lines = []
+        self._unbalanced = False
+
+    def feed(self, text: str):
+        self._chunks.append(text)
+        lines = (self._partial + text).split("\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self._line(line + "\n")
+
+    def close(self, aborted: bool = False) -> ParsedDocument:
+        if self._partial:
+            self._line(self._partial)
+        self._end_section()
+        text = "".join(self._chunks)
+        if self._unbalanced and self.fence_aware:
+            document = parse_text(text, fence_aware=False)
+        else:
+            document = ParsedDocument(text, self._sections)
+        self._reset()
+        self.document = document
+        remember(document)
+        return document
+
+    def _line(self, line: str):
+        stripped = line.strip()
+        in_fence = self._fence_info is not None
+        if stripped.startswith(HEADER) and not (in_fence and self.fence_aware):
+            self._end_section()
+            self._title = stripped.lstrip("#").strip()
+            self.on_header(self._title)
+            return
+        if self._title is None:
+            # text before the first header, its first line is the title
+            self._title = stripped
+            return
+
+        self._lines.append(line)
+        if in_fence:
+            idx = line.find(FENCE)
+            if idx >= 0:
+                self._fences.append((self._fence_info, "".join(self._fence_lines) + line[:idx]))
+                self._fence_info = None
+                self._fence_lines = []
+            else:
+                self._fence_lines.append(line)
+        elif stripped.startswith(FENCE) and FENCE not in stripped[len(FENCE):]:
+            self._fence_info = stripped[len(FENCE):].strip()
+
+    def on_header(self, title: str):
+        """Called when a section starts, before its content is fed"""
+
+    def _end_section(self):
+        if self._fence_info is not None:
+            # a fence left open, its code is only found by the regex fallback
+            self._unbalanced = True
+            self._fence_info = None
+            self._fence_lines = []
+        content = "".join(self._lines).strip()
+        if self._title is not None and (self._title or content):
+            self._sections.append(Section(self._title, content, self._fences))
+        self._title = None
+        self._lines = []
+        self._fences = []
+
+
+class MalformedOutputError(ValueError):
+    """A response does not have the expected sections"""
+
+
+class SectionValidator(BlockParser):
+    """Parser that checks the sections of a completion while it streams.
+
+    Registered as the last stream listener, it raises MalformedOutputError from `feed`
+    as soon as the response goes wrong, which ends the completion early:
+    - an expected section starts before an earlier expected one appeared
+    - a section grows beyond `max_section_chars`
+    - more than `max_preamble_chars` arrive before the first expected section
+    At the end of a completion that wasn't aborted it raises if an expected section is missing.
+
+    Attributes:
+        sections (list[str]): Titles of the expected sections, in order
+        max_section_chars (int): Longest section content, 0 for no limit
+        max_preamble_chars (int): Longest text before the first expected section, 0 for no limit
+    """
+
+    def __init__(self, sections: list[str], max_section_chars: int = 0, max_preamble_chars: int = 0):
+        self.sections = list(sections)
+        self.max_section_chars = max_section_chars
+        self.max_preamble_chars = max_preamble_chars
+        super().__init__()
+
+    def _reset(self):
+        super()._reset()
+        self._seen = set()
+        self._current = None
+        self._chars = 0
+        self._aborted = False
+
+    def feed(self, text: str):
+        if self._aborted:
+            return
+        self._chars += len(text)
+        super().feed(text)
+        if self._current is None:
+            if self.max_preamble_chars and self._chars > self.max_preamble_chars:
+                self._abort(f"no '## {self.sections[0]}' section in the first {self.max_preamble_chars} characters")
+        elif self.max_section_chars and self._chars > self.max_section_chars:
+            self._abort(f"section '{self._current}' is longer than {self.max_section_chars} characters")
+
+    def on_header(self, title: str):
+        title = title[:-1] if title.endswith(":") else title
+        if title not in self.sections:
+            return
+        missing = [section for section in self.sections[:self.sections.index(title)] if section not in self._seen]
+        if missing:
+            self._abort(f"section '{title}' came before {', '.join(repr(section) for section in missing)}")
+        self._seen.add(title)
+        self._current = title
+        self._chars = 0
+
+    def _abort(self, reason: str):
+        self._aborted = True
+        raise MalformedOutputError(reason)
+
+    def close(self, aborted: bool = False) -> ParsedDocument:
+        # a completion cut by an error or a cancellation is missing sections for that reason
+        aborted = aborted or self._aborted
+        seen = self._seen
+        document = super().close(aborted)
+        missing = [section for section in self.sections if section not in seen]
+        if missing and not aborted:
+            raise MalformedOutputError(f"missing sections {', '.join(repr(section) for section in missing)}")
+        return document
+
+
+_documents = OrderedDict()
+_documents_lock = threading.Lock()
+
+
+def remember(document: ParsedDocument):
+    with _documents_lock:
+        _documents[document.text] = document
+        _documents.move_to_end(document.text)
+        while len(_documents) > CACHE_SIZE:
+            _documents.popitem(last=False)
+
+
+def parse_text(text: str, fence_aware: bool = True) -> ParsedDocument:
+    parser = BlockParser(fence_aware=fence_aware)
+    parser.feed(text)
+    return parser.close()
+
+
+def parse_document(text: str) -> ParsedDocument:
+    """The parsed document of `text`, parsed once however often it is asked for"""
+    with _documents_lock:
+        document = _documents.get(text)
+        if document is not None:
+            _documents.move_to_end(text)
+            return document
+    return parse_text(text)
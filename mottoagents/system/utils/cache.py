@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File    : cache.py
+@Desc    : LLM response cache, shared by every LLM instance of a process
+
+The cache is off unless `LLM_CACHE` is set. Responses are kept in an in-memory LRU of
+`LLM_CACHE_SIZE` entries; with `LLM_CACHE_DIR` they are stored with diskcache instead,
+which can be shared by several processes and survives restarts.
+
+ResponseCache also stores the search results (see search_cache.py), whose entries expire.
+"""
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+try:
+    import diskcache
+except ImportError:
+    diskcache = None
+
+from mottoagents.system.config import CONFIG
+from mottoagents.system.metrics import CACHE_LOOKUPS
+
+
+class ResponseCache:
+    """LRU of `size` entries, or diskcache in `directory`, whose entries expire after `ttl` seconds if set
+
+    Lookups are counted by the cache_lookups metric under the label `name`.
+    """
+
+    def __init__(self, size: int = 1024, directory: Optional[str] = None, ttl: Optional[float] = None,
+                 name: str = "llm"):
+        self.size = size
+        self.ttl = ttl
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._disk = None
+        if directory:
+            if diskcache is None:
+                raise ImportError(f"{name.upper()}_CACHE_DIR requires diskcache, install it with `pip install diskcache`")
+            self._disk = diskcache.Cache(directory)
+
+    @staticmethod
+    def make_key(**request) -> str:
+        raw = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Any:
+        if self._disk is not None:
+            value = self._disk.get(key)
+        else:
+            value = None
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at is not None and expires_at < time.monotonic():
+                    del self._memory[key]
+                    value = None
+                else:
+                    self._memory.move_to_end(key)
+        if value is None:
+            self.misses += 1
+            CACHE_LOOKUPS.inc(cache=self.name, result="miss")
+        else:
+            self.hits += 1
+            CACHE_LOOKUPS.inc(cache=self.name, result="hit")
+        return value
+
+    def set(self, key: str, value: Any):
+        if self._disk is not None:
+            self._disk.set(key, value, expire=self.ttl)
+            return
+        self._memory[key] = (None if self.ttl is None else time.monotonic() + self.ttl, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.size:
+            self._memory.popitem(last=False)
+
+
+_response_cache = None
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """The cache of LLM responses, None unless LLM_CACHE is set"""
+    global _response_cache
+    if _response_cache is None and CONFIG.llm_cache:
+        _response_cache = ResponseCache(size=CONFIG.llm_cache_size, directory=CONFIG.llm_cache_dir)
+    return _response_cache
+
+
+def set_response_cache(cache: Optional[ResponseCache]):
+    global _response_cache
+    _response_cache = cache
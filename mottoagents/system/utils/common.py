@@ -12,10 +12,14 @@ It includes tools for command checking, output parsing, and code parsing.
 import ast
 import inspect
 import os
+import random
 import re
 from typing import List, Tuple
 
 from mottoagents.system.logs import logger
+from mottoagents.system.utils.block_parser import code_pattern, parse_document
+
+_LIST_PATTERN = re.compile(r'\s*(.*=.*)?(\[.*\])', re.DOTALL)
 
 
 def check_cmd_exists(command) -> int:
@@ -49,24 +53,7 @@ class OutputParser:
         Returns:
             dict: A dictionary mapping block titles to their content
         """
-        # First split the text into different blocks based on "##"
-        blocks = text.split("##")
-
-        # Create a dictionary to store the title and content of each block
-        block_dict = {}
-
-        # Iterate through all blocks
-        for block in blocks:
-            # If the block is not empty, continue processing
-            if block.strip() != "":
-                # Split the block's title and content, and remove whitespace from both ends
-                block_title, block_content = block.split("\n", 1)
-                # Handle potential LLM formatting issues
-                if block_title[-1] == ":":
-                    block_title = block_title[:-1]
-                block_dict[block_title.strip()] = block_content.strip()
-
-        return block_dict
+        return parse_document(text).blocks()
 
     @classmethod
     def parse_code(cls, text: str, lang: str = "") -> str:
@@ -82,8 +69,7 @@ class OutputParser:
         Raises:
             Exception: If no code block is found
         """
-        pattern = rf'```{lang}.*?\s+(.*?)```'
-        match = re.search(pattern, text, re.DOTALL)
+        match = code_pattern(lang).search(text)
         if match:
             code = match.group(1)
         else:
@@ -114,11 +100,8 @@ class OutputParser:
         Returns:
             list[str]: The list of parsed file names
         """
-        # Regular expression pattern to find the tasks list
-        pattern = r'\s*(.*=.*)?(\[.*\])'
-
         # Extract tasks list string using regex
-        match = re.search(pattern, text, re.DOTALL)
+        match = _LIST_PATTERN.search(text)
         if match:
             tasks_list_str = match.group(2)
             # Convert string representation of list to a Python list
@@ -129,14 +112,14 @@ class OutputParser:
 
     @classmethod
     def parse_data(cls, data):
-        block_dict = cls.parse_blocks(data)
         parsed_data = {}
-        for block, content in block_dict.items():
+        for section in parse_document(data).sections:
+            block = section.title
             # Try to remove code markers
             try:
-                content = cls.parse_code(text=content)
-            except Exception:
-                pass
+                content = section.code()
+            except ValueError:
+                content = section.content
 
             # Try to parse list
             try:
@@ -148,14 +131,14 @@ class OutputParser:
 
     @classmethod
     def parse_data_with_mapping(cls, data, mapping):
-        block_dict = cls.parse_blocks(data)
         parsed_data = {}
-        for block, content in block_dict.items():
+        for section in parse_document(data).sections:
+            block = section.title
             # Try to remove code markers
             try:
-                content = cls.parse_code(text=content)
-            except Exception:
-                pass
+                content = section.code()
+            except ValueError:
+                content = section.content
             typing_define = mapping.get(block, None)
             if isinstance(typing_define, tuple):
                 typing = typing_define[0]
@@ -182,43 +165,28 @@ class CodeParser:
 
     @classmethod
     def parse_block(cls, block: str, text: str) -> str:
-        blocks = cls.parse_blocks(text)
-        for k, v in blocks.items():
-            if block in k:
-                return v
-        return ""
+        section = parse_document(text).section(block)
+        return section.content if section else ""
 
     @classmethod
     def parse_blocks(cls, text: str):
-        # First split the text into different blocks based on "##"
-        blocks = text.split("##")
-
-        # Create a dictionary to store the title and content of each block
-        block_dict = {}
-
-        # Iterate through all blocks
-        for block in blocks:
-            # If the block is not empty, continue processing
-            if block.strip() != "":
-                # Split the block's title and content, and remove whitespace from both ends
-                block_title, block_content = block.split("\n", 1)
-                block_dict[block_title.strip()] = block_content.strip()
-
-        return block_dict
+        return parse_document(text).blocks(raw_titles=True)
 
     @classmethod
     def parse_code(cls, block: str, text: str, lang: str = "") -> str:
-        if block:
-            text = cls.parse_block(block, text)
-        pattern = rf'```{lang}.*?\s+(.*?)```'
-        match = re.search(pattern, text, re.DOTALL)
-        if match:
-            code = match.group(1)
-        else:
-            logger.error(f"{pattern} not match following text:")
-            logger.error(text)
+        # the document is parsed once, every block and its code are looked up in it
+        document = parse_document(text)
+        section = document.section(block) if block else None
+        try:
+            if section is not None:
+                return section.code(lang)
+            if not block:
+                return document.code(lang)
+            raise ValueError(f"No block {block!r}")
+        except ValueError as e:
+            logger.error(f"{code_pattern(lang).pattern} not match following text: {e}")
+            logger.error(section.content if section else text)
             raise Exception
-        return code
 
     @classmethod
     def parse_str(cls, block: str, text: str, lang: str = ""):
@@ -232,10 +200,9 @@ class CodeParser:
         # Regular expression pattern to find the tasks list.
         code = cls.parse_code(block, text, lang)
         print(code)
-        pattern = r'\s*(.*=.*)?(\[.*\])'
 
         # Extract tasks list string using regex.
-        match = re.search(pattern, code, re.DOTALL)
+        match = _LIST_PATTERN.search(code)
         if match:
             tasks_list_str = match.group(2)
 
@@ -258,6 +225,11 @@ class NoMoneyException(Exception):
         return f'{self.message} -> Amount required: {self.amount}'
 
 
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 30.0) -> float:
+    """Seconds to wait before retry number `attempt` (from 0), exponential with full jitter"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
 def print_members(module, indent=0):
     """
     https://stackoverflow.com/questions/1796180/how-can-i-get-a-list-of-all-classes-within-current-module-in-python
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File    : plan.py
+@Desc    : dependencies between the steps of an execution plan
+
+A step depends on the earlier steps it names, checked in this order:
+1. a `(depends on: 1, 3)` clause, `(depends on: none)` for a step that needs no earlier output
+2. references such as `step 2`, `steps 1 and 3` or `steps 1-3`
+3. `previous steps` / `all above steps`: every earlier step
+4. `previous step`, or nothing at all: the step just before it, as plans run in order
+References to later steps are ignored, so the plan is always a DAG.
+"""
+import re
+
+DEPENDS_PATTERN = re.compile(r"\(?\s*depends\s+on\s*:?\s*([^)]*?)\s*\)?\s*\.?\s*$", re.IGNORECASE)
+STEP_REFERENCE_PATTERN = re.compile(r"\bsteps?\s+(\d+(?:\s*(?:,|-|–|to|and|&|or)\s*\d+)*)", re.IGNORECASE)
+ALL_PREVIOUS_PATTERN = re.compile(r"\b(?:previous|prior|above|preceding|earlier)\s+steps\b|\ball\s+steps\b", re.IGNORECASE)
+NO_DEPENDENCY = ("none", "nothing", "no", "-", "n/a", "")
+
+
+def parse_step_numbers(text: str) -> set[int]:
+    """Step numbers of `1, 3`, `1-3`, `2 to 4` or `1 and 2`"""
+    numbers = set()
+    for start, end in re.findall(r"(\d+)(?:\s*(?:-|–|to)\s*(\d+))?", text):
+        start = int(start)
+        numbers.update(range(start, int(end) + 1) if end else [start])
+    return numbers
+
+
+def strip_dependencies(step: str) -> str:
+    """The step without its `(depends on: ...)` clause"""
+    return DEPENDS_PATTERN.sub("", step).rstrip()
+
+
+def step_dependencies(steps: list[str]) -> list[set[int]]:
+    """Indexes of the earlier steps each step depends on"""
+    dependencies = []
+    for i, step in enumerate(steps):
+        match = DEPENDS_PATTERN.search(step)
+        if match and match.group(1).strip().lower() in NO_DEPENDENCY:
+            numbers = set()
+        elif match:
+            numbers = parse_step_numbers(match.group(1))
+        else:
+            numbers = set()
+            for reference in STEP_REFERENCE_PATTERN.findall(step):
+                numbers.update(parse_step_numbers(reference))
+        depends = {n - 1 for n in numbers if 0 < n <= i}
+
+        if not match and not depends:
+            if ALL_PREVIOUS_PATTERN.search(step):
+                depends = set(range(i))
+            elif i > 0:
+                depends = {i - 1}
+        dependencies.append(depends)
+    return dependencies
+
+
+def ancestors(dependencies: list[set[int]], index: int) -> set[int]:
+    """Every step `index` depends on, directly or through other steps"""
+    seen = set()
+    pending = list(dependencies[index])
+    while pending:
+        i = pending.pop()
+        if i not in seen:
+            seen.add(i)
+            pending.extend(dependencies[i])
+    return seen
+
+
+def critical_path(dependencies: list[set[int]]) -> int:
+    """Number of steps on the longest chain of dependencies"""
+    depth = []
+    for depends in dependencies:
+        depth.append(1 + max((depth[i] for i in depends), default=0))
+    return max(depth, default=0)
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File    : stream.py
+@Desc    : hooks into the LLM token stream and the chunked file transfer built on them
+
+Providers call `notify_stream` for every streamed token and `close_stream` when a
+completion ends, telling whether it was aborted by an error or a cancellation. Consumers register with `stream_listener` for the duration of a
+block; registration is stored in a ContextVar, so concurrently running roles only
+see the tokens of their own completions.
+"""
+import hashlib
+import uuid
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable
+
+_listeners: ContextVar[tuple] = ContextVar("stream_listeners", default=())
+
+FILE_START_MARKER = ">>>"
+FILE_END_MARKER = ">>>END"
+
+
+@contextmanager
+def stream_listener(listener):
+    """Register a listener with `feed(text)` and `close(aborted)` methods for the current context"""
+    token = _listeners.set(_listeners.get() + (listener,))
+    try:
+        yield listener
+    finally:
+        _listeners.reset(token)
+
+
+@contextmanager
+def exclusive_stream(*listeners):
+    """Register only `listeners` for the current context, hiding those of the enclosing ones.
+
+    Concurrent completions each need a listener of their own, the end of one of them
+    would otherwise close the file another one is writing.
+    """
+    token = _listeners.set(listeners)
+    try:
+        yield
+    finally:
+        _listeners.reset(token)
+
+
+def notify_stream(text: str):
+    """Forward a streamed token to the listeners of the current context"""
+    for listener in _listeners.get():
+        listener.feed(text)
+
+
+def close_stream(aborted: bool = False):
+    """Signal the end of a streamed completion, `aborted` if it didn't finish normally.
+
+    Every listener is closed, the first error one of them raises is raised afterwards.
+    """
+    error = None
+    for listener in _listeners.get():
+        try:
+            listener.close(aborted)
+        except Exception as e:
+            error = error or e
+    if error is not None:
+        raise error
+
+
+class FileStreamParser:
+    """Detect files written with the 'Write File' tool while the completion is streamed.
+
+    A file is announced in the response as
+    ```
+    >>>file name
+    file content
+    >>>END
+    ```
+    and is forwarded through `emit(action, data)` as one `file_start` event, a series of
+    `file_chunk` events and a `file_end` event carrying the size and sha256 of the whole
+    content. Only the current chunk is held in memory.
+    """
+
+    def __init__(self, emit: Callable[[str, dict], None], chunk_size: int = 512):
+        self.emit = emit
+        self.chunk_size = chunk_size
+        self._reset()
+
+    def _reset(self):
+        self._buf = ""
+        self._file_id = None
+        self._seq = 0
+        self._size = 0
+        self._sha256 = None
+
+    def feed(self, text: str):
+        self._buf += text
+        while True:
+            if self._file_id is None:
+                if not self._scan_start():
+                    return
+            elif not self._scan_end():
+                return
+
+    def close(self, aborted: bool = False):
+        """End of the completion, finish a file that was left open"""
+        if self._file_id is not None:
+            self._send_chunk(self._buf)
+            self._finish(complete=False)
+        self._reset()
+
+    def _scan_start(self) -> bool:
+        while "\n" in self._buf:
+            line, self._buf = self._buf.split("\n", 1)
+            line = line.strip().strip("`").strip()
+            if not line.startswith(FILE_START_MARKER) or line.startswith(FILE_START_MARKER + ">"):
+                continue
+            file_name = line[len(FILE_START_MARKER):].strip()
+            if not file_name or line == FILE_END_MARKER:
+                continue
+            self._file_id = uuid.uuid4().hex
+            self._sha256 = hashlib.sha256()
+            self.emit("file_start", {"file_id": self._file_id, "file_name": file_name})
+            return True
+        return False
+
+    def _scan_end(self) -> bool:
+        idx = self._buf.find(FILE_END_MARKER)
+        if idx >= 0:
+            self._send_chunk(self._buf[:idx])
+            self._buf = self._buf[idx + len(FILE_END_MARKER):]
+            self._finish(complete=True)
+            return True
+        # keep enough characters to recognise an end marker split across tokens
+        safe = len(self._buf) - len(FILE_END_MARKER) + 1
+        if safe >= self.chunk_size:
+            self._send_chunk(self._buf[:safe])
+            self._buf = self._buf[safe:]
+        return False
+
+    def _send_chunk(self, data: str):
+        if not data:
+            return
+        raw = data.encode("utf-8")
+        self._sha256.update(raw)
+        self._size += len(raw)
+        self.emit("file_chunk", {"file_id": self._file_id, "seq": self._seq, "data": data, "crc32": zlib.crc32(raw)})
+        self._seq += 1
+
+    def _finish(self, complete: bool):
+        self.emit("file_end", {
+            "file_id": self._file_id,
+            "size": self._size,
+            "chunks": self._seq,
+            "sha256": self._sha256.hexdigest(),
+            "complete": complete,
+        })
+        self._file_id = None
+        self._seq = 0
+        self._size = 0
+        self._sha256 = None
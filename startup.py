@@ -2,13 +2,27 @@
 # -*- coding: utf-8 -*-
 from mottoagents.roles import Manager
 from mottoagents.explorer import Explorer
+from mottoagents.system.config import CONFIG
+from mottoagents.system.deadline import deadline
+from mottoagents.system.diagnostics import watch_loop
+from mottoagents.system.tracing import span
 
 
 async def startup(idea: str, investment: float = 3.0, n_round: int = 10, task_id=None, 
-                  llm_api_key: str=None, serpapi_key: str=None, proxy: str=None, alg_msg_queue: object=None):
+                  llm_api_key: str=None, serpapi_key: str=None, proxy: str=None, alg_msg_queue: object=None,
+                  file_encoding: str="json"):
     """Run a startup. Be a boss."""
-    explorer = Explorer()
-    explorer.hire([Manager(proxy=proxy, llm_api_key=llm_api_key, serpapi_api_key=serpapi_key)])
-    explorer.invest(investment)
-    await explorer.start_project(idea=idea, llm_api_key=llm_api_key, proxy=proxy, serpapi_key=serpapi_key, task_id=task_id, alg_msg_queue=alg_msg_queue)
-    await explorer.run(n_round=n_round)
\ No newline at end of file
+    # the root span of the task, every span of its roles belongs to its trace
+    with span("task", task_id=task_id or "", idea=idea, n_round=n_round) as current, deadline(CONFIG.task_timeout):
+        async with watch_loop() as monitor:
+            blocked = monitor.blocked if monitor else 0.0
+            try:
+                explorer = Explorer()
+                explorer.hire([Manager(proxy=proxy, llm_api_key=llm_api_key, serpapi_api_key=serpapi_key)])
+                explorer.invest(investment)
+                await explorer.start_project(idea=idea, llm_api_key=llm_api_key, proxy=proxy, serpapi_key=serpapi_key, task_id=task_id, alg_msg_queue=alg_msg_queue, file_encoding=file_encoding)
+                return await explorer.run(n_round=n_round)
+            finally:
+                if monitor and current is not None:
+                    # the loop may be shared with other tasks, e.g. in batch mode
+                    current.set(loop_blocked_s=monitor.blocked - blocked, loop_max_lag_s=monitor.max_lag)
\ No newline at end of file
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File    : test_hedged.py
+@Desc    : hedged requests never outlive their caller
+"""
+import asyncio
+
+import pytest
+
+from mottoagents.system.provider.resilience import hedged
+
+
+class Request:
+    """A request answering `answer` after `seconds`"""
+
+    def __init__(self, seconds: float, answer: str):
+        self.seconds = seconds
+        self.answer = answer
+        self.started = False
+        self.cancelled = False
+        self.finished = False
+
+    async def __call__(self) -> str:
+        self.started = True
+        try:
+            await asyncio.sleep(self.seconds)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        self.finished = True
+        return self.answer
+
+
+def test_caller_timeout_before_the_hedge_cancels_the_primary():
+    primary, hedge = Request(1, "primary"), Request(1, "hedge")
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(hedged(primary, hedge, delay=0.5), 0.1)
+        # the request is cancelled with the caller, not when the loop shuts down
+        await asyncio.sleep(0.05)
+        assert primary.cancelled
+
+    asyncio.run(run())
+    assert not primary.finished
+    assert not hedge.started
+
+
+def test_caller_timeout_after_the_hedge_cancels_both():
+    primary, hedge = Request(1, "primary"), Request(1, "hedge")
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(hedged(primary, hedge, delay=0.05), 0.2)
+        await asyncio.sleep(0.05)
+        assert primary.cancelled and hedge.cancelled
+
+    asyncio.run(run())
+
+
+def test_faster_hedge_wins_and_the_primary_is_cancelled():
+    primary, hedge = Request(1, "primary"), Request(0.01, "hedge")
+    discarded = []
+
+    async def discard(result):
+        discarded.append(result)
+
+    assert asyncio.run(hedged(primary, hedge, delay=0.05, discard=discard)) == "hedge"
+    assert primary.cancelled
+    assert not discarded
+
+
+def test_primary_answering_in_time_is_not_hedged():
+    primary, hedge = Request(0.01, "primary"), Request(0.01, "hedge")
+    assert asyncio.run(hedged(primary, hedge, delay=0.5)) == "primary"
+    assert not hedge.started
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@File    : test_stream_abort.py
+@Desc    : a streamed completion that fails or is cancelled keeps its own exception
+"""
+import asyncio
+import sys
+import types
+
+import pytest
+
+from mottoagents.system.provider import openai_api
+from mottoagents.system.utils.block_parser import MalformedOutputError, SectionValidator
+from mottoagents.system.utils.stream import FileStreamParser, close_stream, notify_stream, stream_listener
+
+
+def chunk(text: str) -> dict:
+    return {"choices": [{"delta": {"content": text}}]}
+
+
+class ScriptedStream:
+    """Sends `parts`, then raises `error` or hangs"""
+
+    def __init__(self, parts: list[str], error: BaseException = None):
+        self.parts = list(parts)
+        self.error = error
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.parts:
+            return chunk(self.parts.pop(0))
+        if self.error is not None:
+            raise self.error
+        await asyncio.Event().wait()
+
+    async def aclose(self):
+        self.closed = True
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    litellm = types.ModuleType("litellm")
+    monkeypatch.setitem(sys.modules, "litellm", litellm)
+    monkeypatch.setattr(openai_api, "count_message_tokens", lambda messages, model: 10)
+    monkeypatch.setattr(openai_api, "count_string_tokens", lambda text, model: 1)
+    monkeypatch.setattr(openai_api.CONFIG, "llm_hedge", False, raising=False)
+    return openai_api.OpenAIGPTAPI()
+
+
+def serve(llm, stream: ScriptedStream):
+    async def acompletion(**kwargs):
+        return stream
+    sys.modules["litellm"].acompletion = acompletion
+
+
+PARTS = ["## Thought\nwriting\n", ">>>main.py\nprint(1)\n"]
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+def listeners():
+    events = []
+    files = FileStreamParser(lambda action, data: events.append((action, data.get("complete"))))
+    return events, files, SectionValidator(["Thought", "Action"])
+
+
+def test_stream_error_is_not_reported_as_malformed(llm):
+    stream = ScriptedStream(PARTS, ConnectionError("reset by peer"))
+    serve(llm, stream)
+    events, files, validator = listeners()
+
+    async def run():
+        with stream_listener(files), stream_listener(validator):
+            await llm._achat_completion_stream(MESSAGES)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(run())
+    assert stream.closed
+    # the file left open by the failed completion is finished as incomplete
+    assert events[-1] == ("file_end", False)
+
+
+def test_cancelled_stream_stays_cancelled(llm):
+    stream = ScriptedStream(PARTS)
+    serve(llm, stream)
+    events, files, validator = listeners()
+
+    async def run():
+        with stream_listener(files), stream_listener(validator):
+            task = asyncio.create_task(llm._achat_completion_stream(MESSAGES))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            await task
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(run())
+    assert stream.closed
+    assert events[-1] == ("file_end", False)
+
+
+def test_missing_sections_of_a_finished_stream_are_malformed(llm):
+    serve(llm, ScriptedStream(PARTS, StopAsyncIteration()))
+    _, files, validator = listeners()
+
+    async def run():
+        with stream_listener(files), stream_listener(validator):
+            await llm._achat_completion_stream(MESSAGES)
+
+    with pytest.raises(MalformedOutputError):
+        asyncio.run(run())
+
+
+def test_close_stream_closes_every_listener():
+    closed = []
+
+    class Listener:
+        def __init__(self, name, error=None):
+            self.name, self.error = name, error
+
+        def feed(self, text):
+            pass
+
+        def close(self, aborted=False):
+            closed.append(self.name)
+            if self.error:
+                raise self.error
+
+    with stream_listener(Listener("first", ValueError("bad"))), stream_listener(Listener("second")):
+        notify_stream("text")
+        with pytest.raises(ValueError):
+            close_stream()
+    assert closed == ["first", "second"]
@@ -1,26 +1,171 @@
 from datetime import datetime
 import websockets
+from websockets.extensions.permessage_deflate import PerMessageDeflate
 import asyncio
 import os
 import uuid
-import json
 import functools
 import traceback
 import sys
 import logging
-from multiprocessing import current_process, Process, Queue, queues
+import contextlib
+import json
+import shutil
+import tempfile
+import time
+from http import HTTPStatus
+from pathlib import Path
+from urllib.parse import parse_qs
+from multiprocessing import current_process, Process, Queue, Value, queues
 
-from common import MessageType, format_message, timestamp
-import startup
+from common import MessageType, FileEncoding, format_message, loads, timestamp
+from mottoagents.system.cost_ledger import process_ledger
+from mottoagents.system.diagnostics import MAX_PROFILE_SECONDS, get_loop_monitor, profile_loop, sample_stacks, watch_loop
+from mottoagents.system.metrics import REGISTRY, collect, read_snapshot, write_atomic, write_snapshot
+from mottoagents.system.tracing import flush_spans
 user_dict = {}
 
 KEY_TO_USE_DEFAULT = os.getenv("KEY_TO_USE_DEFAULT")
 DEFAULT_LLM_API_KEY = os.getenv("DEFAULT_LLM_API_KEY") if KEY_TO_USE_DEFAULT is not None else None
 DEFAULT_SERP_API_KEY = os.getenv("DEFAULT_SERP_API_KEY") if KEY_TO_USE_DEFAULT is not None else None
+# permessage-deflate for every frame, set WS_COMPRESSION=none to disable
+WS_COMPRESSION = os.getenv("WS_COMPRESSION", "deflate")
+# admission control: running task processes, tasks waiting for one, seconds a task may wait,
+# and the LLM spend in dollars after which new tasks are rejected (0 means unlimited)
+MAX_ACTIVE_TASKS = int(os.getenv("MAX_ACTIVE_TASKS", "4"))
+MAX_QUEUED_TASKS = int(os.getenv("MAX_QUEUED_TASKS", "16"))
+TASK_QUEUE_TIMEOUT = float(os.getenv("TASK_QUEUE_TIMEOUT", "300"))
+SERVICE_MAX_BUDGET = float(os.getenv("SERVICE_MAX_BUDGET", "0"))
+# serve /debug/loop and /debug/profile, and monitor the gateway's event loop
+DEBUG_ENDPOINTS = os.getenv("DEBUG_ENDPOINTS", "false").lower() in ("1", "true", "yes")
+# worker processes write their metrics here, the gateway serves them merged with its own; with
+# DEBUG_ENDPOINTS they also write their loop reports here and answer the profile requests left here
+WORKER_DIR = Path(os.getenv("WORKER_DIR") or tempfile.gettempdir()) / f"mottoagents-workers-{os.getpid()}"
 
 logging.basicConfig(level=logging.WARNING, format='%(asctime)s | %(levelname)-8s | %(module)s:%(funcName)s:%(lineno)d - %(message)s')
 logger = logging.getLogger(__name__)
 
+CONNECTIONS = REGISTRY.gauge("mottoagents_websocket_connections", "Open websocket connections")
+TASKS_ACTIVE = REGISTRY.gauge("mottoagents_tasks_active", "Tasks running in a worker process")
+TASKS_QUEUED = REGISTRY.gauge("mottoagents_tasks_queued", "Tasks waiting for a free worker")
+TASKS_TOTAL = REGISTRY.counter("mottoagents_tasks_total", "Tasks by outcome", ["status"])
+LLM_COST = REGISTRY.counter("mottoagents_llm_cost_dollars_total", "LLM spend of finished tasks in dollars")
+TASK_DURATION = REGISTRY.histogram("mottoagents_task_duration_seconds", "Duration of tasks in a worker process", ["status"],
+                                   buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600))
+SEND_QUEUE_DEPTH = REGISTRY.gauge("mottoagents_websocket_queue_depth", "Messages waiting to be sent to the websocket clients")
+
+
+class AdmissionError(Exception):
+    """Raised when a task can't be admitted, the message is sent back to the client"""
+
+
+class AdmissionController:
+    """Bound the number of running tasks, queue a limited number of new ones and stop
+    admitting work once the service's LLM budget is spent"""
+
+    def __init__(self, max_active: int = MAX_ACTIVE_TASKS, max_queued: int = MAX_QUEUED_TASKS,
+                 queue_timeout: float = TASK_QUEUE_TIMEOUT, max_budget: float = SERVICE_MAX_BUDGET):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.max_budget = max_budget
+        self.active = 0
+        self.queued = 0
+        self.total_cost = 0.0
+        self._slots = asyncio.Semaphore(max_active)
+
+    @property
+    def budget_exhausted(self) -> bool:
+        return self.max_budget > 0 and self.total_cost >= self.max_budget
+
+    @property
+    def saturated(self) -> bool:
+        return self.active >= self.max_active and self.queued >= self.max_queued
+
+    def add_cost(self, cost: float):
+        self.total_cost += cost
+        LLM_COST.inc(cost)
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """Wait for a free worker, raise AdmissionError if the task is rejected"""
+        if self.budget_exhausted:
+            raise AdmissionError(f"Service budget exhausted: ${self.max_budget:.2f}")
+        if self.saturated:
+            raise AdmissionError("Service busy, try again later")
+
+        self.queued += 1
+        TASKS_QUEUED.set(self.queued)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise AdmissionError("Timed out waiting for a free worker")
+        finally:
+            self.queued -= 1
+            TASKS_QUEUED.set(self.queued)
+
+        self.active += 1
+        TASKS_ACTIVE.set(self.active)
+        try:
+            yield
+        finally:
+            self.active -= 1
+            TASKS_ACTIVE.set(self.active)
+            self._slots.release()
+
+async def report_usage(cost_value=None, metrics_file=None):
+    # publish the running cost and the metrics of this process to the gateway
+    while True:
+        cost_value.value = process_ledger().total_cost
+        write_snapshot(metrics_file)
+        await asyncio.sleep(1)
+
+async def profile(seconds: float, output: str = "collapsed") -> bytes:
+    """Profile this process: collapsed stacks of every thread, or cProfile of the event loop as text or pstats"""
+    if output == "collapsed":
+        body = await asyncio.to_thread(sample_stacks, seconds)
+    else:
+        body = await profile_loop(seconds, output=output)
+    return body if isinstance(body, bytes) else body.encode()
+
+def debug_files(task_id: str) -> tuple[Path, Path, Path, Path]:
+    """The loop report, profile request, profile and profile error files of the worker of `task_id`"""
+    return tuple(WORKER_DIR / f"{task_id}{suffix}" for suffix in (".loop", ".profile-request", ".profile", ".profile-error"))
+
+async def serve_debug(task_id: str):
+    """Monitor the worker's loop and answer the gateway's debug requests through files in WORKER_DIR"""
+    loop_file, request_file, profile_file, error_file = debug_files(task_id)
+    async with watch_loop(True) as monitor:
+        while True:
+            write_atomic(loop_file, json.dumps(monitor.report()).encode())
+            request = read_snapshot(request_file)
+            if request:
+                request_file.unlink(missing_ok=True)
+                try:
+                    write_atomic(profile_file, await profile(request["seconds"], request["format"]))
+                except RuntimeError as e:
+                    write_atomic(error_file, str(e).encode())
+            await asyncio.sleep(1)
+
+async def profile_worker(task_id: str, seconds: float, output: str) -> bytes:
+    """Ask the worker running `task_id` for a profile, see serve_debug"""
+    _, request_file, profile_file, error_file = debug_files(task_id)
+    write_atomic(request_file, json.dumps({"seconds": seconds, "format": output}).encode())
+    # the worker looks for requests every second
+    deadline = time.monotonic() + min(seconds, MAX_PROFILE_SECONDS) + 5
+    while time.monotonic() < deadline:
+        if error_file.exists():
+            message = error_file.read_text(encoding="utf-8")
+            error_file.unlink(missing_ok=True)
+            raise RuntimeError(message)
+        if profile_file.exists():
+            body = profile_file.read_bytes()
+            profile_file.unlink(missing_ok=True)
+            return body
+        await asyncio.sleep(0.2)
+    request_file.unlink(missing_ok=True)
+    raise TimeoutError(f"The worker of task {task_id} didn't answer")
+
 async def handle_message(task_id=None, message=None, alg_msg_queue=None, proxy=None, llm_api_key=None, serpapi_key=None): 
     if "llm_api_key" in message["data"] and len(message["data"]["llm_api_key"].strip()) >= 32:
         llm_api_key = message["data"]["llm_api_key"].strip()
@@ -41,6 +186,7 @@ async def handle_message(task_id=None, message=None, alg_msg_queue=None, proxy=N
         serpapi_key = DEFAULT_SERP_API_KEY
 
     idea = message["data"]["idea"].strip() 
+    file_encoding = message["data"].get("file_encoding", FileEncoding.Json.value)
 
     if not llm_api_key:
         alg_msg_queue.put_nowait(format_message(action=MessageType.RunTask.value, msg="Invalid OpenAI key"))
@@ -51,8 +197,12 @@ async def handle_message(task_id=None, message=None, alg_msg_queue=None, proxy=N
     if not idea or len(idea) < 2:
         alg_msg_queue.put_nowait(format_message(action=MessageType.RunTask.value, msg="Invalid task idea"))
         return
+    if file_encoding not in [e.value for e in FileEncoding]:
+        alg_msg_queue.put_nowait(format_message(action=MessageType.RunTask.value, msg="Invalid file encoding"))
+        return
     try:
-        await startup.startup(idea=idea, task_id=task_id, llm_api_key=llm_api_key, serpapi_key=serpapi_key, proxy=proxy, alg_msg_queue=alg_msg_queue)
+        import startup
+        await startup.startup(idea=idea, task_id=task_id, llm_api_key=llm_api_key, serpapi_key=serpapi_key, proxy=proxy, alg_msg_queue=alg_msg_queue, file_encoding=file_encoding)
         alg_msg_queue.put_nowait(format_message(action=MessageType.RunTask.value, data={'task_id':task_id}, msg="finished"))
     except Exception as e:
         alg_msg_queue.put_nowait(format_message(action=MessageType.RunTask.value, msg=f"{e}"))
@@ -61,9 +211,74 @@ async def handle_message(task_id=None, message=None, alg_msg_queue=None, proxy=N
         error_message = traceback.format_exception(exc_type, exc_value, exc_traceback)
         logger.error("".join(error_message))
 
-def handle_message_wrapper(task_id=None, message=None, alg_msg_queue=None, proxy=None, llm_api_key=None, serpapi_key=None):
+async def handle_message_with_cost(task_id=None, message=None, alg_msg_queue=None, proxy=None, llm_api_key=None, serpapi_key=None, cost_value=None, metrics_file=None):
+    reporter = asyncio.create_task(report_usage(cost_value, metrics_file))
+    debug = asyncio.create_task(serve_debug(task_id)) if DEBUG_ENDPOINTS else None
+    try:
+        await handle_message(task_id, message, alg_msg_queue, proxy, llm_api_key, serpapi_key)
+    finally:
+        reporter.cancel()
+        if debug is not None:
+            debug.cancel()
+        cost_value.value = process_ledger().total_cost
+        write_snapshot(metrics_file)
+
+def handle_message_wrapper(task_id=None, message=None, alg_msg_queue=None, proxy=None, llm_api_key=None, serpapi_key=None, cost_value=None, metrics_file=None):
     logger.warning("New task:"+current_process().name)
-    asyncio.run(handle_message(task_id, message, alg_msg_queue, proxy, llm_api_key, serpapi_key))
+    # a forked worker starts with a copy of the gateway's metrics
+    REGISTRY.reset()
+    try:
+        asyncio.run(handle_message_with_cost(task_id, message, alg_msg_queue, proxy, llm_api_key, serpapi_key, cost_value, metrics_file))
+    finally:
+        # the process exits without running atexit handlers
+        flush_spans()
+
+async def run_task(task_id=None, message=None, alg_msg_queue=None, proxy=None, llm_api_key=None, serpapi_key=None, admission=None):
+    """Run a task in a worker process once admitted, cancelling terminates the process"""
+    status = "failed"
+    try:
+        async with admission.slot():
+            cost_value = Value('d', 0.0)
+            metrics_file = WORKER_DIR / f"{task_id}.json"
+            started = time.perf_counter()
+            process = Process(target=handle_message_wrapper, args=(task_id, message, alg_msg_queue, proxy, llm_api_key, serpapi_key, cost_value, metrics_file))
+            process.daemon = True
+            process.name = task_id
+            process.start()
+            try:
+                while process.is_alive():
+                    await asyncio.sleep(0.5)
+                if process.exitcode == 0:
+                    status = "finished"
+            except asyncio.CancelledError:
+                status = "interrupted"
+                raise
+            finally:
+                if process.is_alive():
+                    logger.warning("Interrupt task:" + process.name)
+                    process.terminate()
+                admission.add_cost(cost_value.value)
+                # the totals of the worker outlive it, its gauges don't
+                REGISTRY.merge(read_snapshot(metrics_file), gauges=False)
+                for path in (metrics_file, *debug_files(task_id)):
+                    path.unlink(missing_ok=True)
+                TASK_DURATION.observe(time.perf_counter() - started, status=status)
+    except AdmissionError as e:
+        status = "rejected"
+        logger.warning(f"Reject task {task_id}: {e}")
+        alg_msg_queue.put_nowait(format_message(action=MessageType.RunTask.value, data={'task_id': task_id}, msg=f"{e}"))
+    except asyncio.CancelledError:
+        status = "interrupted"
+        raise
+    finally:
+        TASKS_TOTAL.inc(status=status)
+
+def file_frame_encoding(websocket, encoding: str) -> str:
+    """Encoding of the file frames sent on `websocket`, raw bytes when permessage-deflate compresses them anyway"""
+    deflate = any(isinstance(extension, PerMessageDeflate) for extension in websocket.extensions)
+    if deflate and encoding in (FileEncoding.Deflate.value, FileEncoding.Zstd.value):
+        return FileEncoding.Binary.value
+    return encoding
 
 def clear_queue(alg_msg_queue:Queue=None):
     if not Queue:
@@ -75,55 +290,64 @@ def clear_queue(alg_msg_queue:Queue=None):
         pass
 
 # read websocket messages
-async def read_msg_worker(websocket=None, alg_msg_queue=None, proxy=None, llm_api_key=None, serpapi_key=None):
-    process = None
-    async for raw_message in websocket:
-        message = json.loads(raw_message)
-        if message["action"] == MessageType.Interrupt.value:
-            # force interrupt a specific task
-            task_id = message["data"]["task_id"]
-            if process and process.is_alive() and process.name == task_id:
-                logger.warning("Interrupt task:" + process.name)
-                process.terminate()
-                process = None
-            clear_queue(alg_msg_queue=alg_msg_queue)
-            alg_msg_queue.put_nowait(format_message(action=MessageType.Interrupt.value, data={'task_id': task_id}))
-            alg_msg_queue.put_nowait(format_message(action=MessageType.RunTask.value, data={'task_id': task_id}, msg="finished"))
-                
-        elif message["action"] == MessageType.RunTask.value:
-            # auto interrupt previous task
-            if process and process.is_alive():
-                logger.warning("Interrupt task:" + process.name)
-                process.terminate()
-                process = None
+async def read_msg_worker(websocket=None, alg_msg_queue=None, proxy=None, llm_api_key=None, serpapi_key=None, admission=None):
+    runner, runner_task_id = None, None
+    try:
+        async for raw_message in websocket:
+            message = loads(raw_message)
+            if message["action"] == MessageType.Interrupt.value:
+                # force interrupt a specific task
+                task_id = message["data"]["task_id"]
+                if runner and not runner.done() and runner_task_id == task_id:
+                    runner.cancel()
+                    runner = None
                 clear_queue(alg_msg_queue=alg_msg_queue)
+                alg_msg_queue.put_nowait(format_message(action=MessageType.Interrupt.value, data={'task_id': task_id}))
+                alg_msg_queue.put_nowait(format_message(action=MessageType.RunTask.value, data={'task_id': task_id}, msg="finished"))
+
+            elif message["action"] == MessageType.RunTask.value:
+                # auto interrupt previous task
+                if runner and not runner.done():
+                    runner.cancel()
+                    runner = None
+                    clear_queue(alg_msg_queue=alg_msg_queue)
+
+                runner_task_id = str(uuid.uuid4())
+                if "file_encoding" in message["data"]:
+                    message["data"]["file_encoding"] = file_frame_encoding(websocket, message["data"]["file_encoding"])
+                runner = asyncio.create_task(run_task(runner_task_id, message, alg_msg_queue, proxy, llm_api_key, serpapi_key, admission))
+    finally:
+        # auto terminate process
+        if runner and not runner.done():
+            runner.cancel()
+            clear_queue(alg_msg_queue=alg_msg_queue)
 
-            task_id = str(uuid.uuid4())
-            process = Process(target=handle_message_wrapper, args=(task_id, message, alg_msg_queue, proxy, llm_api_key, serpapi_key))
-            process.daemon = True
-            process.name = task_id
-            process.start()
-        
-    # auto terminate process
-    if process and process.is_alive():
-        logger.warning("Interrupt task:" + process.name)
-        process.terminate()
-        process = None
-        clear_queue(alg_msg_queue=alg_msg_queue)
-    
     raise websockets.exceptions.ConnectionClosed(0, "websocket closed")
 
 # send
 async def send_msg_worker(websocket=None, alg_msg_queue=None):
-    while True:
-        if alg_msg_queue.empty():
-            await asyncio.sleep(0.5)
-        else:
-            msg = alg_msg_queue.get_nowait()
-            print("=====Sending msg=====\n", msg)
-            await websocket.send(msg)
-
-async def echo(websocket, proxy=None, llm_api_key=None, serpapi_key=None):
+    depth = 0
+    try:
+        while True:
+            with contextlib.suppress(NotImplementedError):
+                # qsize is not available on macOS
+                current = alg_msg_queue.qsize()
+                SEND_QUEUE_DEPTH.inc(current - depth)
+                depth = current
+            if alg_msg_queue.empty():
+                await asyncio.sleep(0.5)
+            else:
+                msg = alg_msg_queue.get_nowait()
+                # formatted only when debug logging is on, long messages are cut
+                if isinstance(msg, bytes):
+                    logger.debug("Sending binary frame (%d bytes)", len(msg))
+                else:
+                    logger.debug("Sending msg: %.2000s", msg)
+                await websocket.send(msg)
+    finally:
+        SEND_QUEUE_DEPTH.dec(depth)
+
+async def echo(websocket, proxy=None, llm_api_key=None, serpapi_key=None, admission=None):
     # audo register
     uid = datetime.strftime(datetime.now(), '%Y%m%d%H%M%S.%f')+'_'+str(uuid.uuid4())
     logger.warning(f"New user registered, uid: {uid}")
@@ -133,15 +357,17 @@ async def echo(websocket, proxy=None, llm_api_key=None, serpapi_key=None):
         logger.warning(f"Duplicate user, uid: {uid}")
         
     # message handling
+    CONNECTIONS.inc()
     try:
         alg_msg_queue = Queue()
         await asyncio.gather(
-            read_msg_worker(websocket=websocket, alg_msg_queue=alg_msg_queue, proxy=proxy, llm_api_key=llm_api_key, serpapi_key=serpapi_key), 
+            read_msg_worker(websocket=websocket, alg_msg_queue=alg_msg_queue, proxy=proxy, llm_api_key=llm_api_key, serpapi_key=serpapi_key, admission=admission), 
             send_msg_worker(websocket=websocket, alg_msg_queue=alg_msg_queue)
         )
     except websockets.exceptions.ConnectionClosed:
         logger.warning("Websocket closed: remote endpoint going away")
     finally:
+        CONNECTIONS.dec()
         asyncio.current_task().cancel()
         # auto unregister
         logger.warning(f"Auto unregister, uid: {uid}")
@@ -150,8 +376,65 @@ async def echo(websocket, proxy=None, llm_api_key=None, serpapi_key=None):
             user_dict.pop(uid)
 
 
-async def run_service(host: str = "localhost", port: int=9000, proxy: str=None, llm_api_key:str=None, serpapi_key:str=None):
-    message_handler = functools.partial(echo, proxy=proxy,llm_api_key=llm_api_key, serpapi_key=serpapi_key)
-    async with websockets.serve(message_handler, host, port):
-        logger.warning(f"Websocket server started: {host}:{port} {f'[proxy={proxy}]' if proxy else ''}")
-        await asyncio.Future()
+def http_handler(admission: AdmissionController):
+    """Serve plain HTTP requests on the websocket port, anything else is upgraded to a websocket"""
+    async def process_request(path, request_headers):
+        path, _, query = path.partition("?")
+        if path == "/healthz":
+            if admission.budget_exhausted:
+                return HTTPStatus.SERVICE_UNAVAILABLE, [("Content-Type", "text/plain")], b"budget exhausted\n"
+            if admission.saturated:
+                return HTTPStatus.SERVICE_UNAVAILABLE, [("Content-Type", "text/plain")], b"busy\n"
+            return HTTPStatus.OK, [("Content-Type", "text/plain")], b"ok\n"
+        if path == "/metrics":
+            return HTTPStatus.OK, [("Content-Type", "text/plain; version=0.0.4")], collect(WORKER_DIR).render().encode()
+        if DEBUG_ENDPOINTS and path.startswith("/debug/"):
+            return await debug_request(path, parse_qs(query))
+        return None
+
+    return process_request
+
+
+async def debug_request(path: str, params: dict):
+    """/debug/loop: lag and stalls of the gateway's event loop, and of the workers' under `tasks`
+    /debug/profile?seconds=10&format=collapsed|text|pstats[&task_id=...]: profile the gateway, or the
+    worker of a task, collapsed stacks of every thread (flamegraph.pl, speedscope) by default, or
+    cProfile of the event loop"""
+    if path == "/debug/loop":
+        monitor = get_loop_monitor()
+        report = monitor.report() if monitor else {}
+        report["tasks"] = {loop_file.stem: read_snapshot(loop_file) for loop_file in sorted(WORKER_DIR.glob("*.loop"))}
+        return HTTPStatus.OK, [("Content-Type", "application/json")], json.dumps(report).encode()
+    if path == "/debug/profile":
+        try:
+            seconds = float(params.get("seconds", ["10"])[0])
+        except ValueError:
+            return HTTPStatus.BAD_REQUEST, [("Content-Type", "text/plain")], b"invalid seconds\n"
+        output = params.get("format", ["collapsed"])[0]
+        task_id = params.get("task_id", [None])[0]
+        if task_id is not None and task_id not in {metrics_file.stem for metrics_file in WORKER_DIR.glob("*.json")}:
+            return HTTPStatus.NOT_FOUND, [("Content-Type", "text/plain")], b"no such running task\n"
+        try:
+            body = await (profile_worker(task_id, seconds, output) if task_id else profile(seconds, output))
+        except RuntimeError as e:
+            return HTTPStatus.CONFLICT, [("Content-Type", "text/plain")], f"{e}\n".encode()
+        except TimeoutError as e:
+            return HTTPStatus.GATEWAY_TIMEOUT, [("Content-Type", "text/plain")], f"{e}\n".encode()
+        content_type = "application/octet-stream" if output == "pstats" else "text/plain"
+        return HTTPStatus.OK, [("Content-Type", content_type)], body
+    return HTTPStatus.NOT_FOUND, [("Content-Type", "text/plain")], b"not found\n"
+
+
+async def run_service(host: str = "localhost", port: int=9000, proxy: str=None, llm_api_key:str=None, serpapi_key:str=None,
+                      max_active_tasks: int=MAX_ACTIVE_TASKS, max_queued_tasks: int=MAX_QUEUED_TASKS, max_budget: float=SERVICE_MAX_BUDGET):
+    admission = AdmissionController(max_active=max_active_tasks, max_queued=max_queued_tasks, max_budget=max_budget)
+    message_handler = functools.partial(echo, proxy=proxy,llm_api_key=llm_api_key, serpapi_key=serpapi_key, admission=admission)
+    compression = None if WS_COMPRESSION.lower() == "none" else WS_COMPRESSION
+    WORKER_DIR.mkdir(parents=True, exist_ok=True)
+    try:
+        async with watch_loop(DEBUG_ENDPOINTS or None), \
+                websockets.serve(message_handler, host, port, compression=compression, process_request=http_handler(admission)):
+            logger.warning(f"Websocket server started: {host}:{port} {f'[proxy={proxy}]' if proxy else ''}")
+            await asyncio.Future()
+    finally:
+        shutil.rmtree(WORKER_DIR, ignore_errors=True)